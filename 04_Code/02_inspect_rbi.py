@@ -1,6 +1,8 @@
 import pandas as pd
 import os
 
+from rbi_io import read_rbi_workbook, EXCEL_ENGINE
+
 print("="*70)
 print("RBI DISTRICT DEPOSIT DATA INSPECTION - PHASE 3c")
 print("="*70)
@@ -32,7 +34,7 @@ if file_path is None:
     exit()
 
 # Load Excel file
-excel_file = pd.ExcelFile(file_path)
+excel_file = pd.ExcelFile(file_path, engine=EXCEL_ENGINE)
 print(f"\n[1] EXCEL FILE STRUCTURE")
 print(f"    File: {file_path}")
 print(f"    Sheet names: {excel_file.sheet_names}")
@@ -41,7 +43,8 @@ print(f"    Number of sheets: {len(excel_file.sheet_names)}")
 # Load the first sheet with header row 5
 sheet_name = excel_file.sheet_names[0]
 print(f"\n[2] LOADING SHEET: {sheet_name}")
-df = pd.read_excel(file_path, sheet_name=sheet_name, header=5)
+# Typed copy from the Parquet cache (header row 5; sub-header row kept in df.attrs)
+df = read_rbi_workbook(file_path)
 
 print(f"    Shape: {df.shape[0]} rows × {df.shape[1]} columns")
 
@@ -81,8 +84,8 @@ print(f"    Searching through all {len(df.columns)} columns...")
 # We need to look at the actual data to find deposit columns
 
 # Check what's in columns 5-15 (where deposit data should be)
-print(f"\n    Sample column 7 name: {df.columns[7]}")
-print(f"    Sample column 10 name: {df.columns[10]}")
+print(f"\n    Sample column 7 name: {df.columns[7]} ({df.attrs['subheader'].get(df.columns[7], '?')!r})")
+print(f"    Sample column 10 name: {df.columns[10]} ({df.attrs['subheader'].get(df.columns[10], '?')!r})")
 print(f"    Sample values from column 7 (first 5 rows):")
 print(f"    {df.iloc[:5, 7].tolist()}")
 
@@ -1,9 +1,14 @@
 import pandas as pd
 import geopandas as gpd
-from rapidfuzz import fuzz, process
 import os
 from datetime import datetime
 
+from district_matching import DistrictMatcher, build_alias_table, ALIASES_PATH
+from rbi_io import read_rbi_workbooks, RBI_PATHS
+from crosswalk_store import (
+    load_store, save_store, load_overrides, update_store, resolve, STORE_PATH, OVERRIDES_PATH
+)
+
 # Start log
 start_time = datetime.now()
 print("="*70)
@@ -14,7 +19,9 @@ print(f"Start time: {start_time.strftime('%Y-%m-%d %H:%M:%S')}")
 # A. Load GADM district boundaries
 print("\n[1/5] LOADING GADM DISTRICT BOUNDARIES...")
 gadm_path = '01_Data_Raw/District_Boundaries/gadm41_IND_2.shp'
-gadm = gpd.read_file(gadm_path)
+# Only the attribute table is used; read it from the .dbf when the geometry file is not on this machine
+gadm = gpd.read_file(gadm_path if os.path.exists(gadm_path) else gadm_path.replace('.shp', '.dbf'),
+                     ignore_geometry=True)
 print(f"   GADM districts loaded: {len(gadm)}")
 print(f"   Columns: {list(gadm.columns)}")
 
@@ -24,26 +31,26 @@ gadm_districts.columns = ['district_gadm', 'state_gadm']
 gadm_districts = gadm_districts.sort_values(['state_gadm', 'district_gadm']).reset_index(drop=True)
 print(f"   Unique GADM district-state pairs: {len(gadm_districts)}")
 
-# B. Load RBI district names from 2023-2024 file
+# B. Load RBI district-state pairs from every workbook vintage
 print("\n[2/5] LOADING RBI DISTRICT NAMES...")
-rbi_path = '01_Data_Raw/RBI_Bank_Data/RBI_Deposits_2023_2024.xlsx'
-rbi = pd.read_excel(rbi_path, sheet_name=0, skiprows=5)
-print(f"   RBI file loaded: {rbi.shape}")
-print(f"   Columns found: {list(rbi.columns[:5])}")  # Show first 5 columns
-
-# Extract unique districts from the 'DISTRICT' column (column 3)
-if 'DISTRICT' in rbi.columns:
-    rbi_districts_raw = rbi['DISTRICT'].dropna().astype(str).unique()
-    print(f"   Raw unique district values: {len(rbi_districts_raw)}")
-    
-    # Clean district names: uppercase and strip whitespace
-    rbi_unique = sorted([d.strip().upper() for d in rbi_districts_raw if len(d.strip()) > 0])
-    print(f"   Unique RBI districts parsed: {len(rbi_unique)}")
-    print(f"   Sample RBI districts (first 10): {rbi_unique[:10]}")
-else:
-    print("   ERROR: 'DISTRICT' column not found!")
-    print(f"   Available columns: {list(rbi.columns)}")
-    rbi_unique = []
+rbi_paths = RBI_PATHS
+rbi_pairs = []
+# Workbooks are read through the hash-keyed Parquet cache (parsed once, in parallel)
+for rbi_path, rbi in read_rbi_workbooks(rbi_paths).items():
+    # STATE is column 2 and DISTRICT column 3 in all three layouts
+    pairs = rbi.iloc[:, [2, 3]].dropna().astype(str)
+    pairs.columns = ['state_rbi', 'district_rbi']
+    pairs = pairs.apply(lambda col: col.str.strip().str.upper())
+    pairs['vintage'] = os.path.basename(rbi_path)
+    rbi_pairs.append(pairs[pairs['district_rbi'].str.len() > 0])
+    print(f"   {os.path.basename(rbi_path)}: {rbi.shape}, {len(pairs.drop_duplicates())} district-state pairs")
+
+rbi_unique = (pd.concat(rbi_pairs, ignore_index=True)
+              .drop_duplicates(['state_rbi', 'district_rbi'])
+              .sort_values(['state_rbi', 'district_rbi'])
+              .reset_index(drop=True))
+print(f"   Unique RBI district-state pairs (all vintages): {len(rbi_unique)}")
+print(f"   Sample RBI districts (first 10): {rbi_unique['district_rbi'].head(10).tolist()}")
 
 # C. Load EM-DAT parsed districts
 print("\n[3/5] LOADING EM-DAT PARSED DISTRICTS...")
@@ -66,42 +73,38 @@ print(f"   Unique EM-DAT districts: {len(emdat_unique)}")
 
 print("\n[4/5] FUZZY MATCHING RBI → GADM...")
 
-# Define fuzzy matching function
-def fuzzy_match_best(query, choices, threshold=80):
-    """
-    Returns best match from choices using rapidfuzz
-    Returns (best_match, score, match_found_flag)
-    """
-    if not choices or not query:
-        return (None, 0, False)
-    
-    result = process.extractOne(
-        query.upper(),
-        [c.upper() for c in choices],
-        scorer=fuzz.ratio
+# Batch matcher: key index (GADM names + VARNAME_2 + curated aliases) first,
+# then fuzzy scoring of the residual with candidates blocked by state
+aliases = build_alias_table(gadm, ALIASES_PATH)
+matcher = DistrictMatcher(gadm_districts, aliases=aliases)
+print(f"   Alias keys: {len(aliases)} ({ALIASES_PATH} + GADM VARNAME_2)")
+valid_gadm = set(zip(gadm_districts['district_gadm'], gadm_districts['state_gadm']))
+
+# Persistent store: only names never seen before are scored; overrides always win
+store = load_store()
+overrides = load_overrides()
+print(f"   Crosswalk store: {len(store)} known names | overrides: {len(overrides)}")
+
+for vintage, vintage_pairs in rbi_unique.groupby('vintage', sort=False):
+    store, n_new = update_store(
+        store,
+        vintage_pairs.rename(columns={'state_rbi': 'state_source', 'district_rbi': 'name_source'}),
+        matcher, source='rbi', vintage=vintage, valid_gadm=valid_gadm, threshold=90
     )
-    
-    if result and result[1] >= threshold:
-        # Find original case version
-        original_match = choices[result[2]]
-        return (original_match, result[1], True)
-    else:
-        return (None, result[1] if result else 0, False)
-
-# Match RBI → GADM
-gadm_choices = gadm_districts['district_gadm'].tolist()
-rbi_gadm_matches = []
-
-for rbi_dist in rbi_unique:
-    best_match, score, matched = fuzzy_match_best(rbi_dist, gadm_choices, threshold=80)
-    rbi_gadm_matches.append({
-        'district_rbi': rbi_dist,
-        'district_gadm': best_match,
-        'match_score_rbi_gadm': score,
-        'matched_rbi_gadm': matched
-    })
-
-df_crosswalk = pd.DataFrame(rbi_gadm_matches)
+    print(f"   {vintage}: {n_new} new RBI names matched")
+
+rbi_resolved = resolve(store, overrides, 'rbi')
+df_crosswalk = pd.DataFrame({
+    'district_rbi': rbi_resolved['name_source'],
+    'state_rbi': rbi_resolved['state_source'],
+    'district_gadm': rbi_resolved['district_gadm'],
+    'state_gadm': rbi_resolved['state_gadm'],
+    'match_score_rbi_gadm': rbi_resolved['score'],
+    'matched_rbi_gadm': rbi_resolved['matched'],
+    'match_scope': rbi_resolved['match_scope'],
+    'match_method': rbi_resolved['match_method']
+}).sort_values(['state_rbi', 'district_rbi']).reset_index(drop=True)
+print(f"   Match method: {df_crosswalk['match_method'].value_counts().to_dict()}")
 
 # Calculate match rate
 match_rate_rbi_gadm = (df_crosswalk['matched_rbi_gadm'].sum() / len(df_crosswalk)) * 100
@@ -115,27 +118,27 @@ if match_rate_rbi_gadm < 80:
     print("Review unmatched districts before proceeding.")
     print("!"*70)
 
-    # Join state names from GADM
-df_crosswalk = df_crosswalk.merge(
-    gadm_districts[['district_gadm', 'state_gadm']],
-    on='district_gadm',
-    how='left'
-)
-
 print("\n[5/5] MATCHING EM-DAT DISTRICTS (informational)...")
 
-# Match EM-DAT → GADM
-emdat_gadm_matches = []
-for emdat_dist in emdat_unique:
-    best_match, score, matched = fuzzy_match_best(emdat_dist, gadm_choices, threshold=75)  # Lower threshold
-    emdat_gadm_matches.append({
-        'district_emdat': emdat_dist,
-        'district_gadm_match': best_match,
-        'match_score_emdat_gadm': score,
-        'matched_emdat_gadm': matched
-    })
-
-df_emdat_matches = pd.DataFrame(emdat_gadm_matches)
+# Match EM-DAT → GADM (parsed tokens carry no state, so all-India; lower threshold)
+store, n_new = update_store(
+    store,
+    pd.DataFrame({'state_source': None, 'name_source': emdat_unique}),
+    matcher, source='emdat', vintage=os.path.basename(emdat_path), valid_gadm=valid_gadm, threshold=75
+)
+print(f"   {n_new} new EM-DAT names matched")
+save_store(store)
+print(f"   ✓ Crosswalk store saved: {STORE_PATH} ({len(store)} names)")
+
+emdat_resolved = resolve(store, overrides, 'emdat')
+df_emdat_matches = pd.DataFrame({
+    'district_emdat': emdat_resolved['name_source'],
+    'district_gadm_match': emdat_resolved['district_gadm'],
+    'state_gadm_match': emdat_resolved['state_gadm'],
+    'match_score_emdat_gadm': emdat_resolved['score'],
+    'matched_emdat_gadm': emdat_resolved['matched'],
+    'match_method': emdat_resolved['match_method']
+}).sort_values('district_emdat').reset_index(drop=True)
 match_rate_emdat = (df_emdat_matches['matched_emdat_gadm'].sum() / len(df_emdat_matches)) * 100
 print(f"   EM-DAT → GADM match rate: {match_rate_emdat:.1f}% ({df_emdat_matches['matched_emdat_gadm'].sum()}/{len(df_emdat_matches)})")
 
@@ -162,10 +165,14 @@ log_lines = [
     "",
     "INPUTS:",
     f"  - GADM: {gadm_path} ({len(gadm_districts)} unique districts)",
-    f"  - RBI: {rbi_path} ({len(rbi_unique)} unique districts)",
+    f"  - RBI: {len(rbi_paths)} workbooks ({len(rbi_unique)} unique district-state pairs)",
     f"  - EM-DAT: {emdat_path} ({len(emdat_unique)} unique districts)",
     "",
+    f"  - Overrides: {OVERRIDES_PATH} ({len(overrides)} entries)",
+    f"  - Aliases: {ALIASES_PATH} + GADM VARNAME_2 ({len(aliases)} entries)",
+    "",
     "OUTPUTS:",
+    f"  - Crosswalk store: {STORE_PATH} ({len(store)} names)",
     f"  - Crosswalk: {output_path} ({len(df_crosswalk)} rows)",
     f"  - EM-DAT matches: {emdat_output_path} ({len(df_emdat_matches)} rows)",
     "",
@@ -173,6 +180,9 @@ log_lines = [
     f"  - RBI → GADM: {match_rate_rbi_gadm:.1f}% (threshold: 80%)",
     f"  - EM-DAT → GADM: {match_rate_emdat:.1f}% (informational, threshold: 75%)",
     "",
+    "MATCH METHODS (RBI):",
+    *[f"  - {method}: {count}" for method, count in rbi_resolved['match_method'].value_counts().items()],
+    "",
     "STOP CONDITION:",
     f"  - {'PASSED' if match_rate_rbi_gadm >= 80 else 'FAILED'} - RBI match rate {'≥' if match_rate_rbi_gadm >= 80 else '<'} 80%",
     "",
@@ -182,7 +192,7 @@ log_lines = [
 # Add unmatched districts to log
 unmatched = df_crosswalk[~df_crosswalk['matched_rbi_gadm']].sort_values('match_score_rbi_gadm')
 for idx, row in unmatched.iterrows():
-    log_lines.append(f"  - {row['district_rbi']} (score: {row['match_score_rbi_gadm']})")
+    log_lines.append(f"  - {row['district_rbi']}, {row['state_rbi']} (score: {row['match_score_rbi_gadm']:.1f})")
 
 log_lines.append("")
 log_lines.append("="*70)
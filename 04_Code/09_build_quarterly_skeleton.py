@@ -1,11 +1,19 @@
 import pandas as pd
 import geopandas as gpd
 
+from panel_keys import build_registry, save_registry, quarter_id, REGISTRY_PATH
+from data_store import write_dataset
+
 # Load GADM
 gadm = gpd.read_file('01_Data_Raw/District_Boundaries/gadm41_IND_2.shp')
 gadm_districts = gadm[['NAME_2', 'NAME_1']].drop_duplicates()
 gadm_districts.columns = ['district_gadm', 'state_gadm']
 
+# District registry: int32 district_id shared by every stage
+registry = build_registry(gadm_districts)
+save_registry(registry)
+print(f"Registry: {len(registry)} districts → {REGISTRY_PATH}")
+
 # Create 40 quarters
 quarters = pd.DataFrame({
     'year': [y for y in range(2015, 2025) for q in range(1, 5)],
@@ -14,10 +22,12 @@ quarters = pd.DataFrame({
 quarters = quarters[(quarters['year'] < 2024) | (quarters['q'] <= 4)]  # exactly 40
 quarters['quarter'] = quarters['year'].astype(str) + 'Q' + quarters['q'].astype(str)
 quarters['quarter_num'] = range(1, len(quarters)+1)
+quarters['quarter_id'] = quarter_id(quarters['year'], quarters['q'])
 
 # Cross product
-skeleton = gadm_districts.merge(quarters, how='cross')
+skeleton = registry.merge(quarters, how='cross')
+skeleton = skeleton[['district_id', 'district_gadm', 'state_gadm', 'year', 'q', 'quarter', 'quarter_num', 'quarter_id']]
 print(f"Skeleton: {len(skeleton)} district-quarters")
 
 # Output
-skeleton.to_csv('02_Data_Intermediate/district_quarter_skeleton.csv', index=False)
\ No newline at end of file
+write_dataset(skeleton, 'district_quarter_skeleton')
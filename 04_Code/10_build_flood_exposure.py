@@ -2,11 +2,13 @@ import pandas as pd
 import numpy as np
 import geopandas as gpd
 
+from data_store import read_dataset, write_dataset
+
 # Load
 emdat = pd.read_csv('02_Data_Intermediate/emdat_districts_parsed.csv')
 gadm_crosswalk = pd.read_csv('02_Data_Intermediate/district_crosswalk_draft.csv')
 emdat_matches = pd.read_csv('02_Data_Intermediate/emdat_district_matches.csv')
-skeleton = pd.read_csv('02_Data_Intermediate/district_quarter_skeleton.csv')
+skeleton = read_dataset('district_quarter_skeleton')
 
 # Date to quarter
 def date_to_quarter(year, month):
@@ -63,9 +65,12 @@ for idx, event in emdat.iterrows():
         if not match_row.empty and match_row.iloc[0]['matched_emdat_gadm']:
             # District-level match (Rule B eligible)
             gadm_dist = match_row.iloc[0]['district_gadm_match']
-            skeleton.loc[(skeleton['quarter'] == qtr) & 
-                        (skeleton['district_gadm'] == gadm_dist), 
-                        ['flood_exposure_ruleA_qt', 'flood_exposure_ruleB_qt']] = 1
+            gadm_state = match_row.iloc[0].get('state_gadm_match')
+            target = (skeleton['quarter'] == qtr) & (skeleton['district_gadm'] == gadm_dist)
+            if pd.notna(gadm_state):
+                # Same district name can exist in several states
+                target &= skeleton['state_gadm'] == gadm_state
+            skeleton.loc[target, ['flood_exposure_ruleA_qt', 'flood_exposure_ruleB_qt']] = 1
         else:
             # Check if token is a state name (Rule A only)
             normalized_token = normalize_state_token(token)
@@ -80,4 +85,4 @@ for idx, event in emdat.iterrows():
                 print(f"WARNING: Unmatched token '{token}' in event {event['DisNo.']}")
 
 # Output
-skeleton.to_csv('02_Data_Intermediate/flood_exposure_panel.csv', index=False)
\ No newline at end of file
+write_dataset(skeleton, 'flood_exposure_panel')
\ No newline at end of file
@@ -1,7 +1,9 @@
 import pandas as pd
 
+from data_store import read_dataset
+
 # Load data
-df = pd.read_csv('02_Data_Intermediate/flood_exposure_panel.csv')
+df = read_dataset('flood_exposure_panel')
 emdat = pd.read_csv('02_Data_Intermediate/emdat_districts_parsed.csv')
 
 print("="*70)
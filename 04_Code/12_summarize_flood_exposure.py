@@ -1,7 +1,8 @@
-import pandas as pd
 import numpy as np
 
-df = pd.read_csv('02_Data_Intermediate/flood_exposure_panel.csv')
+from data_store import read_dataset
+
+df = read_dataset('flood_exposure_panel')
 
 log_lines = []
 log_lines.append("="*70)
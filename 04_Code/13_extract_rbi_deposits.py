@@ -1,201 +1,234 @@
+import numpy as np
 import pandas as pd
 import os
+from scipy import sparse
+
+from district_matching import normalize_name
+from rbi_io import (
+    read_rbi_workbooks, quarter_columns, melt_workbook, rollup_population_groups,
+    RBI_PATHS, POPULATION_GROUPS
+)
+from district_lineage import load_lineage, apportion_panel, unmapped_sources, LINEAGE_PATH
+from data_store import write_dataset
 
 print("="*70)
 print("RBI DEPOSITS EXTRACTION - PHASE 3d")
 print("="*70)
 
-# Input files
-rbi_files = [
-    '01_Data_Raw/RBI_Bank_Data/RBI_Deposits_2023_2024.xlsx',
-    '01_Data_Raw/RBI_Bank_Data/RBI_Deposits_2017_2022.xlsx',
-    '01_Data_Raw/RBI_Bank_Data/RBI_Deposits_2004_2017.xlsx'
-]
+# Metrics in the RBI quarter triplets (₹ crore / counts; accounts in thousands).
+# Credit is only in the fiscal-header workbooks, accounts only in 2023-2024.
+METRICS = ('deposits', 'credit', 'offices', 'accounts')
+
+# Input files (read through the hash-keyed Parquet cache, see rbi_io.py)
+rbi_files = RBI_PATHS
 
 # Load crosswalk
 crosswalk = pd.read_csv('02_Data_Intermediate/district_crosswalk_draft.csv')
+missing = {'state_rbi', 'match_scope'} - set(crosswalk.columns)
+if missing:
+    raise ValueError(f"district_crosswalk_draft.csv predates the state-blocked crosswalk (no {sorted(missing)}); "
+                     "rerun 04_Code/08_build_district_crosswalk.py")
 print(f"\n[1] Crosswalk loaded: {len(crosswalk)} rows")
 print(f"    RBI→GADM matches: {crosswalk['matched_rbi_gadm'].sum()}")
 
-# Storage for all quarters
-all_data = []
-
-for file_idx, filepath in enumerate(rbi_files, 1):
+# Reshape every workbook in one step: all quarter columns melted at once
+long_parts = []
+workbooks = read_rbi_workbooks(rbi_files)
+for file_idx, (filepath, df) in enumerate(workbooks.items(), 1):
     print(f"\n[2.{file_idx}] Processing: {os.path.basename(filepath)}")
     
-    if not os.path.exists(filepath):
-        print(f"    ⚠ File not found, skipping")
-        continue
-    
-    # Load Excel (header at row 5, 0-indexed)
-    df = pd.read_excel(filepath, sheet_name=0, header=5)
+    # Cached workbook (header at row 5, 0-indexed; sub-header row removed)
     print(f"    Loaded: {df.shape[0]} rows × {df.shape[1]} cols")
     
-    # Identify key columns
-    state_col = df.columns[2]
-    district_col = df.columns[3]
-    
-    # Detect file format
-    has_fiscal_quarters = any(':Q' in str(col) for col in df.columns[:20])
+    cols = quarter_columns(df)
+    layout = 'Historical (fiscal quarters in column names)' if any(':Q' in c for c in df.columns) \
+        else 'Current (calendar dates as timestamps)'
+    print(f"    Format: {layout}")
+    found = cols['metric'].value_counts()
+    print(f"    Quarter columns found: " + ', '.join(f"{m} {found.get(m, 0)}" for m in METRICS))
     
-    if has_fiscal_quarters:
-        # Historical format: column names like "2022-23:Q3"
-        print(f"    Format: Historical (fiscal quarters in column names)")
-        
-        # Find all columns with fiscal quarter pattern
-        deposit_cols = [i for i, col in enumerate(df.columns) if ':Q' in str(col)]
-        print(f"    Deposit columns found: {len(deposit_cols)}")
-        
-        for dep_idx in deposit_cols:
-            col_name = str(df.columns[dep_idx])
-            
-            try:
-                # Parse "2022-23:Q3" format
-                year_part, q_part = col_name.split(':Q')
-                year_start = int(year_part.split('-')[0])
-                fiscal_q = int(q_part)
-                
-                # Convert Indian fiscal year to calendar year
-                # Fiscal year starts April 1
-                # Fiscal Q1 (Apr-Jun) = Calendar Q2
-                # Fiscal Q2 (Jul-Sep) = Calendar Q3
-                # Fiscal Q3 (Oct-Dec) = Calendar Q4
-                # Fiscal Q4 (Jan-Mar) = Calendar Q1 of NEXT calendar year
-                
-                if fiscal_q == 4:
-                    calendar_year = year_start + 1
-                    calendar_q = 1
-                else:
-                    calendar_year = year_start
-                    calendar_q = fiscal_q + 1
-                
-                quarter_str = f"{calendar_year}Q{calendar_q}"
-                
-            except Exception as e:
-                print(f"    ⚠ Skipping column '{col_name}': {e}")
-                continue
-            
-            # Extract data
-            temp = df[[state_col, district_col, df.columns[dep_idx]]].copy()
-            temp.columns = ['state_rbi', 'district_rbi', 'deposits']
-            temp['quarter'] = quarter_str
-            temp['year'] = calendar_year
-            temp['q'] = calendar_q
-            
-            # Drop missing values
-            temp = temp.dropna(subset=['district_rbi', 'deposits'])
-            
-            # Aggregate by district-quarter (sum across population groups)
-            temp_agg = temp.groupby(
-                ['state_rbi', 'district_rbi', 'quarter', 'year', 'q'], 
-                as_index=False
-            )['deposits'].sum()
-            
-            all_data.append(temp_agg)
-    
-    else:
-        # Current format: dates in separate columns
-        print(f"    Format: Current (calendar dates as timestamps)")
-        
-        # Deposit columns at every 3rd position starting from 7
-        deposit_indices = list(range(7, len(df.columns), 3))
-        print(f"    Deposit columns found: {len(deposit_indices)}")
-        
-        for dep_idx in deposit_indices:
-            if dep_idx >= len(df.columns):
-                break
-            
-            # Date is 2 columns before deposit
-            date_idx = dep_idx - 2
-            quarter_date = df.columns[date_idx]
-            
-            try:
-                dt = pd.to_datetime(quarter_date)
-                calendar_year = dt.year
-                calendar_q = (dt.month - 1) // 3 + 1
-                quarter_str = f"{calendar_year}Q{calendar_q}"
-            except:
-                continue
-            
-            # Extract data
-            temp = df[[state_col, district_col, df.columns[dep_idx]]].copy()
-            temp.columns = ['state_rbi', 'district_rbi', 'deposits']
-            temp['quarter'] = quarter_str
-            temp['year'] = calendar_year
-            temp['q'] = calendar_q
-            
-            # Drop missing values
-            temp = temp.dropna(subset=['district_rbi', 'deposits'])
-            
-            # Aggregate by district-quarter
-            temp_agg = temp.groupby(
-                ['state_rbi', 'district_rbi', 'quarter', 'year', 'q'], 
-                as_index=False
-            )['deposits'].sum()
-            
-            all_data.append(temp_agg)
-
-# Combine all quarters
+    # Every metric of the quarter triplets in the same pass
+    long_parts.append(melt_workbook(df, metrics=METRICS))
+
+# Combine all quarters: one grouped aggregation (sums population groups and
+# any district reported in more than one workbook vintage)
 print(f"\n[3] Combining all files...")
-rbi_panel = pd.concat(all_data, ignore_index=True)
+rbi_long = pd.concat(long_parts, ignore_index=True)
+rbi_panel = rbi_long.groupby(
+    ['state_rbi', 'district_rbi', 'quarter', 'year', 'q'], as_index=False, sort=False
+)[list(METRICS)].sum(min_count=1)
 print(f"    Total rows before crosswalk: {len(rbi_panel)}")
 print(f"    Unique districts: {rbi_panel['district_rbi'].nunique()}")
 print(f"    Quarters range: {rbi_panel['quarter'].min()} to {rbi_panel['quarter'].max()}")
 
-# Map RBI districts to GADM using crosswalk
-print(f"\n[4] Mapping RBI → GADM districts...")
-rbi_panel = rbi_panel.merge(
-    crosswalk[['district_rbi', 'district_gadm', 'state_gadm', 'matched_rbi_gadm']],
-    on='district_rbi',
-    how='left'
+# Map RBI districts to GADM: crosswalk + district lineage, as sparse matrix products
+print(f"\n[4] Apportioning RBI districts → GADM 4.1 districts...")
+# Join on normalised (state, district) so same-named districts in different states stay apart
+for frame in (rbi_panel, crosswalk):
+    frame['state_key'] = frame['state_rbi'].map(normalize_name)
+    frame['district_key'] = frame['district_rbi'].map(normalize_name)
+crosswalk_matched = crosswalk[crosswalk['matched_rbi_gadm'].fillna(False).astype(bool)]
+lineage = load_lineage(LINEAGE_PATH)
+print(f"    Lineage rows: {len(lineage)} ({LINEAGE_PATH}), "
+      f"{int(lineage['approximate'].sum())} approximate (multi-parent carve-out → primary parent)")
+
+# Source-unit × (metric, quarter) value matrix (NaN = not reported). Metrics are
+# stacked side by side so each apportionment matrix is applied to all of them at once.
+rbi_panel['period'] = rbi_panel['year'] * 4 + rbi_panel['q'] - 1
+source_index = rbi_panel.groupby(['state_key', 'district_key'], as_index=False).agg(
+    state_rbi=('state_rbi', 'first'), district_rbi=('district_rbi', 'first')
+)
+quarters = rbi_panel[['period', 'quarter', 'year', 'q']].drop_duplicates().sort_values('period').reset_index(drop=True)
+row = pd.MultiIndex.from_frame(source_index[['state_key', 'district_key']]).get_indexer(
+    pd.MultiIndex.from_frame(rbi_panel[['state_key', 'district_key']])
+)
+col = np.searchsorted(quarters['period'].to_numpy(), rbi_panel['period'].to_numpy())
+n_q = len(quarters)
+X = np.full((len(source_index), len(METRICS) * n_q), np.nan)
+for m, metric in enumerate(METRICS):
+    X[row, m * n_q + col] = rbi_panel[metric].to_numpy(dtype=np.float64)
+X_seen = ~np.isnan(X[:, :n_q])  # deposits block
+periods = np.tile(quarters['period'].to_numpy(), len(METRICS))
+
+gadm_index = pd.concat([
+    crosswalk_matched[['district_gadm', 'state_gadm']],
+    lineage[['district_gadm', 'state_gadm']]
+]).drop_duplicates().sort_values(['state_gadm', 'district_gadm']).reset_index(drop=True)
+
+unmapped = unmapped_sources(X[:, :n_q], quarters['period'], source_index, crosswalk_matched, lineage)
+deposits_src = np.nan_to_num(X[:, :n_q])
+print(f"    Source units: {len(source_index)} | GADM units: {len(gadm_index)} | quarters: {n_q} | metrics: {len(METRICS)}")
+print(f"    Reported source-quarters: {X_seen.sum():,} | unmapped: {unmapped.sum():,} "
+      f"({deposits_src[unmapped].sum() / deposits_src.sum() * 100:.2f}% of deposits)")
+if unmapped.any():
+    names = source_index.loc[unmapped.any(axis=1), 'district_rbi'].tolist()
+    print(f"    ⚠ Unmapped RBI districts dropped: {', '.join(names[:15])}{' ...' if len(names) > 15 else ''}")
+
+Y, reported, matrices = apportion_panel(X, periods, source_index, gadm_index, crosswalk_matched, lineage)
+print(f"    ✓ {len(matrices)} apportionment regime(s) across {n_q} quarters")
+
+# Source names contributing to each GADM district-quarter (for provenance)
+name_parts = []
+for cols, A in matrices:
+    A_coo = A.tocoo()
+    cols = cols[cols < n_q]  # deposits block
+    src, c = np.nonzero(X_seen[:, cols])
+    name_parts.append(
+        pd.DataFrame({'src': src, 'col': cols[c]}).merge(pd.DataFrame({'src': A_coo.row, 'gadm': A_coo.col}), on='src')
+    )
+names = pd.concat(name_parts, ignore_index=True)
+names['district_rbi'] = source_index['district_rbi'].to_numpy()[names['src'].to_numpy()]
+names['state_rbi'] = source_index['state_rbi'].to_numpy()[names['src'].to_numpy()]
+names = names.groupby(['gadm', 'col'], as_index=False).agg(
+    district_rbi=('district_rbi', lambda x: '; '.join(sorted(set(x)))),
+    state_rbi=('state_rbi', 'first')
 )
 
-matched_count = rbi_panel['matched_rbi_gadm'].sum()
-total_count = len(rbi_panel)
-print(f"    Matched: {matched_count}/{total_count} ({matched_count/total_count*100:.1f}%)")
-
-# Drop unmatched RBI districts
-rbi_panel = rbi_panel[rbi_panel['matched_rbi_gadm'] == True].copy()
-rbi_panel = rbi_panel.drop(columns=['matched_rbi_gadm'])
-
-print(f"    After dropping unmatched: {len(rbi_panel)} rows")
+# Long GADM × quarter × metric panel: only cells with at least one reporting source
+Y = Y.reshape(len(gadm_index), len(METRICS), n_q)
+reported = reported.reshape(len(gadm_index), len(METRICS), n_q) > 0
+g_idx, m_idx, q_idx = np.nonzero(reported)
+metrics_panel = pd.DataFrame({
+    'district_gadm': gadm_index['district_gadm'].to_numpy()[g_idx],
+    'state_gadm': gadm_index['state_gadm'].to_numpy()[g_idx],
+    'quarter': quarters['quarter'].to_numpy()[q_idx],
+    'year': quarters['year'].to_numpy()[q_idx],
+    'q': quarters['q'].to_numpy()[q_idx],
+    'quarter_num': q_idx + 1,
+    'metric': pd.Categorical.from_codes(m_idx, categories=list(METRICS)),
+    'value': Y[g_idx, m_idx, q_idx],
+}).sort_values(['metric', 'district_gadm', 'year', 'q']).reset_index(drop=True)
+
+# Wide GADM panel (one column per metric): district-quarters with any reported metric
+Y = np.where(reported, Y, np.nan)
+g_idx, q_idx = np.nonzero(reported.any(axis=1))
+rbi_panel = pd.DataFrame({
+    'district_gadm': gadm_index['district_gadm'].to_numpy()[g_idx],
+    'state_gadm': gadm_index['state_gadm'].to_numpy()[g_idx],
+    'quarter': quarters['quarter'].to_numpy()[q_idx],
+    'year': quarters['year'].to_numpy()[q_idx],
+    'q': quarters['q'].to_numpy()[q_idx],
+    'quarter_num': q_idx + 1,
+    **{metric: Y[g_idx, m, q_idx] for m, metric in enumerate(METRICS)},
+    'gadm': g_idx, 'col': q_idx,
+}).merge(names, on=['gadm', 'col'], how='left').drop(columns=['gadm', 'col'])
+rbi_panel = rbi_panel.sort_values(['district_gadm', 'year', 'q']).reset_index(drop=True)
+rbi_panel['credit_deposit_ratio'] = rbi_panel['credit'] / rbi_panel['deposits'].where(rbi_panel['deposits'] > 0)
+
+print(f"    GADM district-quarters: {len(rbi_panel)}")
 print(f"    Unique GADM districts: {rbi_panel['district_gadm'].nunique()}")
 
-# Add quarter_num (sequential index)
-rbi_panel = rbi_panel.sort_values(['district_gadm', 'year', 'q'])
-quarter_map = {q: i+1 for i, q in enumerate(sorted(rbi_panel['quarter'].unique()))}
-rbi_panel['quarter_num'] = rbi_panel['quarter'].map(quarter_map)
-
-# Aggregate to GADM level (handle duplicate crosswalk matches)
-print(f"\n[4b] Aggregating to unique GADM district-state-quarters...")
-print(f"    Before aggregation: {len(rbi_panel)} rows")
-
-rbi_panel = rbi_panel.groupby(
-    ['district_gadm', 'state_gadm', 'quarter', 'year', 'q', 'quarter_num'],
-    as_index=False
-).agg({
-    'deposits': 'sum',
-    'district_rbi': lambda x: '; '.join(sorted(set(x))),
-    'state_rbi': 'first'
+# Population-group panel (2023-2024 workbook): same apportionment, one block per group.
+# Rows are source × group, so each regime matrix becomes kron(A, I_groups).
+print(f"\n[4b] Population-group resolved panel...")
+groups = rbi_long[rbi_long['population_group'].notna()].copy()
+groups['population_group'] = pd.Categorical(groups['population_group'], categories=POPULATION_GROUPS)
+groups = groups.dropna(subset=['population_group']).groupby(
+    ['state_rbi', 'district_rbi', 'population_group', 'year', 'q'], observed=True, as_index=False, sort=False
+)[list(METRICS)].sum(min_count=1)
+n_g = len(POPULATION_GROUPS)
+g_src = pd.MultiIndex.from_frame(source_index[['state_key', 'district_key']]).get_indexer(
+    pd.MultiIndex.from_arrays([groups['state_rbi'].map(normalize_name), groups['district_rbi'].map(normalize_name)])
+)
+g_col = np.searchsorted(quarters['period'].to_numpy(), (groups['year'] * 4 + groups['q'] - 1).to_numpy())
+g_row = g_src * n_g + groups['population_group'].cat.codes.to_numpy()
+X_groups = np.full((len(source_index) * n_g, len(METRICS) * n_q), np.nan)
+for m, metric in enumerate(METRICS):
+    X_groups[g_row, m * n_q + g_col] = groups[metric].to_numpy(dtype=np.float64)
+
+group_cols = np.flatnonzero(~np.isnan(X_groups).all(axis=0))
+Y_groups = np.zeros((len(gadm_index) * n_g, X_groups.shape[1]))
+reported_groups = np.zeros_like(Y_groups)
+for cols, A in matrices:
+    cols = np.intersect1d(cols, group_cols)
+    if len(cols) == 0:
+        continue
+    A_groups = sparse.kron(A, sparse.identity(n_g), format='csr')
+    Y_groups[:, cols] = A_groups.T @ np.nan_to_num(X_groups[:, cols])
+    reported_groups[:, cols] = (A_groups != 0).astype(np.float64).T @ ~np.isnan(X_groups[:, cols])
+
+Y_groups = Y_groups.reshape(len(gadm_index), n_g, len(METRICS), n_q)
+reported_groups = reported_groups.reshape(len(gadm_index), n_g, len(METRICS), n_q) > 0
+Y_groups = np.where(reported_groups, Y_groups, np.nan)
+gi, gg, qi = np.nonzero(reported_groups.any(axis=2))
+popgroup_panel = pd.DataFrame({
+    'district_gadm': pd.Categorical(gadm_index['district_gadm'].to_numpy()[gi]),
+    'state_gadm': pd.Categorical(gadm_index['state_gadm'].to_numpy()[gi]),
+    'population_group': pd.Categorical.from_codes(gg, dtype=pd.CategoricalDtype(POPULATION_GROUPS, ordered=True)),
+    'quarter': pd.Categorical(quarters['quarter'].to_numpy()[qi], categories=quarters['quarter'].tolist(), ordered=True),
+    'year': quarters['year'].to_numpy(dtype=np.int16)[qi],
+    'q': quarters['q'].to_numpy(dtype=np.int8)[qi],
+    'quarter_num': (qi + 1).astype(np.int16),
+    **{metric: Y_groups[gi, gg, m, qi] for m, metric in enumerate(METRICS) if metric != 'credit'},
 })
-
-print(f"    After aggregation: {len(rbi_panel)} rows")
-print(f"    Unique GADM districts: {rbi_panel['district_gadm'].nunique()}")
+print(f"    ✓ {len(popgroup_panel):,} district × group × quarter rows "
+      f"({popgroup_panel['quarter'].nunique()} quarters, {popgroup_panel.memory_usage(deep=True).sum() / 1e6:.1f} MB in memory)")
+rollup = rollup_population_groups(popgroup_panel)
+check = rollup.merge(rbi_panel[['district_gadm', 'state_gadm', 'quarter', 'deposits']].astype({'quarter': str}),
+                     on=['district_gadm', 'state_gadm', 'quarter'], how='inner', suffixes=('_groups', ''))
+print(f"    ✓ Rollup matches district panel: max |Δ deposits| = "
+      f"{(check['deposits_groups'] - check['deposits']).abs().max():.4f}")
 
 # Reorder columns
 rbi_panel = rbi_panel[[
     'district_gadm', 'state_gadm', 'quarter', 'year', 'q', 'quarter_num',
-    'deposits', 'district_rbi', 'state_rbi'
+    *METRICS, 'credit_deposit_ratio', 'district_rbi', 'state_rbi'
 ]]
 
 # Save
-output_path = '02_Data_Intermediate/rbi_deposits_panel.csv'
-rbi_panel.to_csv(output_path, index=False)
+output_path = write_dataset(rbi_panel, 'rbi_deposits_panel')
+metrics_path = write_dataset(metrics_panel, 'rbi_metrics_panel')
+popgroup_path = write_dataset(popgroup_panel, 'rbi_popgroup_panel')
 
 print(f"\n[5] OUTPUT SAVED")
 print(f"    File: {output_path}")
 print(f"    Rows: {len(rbi_panel)}")
 print(f"    Columns: {rbi_panel.columns.tolist()}")
+print(f"    File: {metrics_path} (long, metric × district × quarter)")
+print(f"    Rows: {len(metrics_panel)} | " + ', '.join(
+    f"{m}: {n}" for m, n in metrics_panel['metric'].value_counts(sort=False).items()))
+print(f"    File: {popgroup_path} (district × population group × quarter)")
+print(f"    Rows: {len(popgroup_panel)}")
 
 # Summary stats
 print(f"\n[6] SUMMARY STATISTICS")
@@ -204,6 +237,10 @@ print(f"    Quarters: {rbi_panel['quarter'].nunique()}")
 print(f"    Date range: {rbi_panel['year'].min()}-{rbi_panel['year'].max()}")
 print(f"    Total deposits (₹ Crores): {rbi_panel['deposits'].sum():,.0f}")
 print(f"    Mean deposits per district-quarter: {rbi_panel['deposits'].mean():,.0f}")
+print(f"    Total credit (₹ Crores): {rbi_panel['credit'].sum():,.0f} "
+      f"({rbi_panel['credit'].notna().sum()} district-quarters; not reported in the 2023-2024 workbook)")
+print(f"    Median credit-deposit ratio: {rbi_panel['credit_deposit_ratio'].median():.2f}")
+print(f"    Total offices (latest quarter): {rbi_panel.loc[rbi_panel['quarter'] == rbi_panel['quarter'].max(), 'offices'].sum():,.0f}")
 
 # Check for missing quarters
 print(f"\n[7] TEMPORAL COVERAGE CHECK")
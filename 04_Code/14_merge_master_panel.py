@@ -1,4 +1,5 @@
-import pandas as pd
+from panel_keys import load_registry, attach_keys, compact_panel, key_join
+from data_store import read_dataset, write_dataset
 
 print("="*70)
 print("MASTER PANEL MERGE - PHASE 3d")
@@ -6,39 +7,42 @@ print("="*70)
 
 # Load all datasets
 print("\n[1] Loading datasets...")
-skeleton = pd.read_csv('02_Data_Intermediate/district_quarter_skeleton.csv')
-floods = pd.read_csv('02_Data_Intermediate/flood_exposure_panel.csv')
-rbi = pd.read_csv('02_Data_Intermediate/rbi_deposits_panel.csv')
+skeleton = read_dataset('district_quarter_skeleton')
+floods = read_dataset('flood_exposure_panel')
+rbi = read_dataset('rbi_deposits_panel')
 
 print(f"    Skeleton: {len(skeleton)} rows")
 print(f"    Floods:   {len(floods)} rows")
 print(f"    RBI:      {len(rbi)} rows")
 
-# Merge floods onto skeleton (use district + state + quarter)
+# Integer keys: district_id (state-aware) and quarter_id replace name/label joins
+registry = load_registry()
+skeleton = attach_keys(skeleton, registry)
+floods = attach_keys(floods, registry)
+rbi = attach_keys(rbi, registry)
+print(f"    Registry: {len(registry)} districts")
+
+# Merge floods onto skeleton (district_id + quarter_id)
 print("\n[2] Merging flood exposure...")
-master = skeleton.merge(
-    floods[['district_gadm', 'state_gadm', 'quarter', 'flood_exposure_ruleA_qt', 'flood_exposure_ruleB_qt']],
-    on=['district_gadm', 'state_gadm', 'quarter'],
-    how='left',
-    validate='1:1'
-)
+# Own-district exposure plus neighbour/decay exposure columns added by Scripts 31-32
+flood_cols = [c for c in floods.columns if c.startswith(('flood_exposure_', 'flood_nbr_', 'flood_decay_'))]
+master = key_join(skeleton, floods, flood_cols)
 print(f"    After flood merge: {len(master)} rows")
 print(f"    Flood coverage: {master['flood_exposure_ruleA_qt'].sum()} events (Rule A)")
 
-# Merge RBI deposits (use district + state + quarter)
+# Merge RBI deposits (district_id + quarter_id)
 print("\n[3] Merging RBI deposits...")
-master = master.merge(
-    rbi[['district_gadm', 'state_gadm', 'quarter', 'deposits']],
-    on=['district_gadm', 'state_gadm', 'quarter'],
-    how='left',
-    validate='1:1'
-)
+# Credit, branch offices and accounts (thousands) come from the same RBI triplets
+rbi_cols = [c for c in ['deposits', 'credit', 'offices', 'accounts', 'credit_deposit_ratio'] if c in rbi.columns]
+master = key_join(master, rbi, rbi_cols)
 print(f"    After RBI merge: {len(master)} rows")
 print(f"    Deposit coverage: {master['deposits'].notna().sum()} district-quarters")
+for col in rbi_cols[1:]:
+    print(f"    {col} coverage: {master[col].notna().sum()} district-quarters")
 
 # Check coverage
 print("\n[4] COVERAGE ANALYSIS")
-print(f"    Districts with ANY deposit data: {master.groupby(['district_gadm', 'state_gadm'])['deposits'].apply(lambda x: x.notna().any()).sum()}")
+print(f"    Districts with ANY deposit data: {master.loc[master['deposits'].notna(), 'district_id'].nunique()}")
 print(f"    District-quarters with BOTH floods + deposits: {((master['flood_exposure_ruleA_qt'] > 0) & (master['deposits'].notna())).sum()}")
 
 # Temporal coverage breakdown
@@ -49,9 +53,13 @@ for year in sorted(master['year'].unique()):
     floods_count = year_data['flood_exposure_ruleA_qt'].sum()
     print(f"    {year}: {deposits_pct:5.1f}% deposits coverage | {floods_count:3.0f} flood events")
 
+# Compact schema: categorical names/labels, int8 flags, int16 time columns
+before = master.memory_usage(deep=True).sum()
+master = compact_panel(master, registry)
+print(f"\n    Memory: {before/1e6:.1f} MB → {master.memory_usage(deep=True).sum()/1e6:.1f} MB")
+
 # Save
-output_path = '02_Data_Intermediate/master_panel_raw.csv'
-master.to_csv(output_path, index=False)
+output_path = write_dataset(master, 'master_panel_raw')
 
 print(f"\n[6] OUTPUT SAVED")
 print(f"    File: {output_path}")
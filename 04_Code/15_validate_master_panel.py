@@ -1,7 +1,6 @@
-import pandas as pd
-import numpy as np
+from analytics_db import connect
 
-df = pd.read_csv('02_Data_Intermediate/master_panel_raw.csv')
+con = connect()
 
 print("="*70)
 print("MASTER PANEL VALIDATION")
@@ -9,72 +8,93 @@ print("="*70)
 
 # 1. Panel balance (CORRECTED)
 print("\n[1] PANEL BALANCE CHECK")
-unique_units = df[['district_gadm', 'state_gadm']].drop_duplicates().shape[0]
-unique_quarters = df['quarter'].nunique()
+n_rows, unique_units, unique_quarters, n_deposits, n_flood_A, n_flood_B = con.execute("""
+    SELECT count(*),
+           count(DISTINCT (district_gadm, state_gadm)),
+           count(DISTINCT quarter),
+           count(deposits),
+           count(*) FILTER (WHERE flood_exposure_ruleA_qt > 0),
+           count(*) FILTER (WHERE flood_exposure_ruleB_qt > 0)
+    FROM master_panel_raw
+""").fetchone()
 expected = unique_units * unique_quarters
 print(f"    Unique (district, state) pairs: {unique_units}")
 print(f"    Unique quarters: {unique_quarters}")
 print(f"    Expected rows: {expected}")
-print(f"    Actual rows: {len(df)}")
-print(f"    Balanced: {len(df) == expected}")
+print(f"    Actual rows: {n_rows}")
+print(f"    Balanced: {n_rows == expected}")
 
 # Check for duplicates
-dupes = df[df.duplicated(subset=['district_gadm', 'state_gadm', 'quarter'], keep=False)]
+dupes = con.execute("""
+    SELECT district_gadm, state_gadm, quarter, deposits
+    FROM master_panel_raw
+    QUALIFY count(*) OVER (PARTITION BY district_gadm, state_gadm, quarter) > 1
+""").df()
 if len(dupes) > 0:
     print(f"\n    WARNING: {len(dupes)} duplicate rows found!")
     print("    Sample duplicates:")
-    print(dupes.head(10)[['district_gadm', 'state_gadm', 'quarter', 'deposits']])
+    print(dupes.head(10))
 
 # 2. Missing data by year
 print("\n[2] MISSING DATA BY YEAR")
-for year in sorted(df['year'].unique()):
-    year_df = df[df['year'] == year]
-    missing_deps = year_df['deposits'].isna().sum()
-    pct = (missing_deps / len(year_df)) * 100
+by_year = con.execute("""
+    SELECT year, count(*) - count(deposits) AS missing, count(*) AS total
+    FROM master_panel_raw GROUP BY year ORDER BY year
+""").fetchall()
+for year, missing_deps, total in by_year:
+    pct = (missing_deps / total) * 100
     print(f"    {year}: {missing_deps:5d} missing ({pct:5.1f}%)")
 
 # 3. 2016 investigation
 print("\n[3] 2016 DETAILED BREAKDOWN")
-df_2016 = df[df['year'] == 2016]
-for q in [1, 2, 3, 4]:
-    q_df = df_2016[df_2016['q'] == q]
-    missing = q_df['deposits'].isna().sum()
-    print(f"    2016Q{q}: {missing}/{len(q_df)} missing ({100*missing/len(q_df):.1f}%)")
+by_quarter_2016 = con.execute("""
+    SELECT q, count(*) - count(deposits) AS missing, count(*) AS total
+    FROM master_panel_raw WHERE year = 2016 GROUP BY q ORDER BY q
+""").fetchall()
+for q, missing, total in by_quarter_2016:
+    print(f"    2016Q{q}: {missing}/{total} missing ({100*missing/total:.1f}%)")
 
 # 4. Flood-deposit overlap
 print("\n[4] TREATMENT-OUTCOME OVERLAP")
-floods = df[df['flood_exposure_ruleA_qt'] > 0]
-print(f"    Total flood events: {len(floods)}")
-print(f"    Floods WITH deposit data: {floods['deposits'].notna().sum()}")
-print(f"    Coverage: {100 * floods['deposits'].notna().sum() / len(floods):.1f}%")
+n_floods, n_floods_with_deposits = con.execute("""
+    SELECT count(*), count(deposits) FROM master_panel_raw WHERE flood_exposure_ruleA_qt > 0
+""").fetchone()
+print(f"    Total flood events: {n_floods}")
+print(f"    Floods WITH deposit data: {n_floods_with_deposits}")
+print(f"    Coverage: {100 * n_floods_with_deposits / n_floods:.1f}%")
 
 # 5. District-level summary
 print("\n[5] DISTRICT-LEVEL COVERAGE")
-district_stats = df.groupby(['district_gadm', 'state_gadm']).agg({
-    'deposits': lambda x: x.notna().sum(),
-    'quarter': 'count'
-}).reset_index()
-district_stats.columns = ['district_gadm', 'state_gadm', 'quarters_with_data', 'total_quarters']
-district_stats['coverage_pct'] = 100 * district_stats['quarters_with_data'] / district_stats['total_quarters']
-
-print(f"    Districts with 100% coverage: {(district_stats['coverage_pct'] == 100).sum()}")
-print(f"    Districts with 0% coverage: {(district_stats['coverage_pct'] == 0).sum()}")
-print(f"    Mean coverage: {district_stats['coverage_pct'].mean():.1f}%")
+n_full, n_zero, mean_coverage = con.execute("""
+    WITH district_stats AS (
+        SELECT 100.0 * count(deposits) / count(*) AS coverage_pct
+        FROM master_panel_raw
+        GROUP BY district_gadm, state_gadm
+    )
+    SELECT count(*) FILTER (WHERE coverage_pct = 100),
+           count(*) FILTER (WHERE coverage_pct = 0),
+           avg(coverage_pct)
+    FROM district_stats
+""").fetchone()
+print(f"    Districts with 100% coverage: {n_full}")
+print(f"    Districts with 0% coverage: {n_zero}")
+print(f"    Mean coverage: {mean_coverage:.1f}%")
+con.close()
 
 # 6. Save validation log
 output = f"""MASTER PANEL VALIDATION REPORT
 Generated: 2026-01-12
 
 STRUCTURE:
-- Rows: {len(df)}
+- Rows: {n_rows}
 - Unique (district, state) pairs: {unique_units}
 - Quarters: {unique_quarters}
-- Balanced: {len(df) == expected}
+- Balanced: {n_rows == expected}
 
 DATA AVAILABILITY:
-- Deposits: {df['deposits'].notna().sum()} / {len(df)} ({100*df['deposits'].notna().sum()/len(df):.1f}%)
-- Floods (Rule A): {(df['flood_exposure_ruleA_qt'] > 0).sum()} events
-- Floods (Rule B): {(df['flood_exposure_ruleB_qt'] > 0).sum()} events
+- Deposits: {n_deposits} / {n_rows} ({100*n_deposits/n_rows:.1f}%)
+- Floods (Rule A): {n_flood_A} events
+- Floods (Rule B): {n_flood_B} events
 
 CRITICAL ISSUES:
 1. 2016Q3-Q4: 100% missing deposits (RBI data gap)
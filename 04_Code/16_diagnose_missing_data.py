@@ -1,6 +1,6 @@
-import pandas as pd
+from analytics_db import connect
 
-df = pd.read_csv('02_Data_Intermediate/master_panel_raw.csv')
+con = connect()
 
 print("="*70)
 print("MISSING DATA DIAGNOSTICS")
@@ -8,44 +8,73 @@ print("="*70)
 
 # 1. Districts with 0% coverage
 print("\n[1] DISTRICTS WITH NO DEPOSIT DATA (n=35)")
-district_coverage = df.groupby(['district_gadm', 'state_gadm']).agg({
-    'deposits': lambda x: x.notna().sum()
-}).reset_index()
-district_coverage.columns = ['district_gadm', 'state_gadm', 'quarters_with_data']
-
-zero_coverage = district_coverage[district_coverage['quarters_with_data'] == 0]
+zero_coverage = con.execute("""
+    SELECT district_gadm, state_gadm, count(deposits) AS quarters_with_data
+    FROM master_panel_raw
+    GROUP BY district_gadm, state_gadm
+    HAVING count(deposits) = 0
+    ORDER BY district_gadm, state_gadm
+""").df()
 print(zero_coverage.to_string(index=False))
 
 # 2. 2017 gap by state
 print("\n\n[2] 2017 MISSING DATA BY STATE")
-df_2017 = df[df['year'] == 2017]
-state_2017 = df_2017.groupby('state_gadm').agg({
-    'deposits': lambda x: x.isna().sum(),
-    'quarter': 'count'
-}).reset_index()
-state_2017.columns = ['state_gadm', 'missing', 'total']
-state_2017['missing_pct'] = 100 * state_2017['missing'] / state_2017['total']
-state_2017 = state_2017[state_2017['missing'] > 0].sort_values('missing', ascending=False)
+state_2017 = con.execute("""
+    SELECT state_gadm,
+           count(*) - count(deposits) AS missing,
+           count(*) AS total,
+           100.0 * (count(*) - count(deposits)) / count(*) AS missing_pct
+    FROM master_panel_raw
+    WHERE year = 2017
+    GROUP BY state_gadm
+    HAVING count(*) - count(deposits) > 0
+    ORDER BY missing DESC, state_gadm
+""").df()
 print(state_2017.to_string(index=False))
 
 # 3. 2017 gap by quarter
 print("\n\n[3] 2017 MISSING DATA BY QUARTER")
-for q in [1, 2, 3, 4]:
-    q_df = df_2017[df_2017['q'] == q]
-    missing = q_df['deposits'].isna().sum()
-    print(f"    2017Q{q}: {missing}/{len(q_df)} missing ({100*missing/len(q_df):.1f}%)")
+quarter_2017 = con.execute("""
+    SELECT q, count(*) - count(deposits) AS missing, count(*) AS total
+    FROM master_panel_raw
+    WHERE year = 2017
+    GROUP BY q
+    ORDER BY q
+""").fetchall()
+for q, missing, total in quarter_2017:
+    print(f"    2017Q{q}: {missing}/{total} missing ({100*missing/total:.1f}%)")
 
 # 4. Overall coverage by state (all years)
 print("\n\n[4] OVERALL COVERAGE BY STATE (2015-2024)")
-state_overall = df.groupby('state_gadm').agg({
-    'deposits': lambda x: x.notna().sum(),
-    'quarter': 'count'
-}).reset_index()
-state_overall.columns = ['state_gadm', 'with_data', 'total']
-state_overall['coverage_pct'] = 100 * state_overall['with_data'] / state_overall['total']
-state_overall = state_overall.sort_values('coverage_pct')
+state_overall = con.execute("""
+    SELECT state_gadm,
+           count(deposits) AS with_data,
+           count(*) AS total,
+           100.0 * count(deposits) / count(*) AS coverage_pct
+    FROM master_panel_raw
+    GROUP BY state_gadm
+    ORDER BY coverage_pct, state_gadm
+""").df()
 print(state_overall.to_string(index=False))
 
+# 5. Flooded district-quarters with no deposit data
+print("\n\n[5] FLOODED DISTRICT-QUARTERS WITHOUT DEPOSITS (Rule A, by state)")
+flood_gaps = con.execute("""
+    SELECT state_gadm,
+           count(*) AS flooded,
+           count(*) - count(deposits) AS missing_deposits,
+           string_agg(DISTINCT CAST(quarter AS VARCHAR), ', ' ORDER BY CAST(quarter AS VARCHAR))
+               FILTER (WHERE deposits IS NULL) AS quarters
+    FROM master_panel_raw
+    WHERE flood_exposure_ruleA_qt > 0
+    GROUP BY state_gadm
+    HAVING count(*) - count(deposits) > 0
+    ORDER BY missing_deposits DESC
+""").df()
+print(flood_gaps.to_string(index=False))
+
+con.close()
+
 print("\n" + "="*70)
 print("DIAGNOSIS COMPLETE")
-print("="*70)
\ No newline at end of file
+print("="*70)
@@ -1,6 +1,6 @@
-import pandas as pd
+from data_store import read_dataset, write_dataset
 
-df = pd.read_csv('02_Data_Intermediate/master_panel_raw.csv')
+df = read_dataset('master_panel_raw')
 
 print("="*70)
 print("ANALYSIS SAMPLE PREPARATION")
@@ -37,8 +37,7 @@ print(f"    Flood events: {(df_opt3['flood_exposure_ruleA_qt'] > 0).sum()}")
 print(f"    Floods WITH deposits: {(df_opt3['flood_exposure_ruleA_qt'] > 0).sum()} with data")
 
 # Save Option 3 (recommended)
-output_path = '02_Data_Intermediate/master_panel_analysis.csv'
-df_opt3.to_csv(output_path, index=False)
+output_path = write_dataset(df_opt3, 'master_panel_analysis')
 
 print(f"\n[RECOMMENDED SAMPLE SAVED]")
 print(f"    File: {output_path}")
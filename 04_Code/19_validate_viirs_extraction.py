@@ -5,6 +5,8 @@ Validate Jan 2023 test extraction before bulk processing
 import pandas as pd
 import logging
 
+from data_store import read_dataset
+
 logging.basicConfig(
     filename='05_Outputs/Logs/19_viirs_validation.log',
     level=logging.INFO,
@@ -18,7 +20,7 @@ print("="*70)
 
 # Load files
 test_df = pd.read_csv('02_Data_Intermediate/viirs_jan2023_test.csv')
-master_df = pd.read_csv('02_Data_Intermediate/master_panel_analysis.csv')
+master_df = read_dataset('master_panel_analysis')
 
 print(f"\n[1/5] Loaded test extraction: {len(test_df)} districts")
 print(f"[2/5] Loaded master panel: {len(master_df)} district-quarters")
@@ -8,6 +8,9 @@ import numpy as np
 import logging
 import os
 
+from panel_keys import load_registry, attach_keys, month_id, quarter_of_month, key_join
+from data_store import read_dataset, write_dataset
+
 # Setup logging
 os.makedirs('05_Outputs/Logs', exist_ok=True)
 logging.basicConfig(
@@ -29,24 +32,15 @@ print(f"   Columns: {list(viirs_df.columns)}")
 
 # === STEP 2: Map month to quarter ===
 print(f"\n[2/5] Mapping months to quarters...")
-def month_to_quarter(month):
-    """Map month (1-12) to quarter (Q1-Q4)"""
-    if month in [1, 2, 3]:
-        return 'Q1'
-    elif month in [4, 5, 6]:
-        return 'Q2'
-    elif month in [7, 8, 9]:
-        return 'Q3'
-    else:
-        return 'Q4'
-
-viirs_df['quarter'] = viirs_df['month'].apply(month_to_quarter)
-print(f"   Jan 2023 mapped to: {viirs_df['quarter'].iloc[0]}")
+# int16 month_id → quarter_id (year*4 + q-1); no string quarter formats to reconcile
+viirs_df['month_id'] = month_id(viirs_df['year'], viirs_df['month'])
+viirs_df['quarter_id'] = quarter_of_month(viirs_df['month_id'])
+print(f"   Jan 2023 mapped to quarter_id: {viirs_df['quarter_id'].iloc[0]}")
 
 # === STEP 3: Aggregate to quarterly (for multi-month data in future) ===
 print(f"\n[3/5] Aggregating to quarterly level...")
-# Group by district, state, year, quarter
-viirs_quarterly = viirs_df.groupby(['gadm_district', 'gadm_state', 'year', 'quarter']).agg({
+# Group by district, state, quarter_id
+viirs_quarterly = viirs_df.groupby(['gadm_district', 'gadm_state', 'quarter_id']).agg({
     'mean_radiance': 'mean',  # Average radiance across months in quarter
     'pixel_count': 'sum'       # Total pixels processed
 }).reset_index()
@@ -57,63 +51,41 @@ print(viirs_quarterly.head(3))
 
 # === STEP 4: Test merge with master panel ===
 print(f"\n[4/5] Testing merge with master panel...")
-master_df = pd.read_csv('02_Data_Intermediate/master_panel_analysis.csv')
+master_df = read_dataset('master_panel_analysis')
 print(f"   Master panel: {len(master_df)} district-quarters")
 
-# Check master panel 'q' column format
-print(f"   Master 'q' dtype: {master_df['q'].dtype}")
-print(f"   Master 'q' sample: {list(master_df['q'].unique()[:5])}")
-
 # Rename VIIRS columns to match master panel
 viirs_quarterly.rename(columns={
     'gadm_district': 'district_gadm',
     'gadm_state': 'state_gadm'
 }, inplace=True)
 
-# Convert VIIRS quarter format to match master panel
-if master_df['q'].dtype == 'object':
-    # Master uses string format (Q1, Q2, etc.)
-    viirs_quarterly.rename(columns={'quarter': 'q'}, inplace=True)
-    print(f"   Using string format for 'q': Q1, Q2, etc.")
-else:
-    # Master uses numeric format (1, 2, 3, 4)
-    quarter_map = {'Q1': 1, 'Q2': 2, 'Q3': 3, 'Q4': 4}
-    viirs_quarterly['q'] = viirs_quarterly['quarter'].map(quarter_map)
-    viirs_quarterly.drop(columns=['quarter'], inplace=True)
-    print(f"   Converted to numeric format: 1, 2, 3, 4")
-
-print(f"   VIIRS 'q' dtype after conversion: {viirs_quarterly['q'].dtype}")
-print(f"   VIIRS 'q' sample: {list(viirs_quarterly['q'].unique())}")
-
-# Merge on district, state, year, quarter
-merged_df = master_df.merge(
-    viirs_quarterly[['district_gadm', 'state_gadm', 'year', 'q', 'mean_radiance', 'pixel_count']],
-    on=['district_gadm', 'state_gadm', 'year', 'q'],
-    how='left',
-    indicator=True
-)
+# Integer keys on both sides: district_id (district + state) and quarter_id
+registry = load_registry()
+master_df = attach_keys(master_df, registry)
+viirs_quarterly = attach_keys(viirs_quarterly, registry)
+print(f"   Join keys: district_id {master_df['district_id'].dtype}, quarter_id {master_df['quarter_id'].dtype}")
+
+# Merge on district_id + quarter_id
+merged_df = key_join(master_df, viirs_quarterly, ['mean_radiance', 'pixel_count'])
+n_both = int(merged_df['mean_radiance'].notna().sum())
 
 # Check merge statistics
-merge_stats = merged_df['_merge'].value_counts()
 print(f"\n   Merge statistics:")
-print(f"      Matched (both): {merge_stats.get('both', 0)}")
-print(f"      Master only (no VIIRS): {merge_stats.get('left_only', 0)}")
-print(f"      VIIRS only (no master): {merge_stats.get('right_only', 0)}")
+print(f"      Matched (both): {n_both}")
+print(f"      Master only (no VIIRS): {len(merged_df) - n_both}")
+print(f"      VIIRS only (no master): {len(viirs_quarterly) - n_both}")
 
 # Calculate coverage
 total_obs = len(merged_df)
-viirs_coverage = (merge_stats.get('both', 0) / total_obs) * 100
-print(f"\n   VIIRS coverage: {viirs_coverage:.2f}% ({merge_stats.get('both', 0)}/{total_obs} obs)")
+viirs_coverage = (n_both / total_obs) * 100
+print(f"\n   VIIRS coverage: {viirs_coverage:.2f}% ({n_both}/{total_obs} obs)")
 
 # === STEP 5: Save test merge ===
 print(f"\n[5/5] Saving test merge output...")
 
-# Drop merge indicator
-merged_df.drop(columns=['_merge'], inplace=True)
-
 # Save
-output_path = '02_Data_Intermediate/master_panel_viirs_test.csv'
-merged_df.to_csv(output_path, index=False)
+output_path = write_dataset(merged_df, 'master_panel_viirs_test')
 print(f"   Saved: {output_path}")
 
 # Summary statistics
@@ -149,4 +121,4 @@ print("="*70)
 log.info(f"Test merge complete: {viirs_coverage:.2f}% coverage")
 log.info(f"Total obs: {len(merged_df)}, VIIRS obs: {merged_df['mean_radiance'].notna().sum()}")
 
-print("\nDone. Output saved to 02_Data_Intermediate/master_panel_viirs_test.csv")
\ No newline at end of file
+print(f"\nDone. Output saved to {output_path}")
\ No newline at end of file
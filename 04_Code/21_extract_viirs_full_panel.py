@@ -8,7 +8,7 @@ INPUT:
   - GADM districts (01_Data_Raw/District_Boundaries/gadm41_IND_2.shp)
 
 OUTPUT:
-  - 02_Data_Intermediate/viirs_monthly_panel.csv (81,120 rows expected)
+  - 02_Data_Intermediate/viirs_monthly_panel.parquet (+ .csv copy; 81,120 rows expected)
 
 ESTIMATED RUNTIME: 6-8 hours (overnight execution)
 """
@@ -24,6 +24,8 @@ from pathlib import Path
 from glob import glob
 import time
 
+from data_store import write_dataset
+
 # === SETUP LOGGING ===
 os.makedirs('05_Outputs/Logs', exist_ok=True)
 logging.basicConfig(
@@ -164,8 +166,7 @@ print(f"\n[4/4] Saving results...")
 df = pd.DataFrame(all_results)
 
 os.makedirs('02_Data_Intermediate', exist_ok=True)
-output_path = '02_Data_Intermediate/viirs_monthly_panel.csv'
-df.to_csv(output_path, index=False)
+output_path = write_dataset(df, 'viirs_monthly_panel')
 
 # === SUMMARY ===
 print("="*70)
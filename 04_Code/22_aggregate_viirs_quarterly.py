@@ -1,8 +1,10 @@
-import pandas as pd
 import numpy as np
 import logging
 import os
 
+from panel_keys import load_registry, attach_keys, quarter_of_month, quarter_year
+from data_store import read_dataset, write_dataset
+
 # === SETUP LOGGING ===
 os.makedirs('05_Outputs/Logs', exist_ok=True)
 logging.basicConfig(
@@ -19,7 +21,7 @@ log.info("Starting 22_aggregate_viirs_quarterly.py")
 
 # === LOAD MONTHLY PANEL ===
 print(f"\n[1/4] Loading monthly VIIRS panel...")
-monthly_df = pd.read_csv('02_Data_Intermediate/viirs_monthly_panel.csv')
+monthly_df = read_dataset('viirs_monthly_panel')
 print(f"  ✓ Loaded: {len(monthly_df):,} rows")
 print(f"  ✓ Districts: {monthly_df['gadm_district'].nunique()}")
 print(f"  ✓ Months: {monthly_df[['year', 'month']].drop_duplicates().shape[0]}")
@@ -28,18 +30,11 @@ log.info(f"Monthly panel loaded: {len(monthly_df)} rows")
 # === MAP MONTHS TO QUARTERS ===
 print(f"\n[2/4] Mapping months to quarters...")
 
-def month_to_quarter(month):
-    """Map month (1-12) to quarter (1-4)"""
-    if month in [1, 2, 3]:
-        return 1
-    elif month in [4, 5, 6]:
-        return 2
-    elif month in [7, 8, 9]:
-        return 3
-    else:  # [10, 11, 12]
-        return 4
-
-monthly_df['q'] = monthly_df['month'].apply(month_to_quarter)
+# Integer keys: month_id → quarter_id by arithmetic, district_id from (district, state)
+registry = load_registry()
+monthly_df = attach_keys(monthly_df, registry, district_col='gadm_district', state_col='gadm_state')
+monthly_df['quarter_id'] = quarter_of_month(monthly_df['month_id'])
+monthly_df['q'] = quarter_year(monthly_df['quarter_id'])[1]
 monthly_df['quarter'] = monthly_df['year'].astype(str) + 'Q' + monthly_df['q'].astype(str)
 
 print(f"  ✓ Quarters created")
@@ -49,24 +44,23 @@ log.info("Month-to-quarter mapping complete")
 # === AGGREGATE TO QUARTERLY ===
 print(f"\n[3/4] Aggregating to quarterly level...")
 
-# Group by district, state, year, quarter
+# Group by district_id + quarter_id (names carried along as lookups)
 quarterly_df = monthly_df.groupby(
-    ['gadm_district', 'gadm_state', 'year', 'quarter', 'q'],
-    as_index=False
+    ['district_id', 'quarter_id', 'gadm_district', 'gadm_state', 'year', 'quarter', 'q'],
+    as_index=False, sort=True
 ).agg({
     'mean_radiance': 'mean',     # Average radiance across 3 months in quarter
     'pixel_count': 'sum'         # Total pixels processed in quarter
 })
 
 print(f"  ✓ Quarterly records: {len(quarterly_df):,}")
-print(f"  ✓ Districts: {quarterly_df['gadm_district'].nunique()}")
+print(f"  ✓ Districts: {quarterly_df['district_id'].nunique()}")
 print(f"  ✓ Quarters: {quarterly_df['quarter'].nunique()}")
 log.info(f"Quarterly aggregation complete: {len(quarterly_df)} rows")
 
 # === SAVE OUTPUT ===
 print(f"\n[4/4] Saving quarterly panel...")
-output_path = '02_Data_Intermediate/viirs_quarterly_panel.csv'
-quarterly_df.to_csv(output_path, index=False)
+output_path = write_dataset(quarterly_df, 'viirs_quarterly_panel')
 
 # === SUMMARY ===
 print("="*70)
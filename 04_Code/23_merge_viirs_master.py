@@ -1,6 +1,8 @@
-import pandas as pd
 import numpy as np
 
+from panel_keys import load_registry, attach_keys, compact_panel, key_join
+from data_store import read_dataset, write_dataset
+
 print("=" * 70)
 print("PHASE 3d: VIIRS + Master Panel Merge")
 print("=" * 70)
@@ -12,15 +14,15 @@ print()
 print("[1/4] Loading input datasets...")
 
 # Load master panel (deposits + floods)
-master_df = pd.read_csv('02_Data_Intermediate/master_panel_analysis.csv')
+master_df = read_dataset('master_panel_analysis')
 print(f"  ✓ Master panel: {len(master_df):,} rows")
-print(f"    - Districts: {master_df['district_gadm'].nunique()}")
+print(f"    - Districts: {master_df[['district_gadm', 'state_gadm']].drop_duplicates().shape[0]}")
 print(f"    - Quarters: {master_df['quarter'].nunique()}")
 
 # Load VIIRS quarterly panel
-viirs_df = pd.read_csv('02_Data_Intermediate/viirs_quarterly_panel.csv')
+viirs_df = read_dataset('viirs_quarterly_panel')
 print(f"  ✓ VIIRS panel: {len(viirs_df):,} rows")
-print(f"    - Districts: {viirs_df['gadm_district'].nunique()}")
+print(f"    - Districts: {viirs_df[['gadm_district', 'gadm_state']].drop_duplicates().shape[0]}")
 print(f"    - Quarters: {viirs_df['quarter'].nunique()}")
 
 # ============================================================================
@@ -35,21 +37,22 @@ viirs_df = viirs_df.rename(columns={
     'gadm_state': 'state_gadm'
 })
 
-print("  ✓ Keys standardized")
+# district_id needs both names: Aurangabad, Bilaspur, Hamirpur, ... exist in two states
+registry = load_registry()
+master_df = attach_keys(master_df, registry)
+viirs_df = attach_keys(viirs_df, registry)
+
+print("  ✓ Keys standardized (district_id, quarter_id)")
 
 # ============================================================================
-# STEP 3: Merge on district + year + quarter
+# STEP 3: Merge on district_id + quarter_id
 # ============================================================================
 print()
 print("[3/4] Merging VIIRS with master panel (left join)...")
 
-# Left join: keep all master panel observations
-merged_df = master_df.merge(
-    viirs_df[['district_gadm', 'year', 'quarter', 'mean_radiance', 'pixel_count']],
-    on=['district_gadm', 'year', 'quarter'],
-    how='left',
-    suffixes=('', '_viirs')
-)
+# Left join: keep all master panel observations (1:1 on the integer keys)
+merged_df = key_join(master_df, viirs_df, ['mean_radiance', 'pixel_count'])
+merged_df = compact_panel(merged_df, registry)
 
 print(f"  ✓ Merge complete")
 print(f"  ✓ Output rows: {len(merged_df):,} (same as master)")
@@ -61,7 +64,7 @@ n_with_viirs = merged_df['mean_radiance'].notna().sum()
 n_missing_viirs = merged_df['mean_radiance'].isna().sum()
 print(f"  ✓ Observations with VIIRS: {n_with_viirs:,} / {len(merged_df):,} ({100*n_with_viirs/len(merged_df):.1f}%)")
 print(f"  ✓ Observations missing VIIRS: {n_missing_viirs:,}")
-print(f"  ✓ Districts with VIIRS: {merged_df[merged_df['mean_radiance'].notna()]['district_gadm'].nunique()} / {merged_df['district_gadm'].nunique()}")
+print(f"  ✓ Districts with VIIRS: {merged_df.loc[merged_df['mean_radiance'].notna(), 'district_id'].nunique()} / {merged_df['district_id'].nunique()}")
 
 # ============================================================================
 # STEP 4: Save final analysis panel
@@ -69,8 +72,7 @@ print(f"  ✓ Districts with VIIRS: {merged_df[merged_df['mean_radiance'].notna(
 print()
 print("[4/4] Saving final analysis panel...")
 
-output_path = '03_Data_Clean/analysis_panel_final.csv'
-merged_df.to_csv(output_path, index=False)
+output_path = write_dataset(merged_df, 'analysis_panel_final')
 
 print("=" * 70)
 print("MERGE COMPLETE")
@@ -1,6 +1,9 @@
-import pandas as pd
 import numpy as np
 
+from panel_keys import load_registry, attach_keys
+from panel_array import PanelArray
+from data_store import read_dataset, write_dataset
+
 print("=" * 70)
 print("PHASE 3d: Regression Variable Engineering")
 print("=" * 70)
@@ -10,17 +13,21 @@ print()
 # STEP 1: Load analysis panel
 # ============================================================================
 print("[1/6] Loading analysis panel...")
-df = pd.read_csv('03_Data_Clean/analysis_panel_final.csv')
+df = read_dataset('analysis_panel_final')
+df = attach_keys(df, load_registry())  # district_id (district + state), quarter_id
 print(f"  ✓ Loaded: {len(df):,} rows")
 print(f"  ✓ Columns: {df.columns.tolist()}")
 print()
 
 # ============================================================================
-# STEP 2: Sort by district-quarter (critical for time-series operations)
+# STEP 2: Dense district × quarter arrays (time operators are column shifts)
 # ============================================================================
-print("[2/6] Sorting by district-quarter...")
-df = df.sort_values(['district_gadm', 'state_gadm', 'year', 'q'])
-print("  ✓ Sorted")
+print("[2/6] Building district × quarter arrays...")
+df = df.sort_values(['district_id', 'quarter_id']).reset_index(drop=True)
+flood_cols = ['flood_exposure_ruleA_qt', 'flood_exposure_ruleB_qt']
+panel = PanelArray.from_frame(df, ['deposits', 'mean_radiance'] + flood_cols)
+n_gap = int((~np.isin(panel.periods, df['quarter_id'].unique())).sum())
+print(f"  ✓ Grid: {panel.shape[0]} districts × {panel.shape[1]} quarters ({n_gap} quarters absent from the sample → NaN)")
 print()
 
 # ============================================================================
@@ -29,10 +36,13 @@ print()
 print("[3/6] Creating log variables...")
 
 # Log of deposits (₹ Crores)
-df['log_deposits'] = np.log(df['deposits'] + 1)  # log(x+1) to handle zeros
+panel['log_deposits'] = np.log(panel['deposits'] + 1)  # log(x+1) to handle zeros
 
 # Log of nighttime lights (nW/cm²/sr)
-df['log_lights_qt'] = np.log(df['mean_radiance'] + 1)  # log(x+1) to handle zeros
+panel['log_lights_qt'] = np.log(panel['mean_radiance'] + 1)  # log(x+1) to handle zeros
+
+df['log_deposits'] = panel.gather('log_deposits')
+df['log_lights_qt'] = panel.gather('log_lights_qt')
 
 print("  ✓ log_deposits created")
 print("  ✓ log_lights_qt created")
@@ -43,9 +53,9 @@ print()
 # ============================================================================
 print("[4/6] Computing quarter-over-quarter changes...")
 
-# First differences (within district)
-df['deposit_change_qt'] = df.groupby(['district_gadm', 'state_gadm'])['log_deposits'].diff()
-df['lights_change_qt'] = df.groupby(['district_gadm', 'state_gadm'])['log_lights_qt'].diff()
+# First differences against the previous calendar quarter (NaN after a gap)
+df['deposit_change_qt'] = panel.gather(panel.diff('log_deposits'))
+df['lights_change_qt'] = panel.gather(panel.diff('log_lights_qt'))
 
 print("  ✓ deposit_change_qt created")
 print("  ✓ lights_change_qt created")
@@ -56,21 +66,10 @@ print()
 # ============================================================================
 print("[5/6] Creating lagged flood exposure variables...")
 
-# Lag 1 quarter (t-1)
-df['flood_ruleA_L1'] = df.groupby(['district_gadm', 'state_gadm'])['flood_exposure_ruleA_qt'].shift(1)
-df['flood_ruleB_L1'] = df.groupby(['district_gadm', 'state_gadm'])['flood_exposure_ruleB_qt'].shift(1)
-
-# Lag 2 quarters (t-2)
-df['flood_ruleA_L2'] = df.groupby(['district_gadm', 'state_gadm'])['flood_exposure_ruleA_qt'].shift(2)
-df['flood_ruleB_L2'] = df.groupby(['district_gadm', 'state_gadm'])['flood_exposure_ruleB_qt'].shift(2)
-
-# Lag 3 quarters (t-3)
-df['flood_ruleA_L3'] = df.groupby(['district_gadm', 'state_gadm'])['flood_exposure_ruleA_qt'].shift(3)
-df['flood_ruleB_L3'] = df.groupby(['district_gadm', 'state_gadm'])['flood_exposure_ruleB_qt'].shift(3)
-
-# Lag 4 quarters (t-4, one year)
-df['flood_ruleA_L4'] = df.groupby(['district_gadm', 'state_gadm'])['flood_exposure_ruleA_qt'].shift(4)
-df['flood_ruleB_L4'] = df.groupby(['district_gadm', 'state_gadm'])['flood_exposure_ruleB_qt'].shift(4)
+# Lags 1-4 quarters (t-1 ... t-4, one year), by calendar quarter
+for k in range(1, 5):
+    df[f'flood_ruleA_L{k}'] = panel.gather(panel.lag('flood_exposure_ruleA_qt', k))
+    df[f'flood_ruleB_L{k}'] = panel.gather(panel.lag('flood_exposure_ruleB_qt', k))
 
 print("  ✓ Lags L1-L4 created for Rule A and Rule B")
 print()
@@ -80,8 +79,7 @@ print()
 # ============================================================================
 print("[6/6] Saving regression-ready dataset...")
 
-output_path = '03_Data_Clean/regression_panel_final.csv'
-df.to_csv(output_path, index=False)
+output_path = write_dataset(df, 'regression_panel_final')
 
 print("=" * 70)
 print("VARIABLE ENGINEERING COMPLETE")
@@ -3,6 +3,8 @@ import numpy as np
 import logging
 import os
 
+from data_store import read_dataset
+
 # === SETUP LOGGING ===
 os.makedirs('05_Outputs/Logs', exist_ok=True)
 logging.basicConfig(
@@ -21,7 +23,7 @@ log.info("="*70)
 
 # === LOAD REGRESSION-READY PANEL ===
 print(f"\n[1/5] Loading regression-ready panel...")
-df = pd.read_csv('03_Data_Clean/regression_panel_final.csv')
+df = read_dataset('regression_panel_final')
 print(f"  ✓ Loaded: {len(df):,} rows")
 print(f"  ✓ Districts: {df['district_gadm'].nunique()}")
 print(f"  ✓ Quarters: {df['quarter'].nunique()}")
@@ -1,9 +1,10 @@
-import pandas as pd
 import numpy as np
 import logging
 import os
 from datetime import datetime
 
+from data_store import read_dataset
+
 # === SETUP LOGGING ===
 os.makedirs('05_Outputs/Logs', exist_ok=True)
 log_path = '05_Outputs/Logs/26_viirs_monthly_validation.txt'
@@ -28,14 +29,14 @@ log.info(f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 log.info("="*70)
 
 # === LOAD DATA ===
-print(f"\n[Loading] viirs_monthly_panel.csv...")
+print(f"\n[Loading] viirs_monthly_panel...")
 try:
-    df = pd.read_csv('02_Data_Intermediate/viirs_monthly_panel.csv')
+    df = read_dataset('viirs_monthly_panel')
     print(f"  ✓ Loaded: {len(df):,} rows")
     log.info(f"\nFile loaded successfully: {len(df):,} rows")
 except FileNotFoundError:
     print(f"  ✗ ERROR: File not found. Script 21 may not have completed.")
-    log.error("ERROR: viirs_monthly_panel.csv not found")
+    log.error("ERROR: viirs_monthly_panel not found")
     exit(1)
 
 # === VALIDATION FLAGS ===
@@ -1,10 +1,12 @@
 import pandas as pd
 import numpy as np
-from statsmodels.formula.api import ols
-from statsmodels.iolib.summary2 import summary_col
 import logging
 import os
 
+from panel_keys import load_registry, attach_keys
+from fe_absorb import FixedEffects, ols_absorbed
+from data_store import read_dataset
+
 # === SETUP LOGGING ===
 os.makedirs('05_Outputs/Logs', exist_ok=True)
 logging.basicConfig(
@@ -24,7 +26,8 @@ log.info("="*70)
 
 # === LOAD DATA ===
 print(f"\n[1/5] Loading regression-ready panel...")
-df = pd.read_csv('03_Data_Clean/regression_panel_final.csv')
+df = read_dataset('regression_panel_final')
+df = attach_keys(df, load_registry())  # district_id (district + state), quarter_id
 print(f"  ✓ Loaded: {len(df):,} rows")
 log.info(f"\nPanel loaded: {len(df):,} rows")
 
@@ -45,19 +48,18 @@ log.info(f"Initial: {initial_n:,} obs")
 log.info(f"After restrictions: {len(df_reg):,} obs")
 log.info(f"Dropped: {initial_n - len(df_reg):,} obs")
 
-# === ENCODE FIXED EFFECTS ===
-print(f"\n[3/5] Encoding fixed effects...")
-
-# District FE (categorical)
-df_reg['district_fe'] = pd.Categorical(df_reg['district_gadm'])
+# === FIXED EFFECTS ===
+print(f"\n[3/5] Absorbing fixed effects...")
 
-# Time FE (quarter)
-df_reg['quarter_fe'] = pd.Categorical(df_reg['quarter'])
+# District FE on district_id (names repeat across states) + quarter FE, absorbed
+# by alternating projections instead of dummy columns
+fe = FixedEffects.from_frame(df_reg, ['district_id', 'quarter_id'])
 
-print(f"  ✓ District FE: {df_reg['district_fe'].nunique()} categories")
-print(f"  ✓ Quarter FE: {df_reg['quarter_fe'].nunique()} categories")
-log.info(f"District FE: {df_reg['district_fe'].nunique()} categories")
-log.info(f"Quarter FE: {df_reg['quarter_fe'].nunique()} categories")
+print(f"  ✓ District FE: {fe.n_groups[0]} groups (absorbed)")
+print(f"  ✓ Quarter FE: {fe.n_groups[1]} groups (absorbed)")
+print(f"  ✓ Singletons dropped: {fe.n_singletons}")
+log.info(f"District FE: {fe.n_groups[0]} groups")
+log.info(f"Quarter FE: {fe.n_groups[1]} groups")
 
 # === REGRESSION SPECIFICATION ===
 print(f"\n[4/5] Running regression: H1 First Stage...")
@@ -66,20 +68,18 @@ log.info("REGRESSION SPECIFICATION")
 log.info("="*70)
 log.info("DV: lights_change_qt (Δ log nighttime lights)")
 log.info("IV: flood_exposure_ruleA_qt (binary)")
-log.info("FE: District + Quarter")
-log.info("SE: Robust (note: clustering by district requires linearmodels package)")
-
-# OLS with FE (district + quarter absorbed via C() categorical)
-formula = 'lights_change_qt ~ flood_exposure_ruleA_qt + C(district_fe) + C(quarter_fe)'
+log.info("FE: District + Quarter (absorbed)")
+log.info("SE: Robust (HC1)")
 
 try:
-    model = ols(formula, data=df_reg).fit(cov_type='HC1')  # Robust SE
+    model = ols_absorbed(df_reg, 'lights_change_qt', ['flood_exposure_ruleA_qt'],
+                         fe=['district_id', 'quarter_id'], vcov='HC1')
     print(f"  ✓ Model fitted")
     print(f"  ✓ N obs: {model.nobs:,.0f}")
-    print(f"  ✓ R²: {model.rsquared:.4f}")
+    print(f"  ✓ Within R²: {model.rsquared_within:.4f}")
     log.info(f"\nModel fitted successfully")
     log.info(f"N obs: {model.nobs:,.0f}")
-    log.info(f"R²: {model.rsquared:.4f}")
+    log.info(f"Within R²: {model.rsquared_within:.4f}")
 except Exception as e:
     print(f"  ✗ ERROR: {e}")
     log.error(f"Model fitting failed: {e}")
@@ -125,6 +125,14 @@ else:
 print(f"    Significance: {interpretation} {sig_level}")
 log.info(f"Significance: {interpretation} {sig_level}")
 
+# Same fit under other covariance estimators (district / two-way clusters, Driscoll-Kraay)
+se_table = model.se_table()
+print(f"\n  STANDARD ERRORS BY ESTIMATOR:")
+log.info("\nStandard errors by estimator:")
+for _, row in se_table.iterrows():
+    print(f"    {row['vcov']:<34} SE = {row['std_error']:.6f}  p = {row['p_value']:.4f}")
+    log.info(f"  {row['vcov']:<34} SE = {row['std_error']:.6f}  p = {row['p_value']:.4f}")
+
 # === SAVE TABLE ===
 print(f"\n[Output] Saving regression table...")
 os.makedirs('05_Outputs/Tables', exist_ok=True)
@@ -143,7 +151,9 @@ results_df.to_csv('05_Outputs/Tables/02_H1_first_stage.csv', index=False)
 
 # Save full model summary
 with open('05_Outputs/Logs/27_H1_regression_full.txt', 'w') as f:
-    f.write(str(model.summary()))
+    f.write(model.summary())
+    f.write("\n\nStandard errors by estimator:\n")
+    f.write(se_table.to_string(index=False))
 
 # === SUMMARY ===
 print("="*70)
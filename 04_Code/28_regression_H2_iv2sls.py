@@ -1,116 +1,115 @@
 """
 Script 28: H2 IV 2SLS Regression (Lights -> Deposits)
-Phase 4 - Two-Stage Least Squares with flood exposure as instrument
+Phase 4 - Two-Stage Least Squares / LIML with flood exposure (Rule A, Rule B, lags) as instruments
 """
 
 import pandas as pd
-import numpy as np
-from scipy.stats import t as t_dist
+
+from panel_keys import load_registry, attach_keys
+from panel_array import PanelArray
+from panel_iv import PartialledPanel, iv_fit, weak_iv_sets
+from data_store import read_dataset
 
 print("=" * 70)
 print("PHASE 4: H2 IV 2SLS REGRESSION (Lights -> Deposits)")
 print("=" * 70)
 print()
 
+Y = 'deposit_change_qt'
+ENDOG = 'lights_change_qt'
+
+# Instrument sets: (label, instruments, sample). Each sample is partialled once
+# and every instrument set / method on it reuses the demeaned matrices.
+SPECS = [
+    ('Rule A',                ['flood_exposure_ruleA_qt'],                            'contemporaneous'),
+    ('Rule B',                ['flood_exposure_ruleB_qt'],                            'contemporaneous'),
+    ('Rule A + B',            ['flood_exposure_ruleA_qt', 'flood_exposure_ruleB_qt'], 'contemporaneous'),
+    ('Rule A + lags 1-2',     ['flood_exposure_ruleA_qt', 'flood_ruleA_lag1_qt', 'flood_ruleA_lag2_qt'], 'lags'),
+    ('Rule A + B + lags 1-2', ['flood_exposure_ruleA_qt', 'flood_exposure_ruleB_qt',
+                               'flood_ruleA_lag1_qt', 'flood_ruleA_lag2_qt',
+                               'flood_ruleB_lag1_qt', 'flood_ruleB_lag2_qt'],         'lags'),
+]
+METHODS = ['2sls', 'liml']
+VCOV = 'cluster'   # clustered by district
+
 # ============================================================================
 # STEP 1: Load data
 # ============================================================================
 print("[1/6] Loading regression-ready panel...")
-df = pd.read_csv('03_Data_Clean/regression_panel_final.csv')
+df = read_dataset('regression_panel_final')
+df = attach_keys(df, load_registry())  # district_id (district + state), quarter_id
 print(f"  ✓ Loaded: {len(df):,} rows")
 print()
 
 # ============================================================================
-# STEP 2: Restrict to complete cases
+# STEP 2: Lagged instruments and estimation samples
 # ============================================================================
-print("[2/6] Restricting to complete cases...")
-print(f"  Initial: {len(df):,} obs")
-
-# Keep only obs with all variables non-missing
-df_reg = df[['deposit_change_qt', 'lights_change_qt', 'flood_exposure_ruleA_qt', 
-              'district_gadm', 'quarter']].dropna()
-
-print(f"  After restrictions: {len(df_reg):,} obs")
-print(f"  Dropped: {len(df) - len(df_reg):,} obs ({100*(len(df) - len(df_reg))/len(df):.1f}%)")
+print("[2/6] Creating lagged instruments and samples...")
+
+# Lags by calendar quarter on the district × quarter grid (NaN across the 2016Q3-2017Q1 gap)
+df = df.sort_values(['district_id', 'quarter_id']).reset_index(drop=True)
+panel = PanelArray.from_frame(df, ['flood_exposure_ruleA_qt', 'flood_exposure_ruleB_qt'])
+for rule in ['A', 'B']:
+    for lag in [1, 2]:
+        df[f'flood_rule{rule}_lag{lag}_qt'] = panel.gather(panel.lag(f'flood_exposure_rule{rule}_qt', lag))
+
+samples = {}
+for sample in ['contemporaneous', 'lags']:
+    instruments = sorted({z for _, zs, s in SPECS if s == sample for z in zs})
+    complete = df[[Y, ENDOG, *instruments, 'district_id', 'quarter_id']].notna().all(axis=1)
+    print(f"  {sample}: {complete.sum():,} complete obs of {len(df):,} "
+          f"(dropped {100 * (1 - complete.mean()):.1f}%)")
+    samples[sample] = instruments
 print()
 
 # ============================================================================
-# STEP 3: Encode fixed effects
+# STEP 3: Fixed effects
 # ============================================================================
-print("[3/6] Encoding fixed effects...")
-
-# Convert to categorical and get dummies
-district_dummies = pd.get_dummies(df_reg['district_gadm'], prefix='district', drop_first=True)
-quarter_dummies = pd.get_dummies(df_reg['quarter'], prefix='quarter', drop_first=True)
-
-print(f"  ✓ District FE: {district_dummies.shape[1]} dummies")
-print(f"  ✓ Quarter FE: {quarter_dummies.shape[1]} dummies")
+print("[3/6] Absorbing fixed effects...")
+
+# District + quarter FE are projected out of y, lights and all instruments once per sample
+partialled = {}
+for sample, instruments in samples.items():
+    partialled[sample] = PartialledPanel(df, [Y, ENDOG, *instruments], fe=['district_id', 'quarter_id'])
+    fe = partialled[sample].fe
+    print(f"  ✓ {sample}: {fe.nobs:,} obs, district FE {fe.n_groups[0]}, quarter FE {fe.n_groups[1]}, "
+          f"singletons dropped {fe.n_singletons}")
+fe = partialled['contemporaneous'].fe
 print()
 
 # ============================================================================
-# STEP 4: First Stage (Floods -> Lights)
+# STEP 4: IV specifications
 # ============================================================================
-print("[4/6] Running First Stage (Floods -> Lights)...")
-
-# Construct design matrix (instrument + FE)
-X_first = np.column_stack([
-    df_reg['flood_exposure_ruleA_qt'].values,
-    district_dummies.values,
-    quarter_dummies.values
-])
-
-# Ensure float64 dtype
-X_first = X_first.astype(np.float64)
-
-y_first = df_reg['lights_change_qt'].values.astype(np.float64)
-
-# Estimate via OLS
-from numpy.linalg import lstsq
-beta_first = lstsq(X_first, y_first, rcond=None)[0]
-
-# Predicted lights (fitted values)
-lights_hat = X_first @ beta_first
-
-print(f"  ✓ First stage complete")
-print(f"  ✓ Coefficient on flood_exposure_ruleA_qt: {beta_first[0]:.6f}")
+print("[4/6] Estimating IV specifications (2SLS and LIML)...")
+
+fits = []
+for label, instruments, sample in SPECS:
+    for method in METHODS:
+        if method == 'liml' and len(instruments) == 1:
+            continue  # just-identified: LIML = 2SLS
+        res = iv_fit(partialled[sample], Y, ENDOG, instruments, method=method, vcov=VCOV)
+        # Weak-instrument-robust sets by test inversion (same clustered covariance)
+        grid, sets = weak_iv_sets(res)
+        res.weak_iv_grid, res.weak_iv_sets = grid, sets.set_index('test')
+        fits.append((label, method, res))
+        print(f"  ✓ {label:<22} {method.upper():<5} β = {res.params[ENDOG]: .6f} "
+              f"(SE {res.bse[ENDOG]:.6f}), KP F = {res.kp_f:.2f}, AR set {res.weak_iv_sets.loc['AR', 'set']}")
 print()
 
 # ============================================================================
-# STEP 5: Second Stage (Lights_hat -> Deposits)
+# STEP 5: Main specification (Rule A, 2SLS)
 # ============================================================================
-print("[5/6] Running Second Stage (Lights_hat -> Deposits)...")
-
-# Construct design matrix (fitted lights + FE)
-X_second = np.column_stack([
-    lights_hat,
-    district_dummies.values,
-    quarter_dummies.values
-])
-
-# Ensure float64 dtype
-X_second = X_second.astype(np.float64)
-
-y_second = df_reg['deposit_change_qt'].values.astype(np.float64)
-
-# Estimate via OLS
-beta_second = lstsq(X_second, y_second, rcond=None)[0]
-
-# Calculate residuals for SE
-residuals = y_second - (X_second @ beta_second)
-sigma2 = np.sum(residuals**2) / (len(y_second) - X_second.shape[1])
+print("[5/6] Main specification: Rule A, 2SLS...")
 
-# Variance-covariance matrix
-XtX_inv = np.linalg.inv(X_second.T @ X_second)
-var_beta = sigma2 * np.diag(XtX_inv)
-se_beta = np.sqrt(var_beta)
+main = fits[0][2]
+main_iid = main.with_vcov('iid')
+coef = main.params[ENDOG]
+se = main.bse[ENDOG]
+t_stat = main.tvalues[ENDOG]
+p_val = main.pvalues[ENDOG]
+first_stage = main.first_stage.loc[ENDOG]
 
-# Extract coefficient on lights_hat
-coef = beta_second[0]
-se = se_beta[0]
-t_stat = coef / se
-p_val = 2 * (1 - t_dist.cdf(abs(t_stat), df=len(y_second) - X_second.shape[1]))
-
-print(f"  ✓ Second stage complete")
+print("  ✓ Complete")
 print()
 
 # ============================================================================
@@ -119,11 +118,14 @@ print()
 print("[6/6] Extracting results...")
 print()
 print("  [FIRST STAGE: Floods -> Lights]")
-print(f"    β̂  = {beta_first[0]:.6f}")
+print(f"    F (excluded instrument, district-clustered) = {first_stage['F']:.3f}")
+print(f"    Partial R²                                 = {first_stage['partial_r2']:.4f}")
+print(f"    Kleibergen-Paap rk Wald F                  = {main.kp_f:.3f}")
+print(f"    Cragg-Donald Wald F                        = {main.cd_f:.3f}")
 print()
-print("  [SECOND STAGE: Lights_hat -> Deposits]")
+print("  [2SLS: Lights -> Deposits]")
 print(f"    β̂  = {coef:.6f}")
-print(f"    SE = {se:.6f}")
+print(f"    SE = {se:.6f} (district-clustered; iid {main_iid.bse[ENDOG]:.6f})")
 print(f"    t  = {t_stat:.3f}")
 print(f"    p  = {p_val:.4f}")
 
@@ -138,43 +140,88 @@ else:
 
 print(f"    Significance: {sig if sig else 'NOT SIGNIFICANT'}")
 print()
+ci = main.conf_int().loc[ENDOG]
+print("  [95% CONFIDENCE SETS]")
+print(f"    Wald: [{ci['lower']:.4f}, {ci['upper']:.4f}]")
+print(f"    AR:   {main.weak_iv_sets.loc['AR', 'set']}")
+print(f"    CLR:  {main.weak_iv_sets.loc['CLR', 'set']}")
+print()
 
-# Save results table
-results = pd.DataFrame({
-    'Variable': ['lights_change_qt_hat'],
-    'Coefficient': [coef],
-    'Std_Error': [se],
-    't_statistic': [t_stat],
-    'p_value': [p_val],
-    'N_obs': [len(y_second)]
-})
+rows = []
+for label, method, res in fits:
+    overid = res.overid or {}
+    rows.append({
+        'Variable': ENDOG,
+        'Coefficient': res.params[ENDOG],
+        'Std_Error': res.bse[ENDOG],
+        't_statistic': res.tvalues[ENDOG],
+        'p_value': res.pvalues[ENDOG],
+        'N_obs': res.nobs,
+        'Specification': label,
+        'Method': method.upper(),
+        'Instruments': ', '.join(res.instruments),
+        'Std_Error_iid': res.with_vcov('iid').bse[ENDOG],
+        'First_stage_F': res.first_stage.loc[ENDOG, 'F'],
+        'KP_F': res.kp_f,
+        'CD_F': res.cd_f,
+        'Overid_test': overid.get('test'),
+        'Overid_stat': overid.get('statistic'),
+        'Overid_p': overid.get('p_value'),
+        'AR_set': res.weak_iv_sets.loc['AR', 'set'],
+        'CLR_set': res.weak_iv_sets.loc['CLR', 'set'],
+    })
+results = pd.DataFrame(rows)
+
+print("  [ALL SPECIFICATIONS]")
+print(results[['Specification', 'Method', 'Coefficient', 'Std_Error', 'p_value', 'KP_F', 'Overid_p', 'N_obs']]
+      .to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+print()
 
+# Save results table (first row is the main specification)
 results.to_csv('05_Outputs/Tables/03_H2_iv2sls.csv', index=False)
 
+# AR / CLR statistics over the β grid for the main specification (plot-ready)
+main.weak_iv_grid.to_csv('05_Outputs/Tables/03_H2_weak_iv_grid.csv', index=False)
+
 # Save log
 with open('05_Outputs/Logs/28_H2_regression.txt', 'w') as f:
     f.write("=" * 70 + "\n")
-    f.write("H2: IV 2SLS REGRESSION (Migration -> Deposits)\n")
+    f.write("H2: IV 2SLS REGRESSION (Lights -> Deposits)\n")
     f.write("=" * 70 + "\n\n")
-    f.write(f"N observations: {len(y_second):,}\n")
-    f.write(f"District FE: {district_dummies.shape[1]}\n")
-    f.write(f"Quarter FE: {quarter_dummies.shape[1]}\n\n")
+    f.write(f"N observations: {main.nobs:,}\n")
+    f.write(f"District FE: {fe.n_groups[0]} (absorbed)\n")
+    f.write(f"Quarter FE: {fe.n_groups[1]} (absorbed)\n")
+    f.write(f"Covariance: {main.vcov}\n\n")
     f.write("[FIRST STAGE]\n")
-    f.write("flood_exposure_ruleA_qt -> lights_change_qt: {:.6f}\n\n".format(beta_first[0]))
-    f.write("[SECOND STAGE]\n")
-    f.write(f"lights_change_qt_hat -> deposit_change_qt:\n")
+    f.write(f"flood_exposure_ruleA_qt -> lights_change_qt: F = {first_stage['F']:.3f}, "
+            f"partial R² = {first_stage['partial_r2']:.4f}\n")
+    f.write(f"Kleibergen-Paap rk Wald F: {main.kp_f:.3f}\n")
+    f.write(f"Cragg-Donald Wald F: {main.cd_f:.3f}\n\n")
+    f.write("[2SLS]\n")
+    f.write(f"lights_change_qt -> deposit_change_qt:\n")
     f.write(f"  Coefficient: {coef:.6f} {sig}\n")
-    f.write(f"  Std Error: {se:.6f}\n")
+    f.write(f"  Std Error: {se:.6f} (iid: {main_iid.bse[ENDOG]:.6f})\n")
     f.write(f"  t-statistic: {t_stat:.3f}\n")
-    f.write(f"  p-value: {p_val:.4f}\n")
+    f.write(f"  p-value: {p_val:.4f}\n\n")
+    f.write("[95% CONFIDENCE SETS]\n")
+    f.write(f"  Wald: [{ci['lower']:.4f}, {ci['upper']:.4f}]\n")
+    f.write(f"  AR:   {main.weak_iv_sets.loc['AR', 'set']}\n")
+    f.write(f"  CLR:  {main.weak_iv_sets.loc['CLR', 'set']}\n\n")
+    f.write("[ALL SPECIFICATIONS]\n\n")
+    for label, method, res in fits:
+        f.write(f"--- {label}, {method.upper()} ---\n")
+        f.write(res.summary() + "\n")
+        f.write(f"AR set:  {res.weak_iv_sets.loc['AR', 'set']}\n")
+        f.write(f"CLR set: {res.weak_iv_sets.loc['CLR', 'set']}\n\n")
 
 print("[Output] Saving regression table...")
 print("=" * 70)
 print("H2 IV 2SLS COMPLETE")
 print("=" * 70)
 print(f"Table: 05_Outputs/Tables/03_H2_iv2sls.csv")
+print(f"Grid:  05_Outputs/Tables/03_H2_weak_iv_grid.csv")
 print(f"Log:   05_Outputs/Logs/28_H2_regression.txt")
 print("=" * 70)
 print()
 print("NEXT STEP: Run Script 29 (H3: Timing effects)")
-print("=" * 70)
\ No newline at end of file
+print("=" * 70)
@@ -4,8 +4,12 @@ Phase 4 - Test timing of flood effects on deposits
 """
 
 import pandas as pd
-import numpy as np
-from scipy.stats import t as t_dist
+
+from panel_keys import load_registry, attach_keys
+from panel_array import PanelArray
+from fe_absorb import FixedEffects, ols_absorbed
+from wild_bootstrap import wild_cluster_bootstrap
+from data_store import read_dataset
 
 print("=" * 70)
 print("PHASE 4: H3 TIMING ANALYSIS (Distributed Lags)")
@@ -16,7 +20,8 @@ print()
 # STEP 1: Load data
 # ============================================================================
 print("[1/6] Loading regression-ready panel...")
-df = pd.read_csv('03_Data_Clean/regression_panel_final.csv')
+df = read_dataset('regression_panel_final')
+df = attach_keys(df, load_registry())  # district_id (district + state), quarter_id
 print(f"  ✓ Loaded: {len(df):,} rows")
 print()
 
@@ -25,12 +30,12 @@ print()
 # ============================================================================
 print("[2/6] Creating lag variables...")
 
-# Sort by district and quarter to ensure proper lagging
-df = df.sort_values(['district_gadm', 'quarter']).reset_index(drop=True)
+# Lags by calendar quarter on the district × quarter grid (NaN across the 2016Q3-2017Q1 gap)
+df = df.sort_values(['district_id', 'quarter_id']).reset_index(drop=True)
+panel = PanelArray.from_frame(df, ['flood_exposure_ruleA_qt'])
 
-# Create lags of flood exposure within each district
-df['flood_lag1_qt'] = df.groupby('district_gadm')['flood_exposure_ruleA_qt'].shift(1)
-df['flood_lag2_qt'] = df.groupby('district_gadm')['flood_exposure_ruleA_qt'].shift(2)
+df['flood_lag1_qt'] = panel.gather(panel.lag('flood_exposure_ruleA_qt', 1))
+df['flood_lag2_qt'] = panel.gather(panel.lag('flood_exposure_ruleA_qt', 2))
 
 print(f"  ✓ Created flood_lag1_qt (1 quarter lag)")
 print(f"  ✓ Created flood_lag2_qt (2 quarters lag)")
@@ -48,8 +53,9 @@ df_reg = df[[
     'flood_exposure_ruleA_qt',  # t=0 (contemporaneous)
     'flood_lag1_qt',             # t-1 (1 quarter lag)
     'flood_lag2_qt',             # t-2 (2 quarters lag)
-    'district_gadm',
-    'quarter'
+    'district_id',
+    'quarter_id',
+    'state_gadm'                 # wild bootstrap clusters
 ]].dropna()
 
 print(f"  After restrictions: {len(df_reg):,} obs")
@@ -57,16 +63,16 @@ print(f"  Dropped: {len(df) - len(df_reg):,} obs ({100*(len(df) - len(df_reg))/l
 print()
 
 # ============================================================================
-# STEP 4: Encode fixed effects
+# STEP 4: Fixed effects
 # ============================================================================
-print("[4/6] Encoding fixed effects...")
+print("[4/6] Absorbing fixed effects...")
 
-# Convert to categorical and get dummies
-district_dummies = pd.get_dummies(df_reg['district_gadm'], prefix='district', drop_first=True)
-quarter_dummies = pd.get_dummies(df_reg['quarter'], prefix='quarter', drop_first=True)
+# District + quarter FE are projected out of every variable (fe_absorb.py)
+fe = FixedEffects.from_frame(df_reg, ['district_id', 'quarter_id'])
 
-print(f"  ✓ District FE: {district_dummies.shape[1]} dummies")
-print(f"  ✓ Quarter FE: {quarter_dummies.shape[1]} dummies")
+print(f"  ✓ District FE: {fe.n_groups[0]} groups (absorbed)")
+print(f"  ✓ Quarter FE: {fe.n_groups[1]} groups (absorbed)")
+print(f"  ✓ Singletons dropped: {fe.n_singletons}")
 print()
 
 # ============================================================================
@@ -74,51 +80,15 @@ print()
 # ============================================================================
 print("[5/6] Running distributed lag regression...")
 
-# Construct design matrix (contemporaneous + 2 lags + FE)
-X = np.column_stack([
-    df_reg['flood_exposure_ruleA_qt'].values,  # t=0
-    df_reg['flood_lag1_qt'].values,            # t-1
-    df_reg['flood_lag2_qt'].values,            # t-2
-    district_dummies.values,
-    quarter_dummies.values
-])
-
-# Ensure float64 dtype
-X = X.astype(np.float64)
-
-y = df_reg['deposit_change_qt'].values.astype(np.float64)
-
-# Estimate via OLS
-from numpy.linalg import lstsq
-beta = lstsq(X, y, rcond=None)[0]
-
-# Calculate residuals for SE
-residuals = y - (X @ beta)
-sigma2 = np.sum(residuals**2) / (len(y) - X.shape[1])
-
-# Variance-covariance matrix
-XtX_inv = np.linalg.inv(X.T @ X)
-var_beta = sigma2 * np.diag(XtX_inv)
-se_beta = np.sqrt(var_beta)
+# Contemporaneous + 2 lags, district + quarter FE absorbed
+timing_vars = ['flood_exposure_ruleA_qt', 'flood_lag1_qt', 'flood_lag2_qt']
+model = ols_absorbed(df_reg, 'deposit_change_qt', timing_vars, fe=['district_id', 'quarter_id'])
 
 # Extract coefficients for the 3 flood timing variables
-coef_t0 = beta[0]
-coef_t1 = beta[1]
-coef_t2 = beta[2]
-
-se_t0 = se_beta[0]
-se_t1 = se_beta[1]
-se_t2 = se_beta[2]
-
-# Calculate t-stats and p-values
-df_resid = len(y) - X.shape[1]
-t_t0 = coef_t0 / se_t0
-t_t1 = coef_t1 / se_t1
-t_t2 = coef_t2 / se_t2
-
-p_t0 = 2 * (1 - t_dist.cdf(abs(t_t0), df=df_resid))
-p_t1 = 2 * (1 - t_dist.cdf(abs(t_t1), df=df_resid))
-p_t2 = 2 * (1 - t_dist.cdf(abs(t_t2), df=df_resid))
+coef_t0, coef_t1, coef_t2 = model.params[timing_vars]
+se_t0, se_t1, se_t2 = model.bse[timing_vars]
+t_t0, t_t1, t_t2 = model.tvalues[timing_vars]
+p_t0, p_t1, p_t2 = model.pvalues[timing_vars]
 
 print(f"  ✓ Regression complete")
 print()
@@ -189,6 +159,32 @@ cumulative = coef_t0 + coef_t1 + coef_t2
 print(f"  [CUMULATIVE] Sum of coefficients: {cumulative:.6f}")
 print()
 
+# Same fit under other covariance estimators (district / two-way clusters, Driscoll-Kraay)
+se_table = model.se_table()
+print("  STANDARD ERRORS BY ESTIMATOR:")
+print(se_table.pivot(index='vcov', columns='variable', values='std_error')
+      .loc[se_table['vcov'].unique(), timing_vars].to_string(float_format=lambda v: f"{v:.6f}"))
+print()
+
+# Wild cluster bootstrap (9,999 draws, no refits): restricted tests with district
+# clusters (Rademacher) and state clusters (Webb, few clusters), and an
+# unrestricted percentile-t interval with district clusters
+states = df_reg.loc[model.fe.keep, 'state_gadm'].to_numpy()
+boot_district = wild_cluster_bootstrap(model, cluster='district_id', weights='rademacher')
+boot_state = wild_cluster_bootstrap(model, cluster=states, weights='webb')
+boot_ci = wild_cluster_bootstrap(model, cluster='district_id', weights='rademacher', restricted=False)
+print("  WILD CLUSTER BOOTSTRAP (B = 9,999):")
+print(pd.DataFrame({
+    't (district)': boot_district['t_statistic'].to_numpy(),
+    'p WCR district': boot_district['p_value_bootstrap'].to_numpy(),
+    't (state)': boot_state['t_statistic'].to_numpy(),
+    'p WCR state': boot_state['p_value_bootstrap'].to_numpy(),
+    'WCU CI lower': boot_ci['ci_lower'].to_numpy(),
+    'WCU CI upper': boot_ci['ci_upper'].to_numpy(),
+}, index=timing_vars).to_string(float_format=lambda v: f"{v:.4f}"))
+print(f"  ({boot_district['n_clusters'].iloc[0]} districts, {boot_state['n_clusters'].iloc[0]} states)")
+print()
+
 # Save results table
 results = pd.DataFrame({
     'Variable': ['flood_t0', 'flood_t1_lag', 'flood_t2_lag'],
@@ -196,7 +192,11 @@ results = pd.DataFrame({
     'Std_Error': [se_t0, se_t1, se_t2],
     't_statistic': [t_t0, t_t1, t_t2],
     'p_value': [p_t0, p_t1, p_t2],
-    'N_obs': [len(y), len(y), len(y)]
+    'N_obs': [model.nobs] * 3,
+    'p_wild_district': boot_district['p_value_bootstrap'].to_numpy(),
+    'p_wild_state': boot_state['p_value_bootstrap'].to_numpy(),
+    'wild_ci_lower': boot_ci['ci_lower'].to_numpy(),
+    'wild_ci_upper': boot_ci['ci_upper'].to_numpy(),
 })
 
 results.to_csv('05_Outputs/Tables/04_H3_timing.csv', index=False)
@@ -206,9 +206,9 @@ with open('05_Outputs/Logs/29_H3_timing.txt', 'w', encoding='utf-8') as f:
     f.write("=" * 70 + "\n")
     f.write("H3: TIMING ANALYSIS (Distributed Lags)\n")
     f.write("=" * 70 + "\n\n")
-    f.write(f"N observations: {len(y):,}\n")
-    f.write(f"District FE: {district_dummies.shape[1]}\n")
-    f.write(f"Quarter FE: {quarter_dummies.shape[1]}\n\n")
+    f.write(f"N observations: {model.nobs:,}\n")
+    f.write(f"District FE: {fe.n_groups[0]} (absorbed)\n")
+    f.write(f"Quarter FE: {fe.n_groups[1]} (absorbed)\n\n")
     f.write("TIMING EFFECTS:\n\n")
     f.write(f"[t=0] Contemporaneous flood:\n")
     f.write(f"  Coefficient: {coef_t0:.6f} {sig_t0}\n")
@@ -225,7 +225,16 @@ with open('05_Outputs/Logs/29_H3_timing.txt', 'w', encoding='utf-8') as f:
     f.write(f"  Std Error: {se_t2:.6f}\n")
     f.write(f"  t-statistic: {t_t2:.3f}\n")
     f.write(f"  p-value: {p_t2:.4f}\n\n")
-    f.write(f"Cumulative effect: {cumulative:.6f}\n")
+    f.write(f"Cumulative effect: {cumulative:.6f}\n\n")
+    f.write("Standard errors by estimator:\n")
+    f.write(se_table.to_string(index=False) + "\n\n")
+    f.write("Wild cluster bootstrap (B = 9,999):\n")
+    for boot, label in [(boot_district, 'WCR, district clusters, Rademacher'),
+                        (boot_state, 'WCR, state clusters, Webb'),
+                        (boot_ci, 'WCU, district clusters, Rademacher')]:
+        f.write(f"  {label} ({boot['n_clusters'].iloc[0]} clusters):\n")
+        f.write(boot[['variable', 't_statistic', 'p_value_bootstrap', 'ci_lower', 'ci_upper']]
+                .to_string(index=False) + "\n")
 
 print("[Output] Saving regression table...")
 print("=" * 70)
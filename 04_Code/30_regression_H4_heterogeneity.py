@@ -3,7 +3,8 @@
 PHASE 4: H4 HETEROGENEITY ANALYSIS
 ======================================================================
 Purpose: Test if flood effects on deposits vary by:
-  - Rural vs urban districts
+  - Rural vs urban districts (urban share of deposits from the RBI
+    population-group panel, Script 13)
   - High vs low flood exposure
   - Monsoon (Q3) vs non-monsoon quarters
 
@@ -15,10 +16,14 @@ Author: Climate-Migration-Bank-Fragility Research Project
 
 import pandas as pd
 import numpy as np
-import statsmodels.api as sm
-from statsmodels.formula.api import ols
 import os
 
+from rbi_io import urban_share
+from panel_keys import load_registry, attach_keys
+from panel_array import PanelArray
+from fe_absorb import ols_absorbed
+from data_store import read_dataset, dataset_path
+
 print("="*70)
 print("PHASE 4: H4 HETEROGENEITY ANALYSIS")
 print("="*70)
@@ -27,16 +32,18 @@ print("="*70)
 # [1/7] LOAD REGRESSION-READY PANEL
 # ============================================================================
 print("\n[1/7] Loading regression-ready panel...")
-panel_path = "02_Data_Intermediate/master_panel_analysis.csv"
-df = pd.read_csv(panel_path)
+df = read_dataset('master_panel_analysis')
+registry = load_registry()
+df = attach_keys(df, registry)  # district_id (district + state), quarter_id
 print(f"  ✓ Loaded: {len(df):,} rows")
 
 # ============================================================================
 # [2/7] ENGINEER DEPOSIT CHANGE VARIABLE
 # ============================================================================
 print("\n[2/7] Engineering deposit change variable...")
-df = df.sort_values(['district_gadm', 'state_gadm', 'quarter'])
-df['deposits_change_qt'] = df.groupby(['district_gadm', 'state_gadm'])['deposits'].pct_change()
+df = df.sort_values(['district_id', 'quarter_id']).reset_index(drop=True)
+panel = PanelArray.from_frame(df, ['deposits'])
+df['deposits_change_qt'] = panel.gather(panel.pct_change('deposits'))  # NaN across sample gaps
 print(f"  ✓ Created deposits_change_qt (quarterly % change)")
 print(f"  ✓ Non-missing: {df['deposits_change_qt'].notna().sum():,} ({100*df['deposits_change_qt'].notna().mean():.1f}%)")
 
@@ -45,15 +52,31 @@ print(f"  ✓ Non-missing: {df['deposits_change_qt'].notna().sum():,} ({100*df['
 # ============================================================================
 print("\n[3/7] Creating heterogeneity dummies...")
 
-# H4a: Rural vs Urban (using median deposits as proxy)
-median_deposits = df.groupby('district_gadm')['deposits'].median()
-df['is_urban'] = df['district_gadm'].map(lambda x: 1 if median_deposits.get(x, 0) > median_deposits.median() else 0)
-print(f"  ✓ Urban districts (proxy): {df.groupby('district_gadm')['is_urban'].first().sum()}")
+# H4a: Rural vs Urban: share of deposits held in urban + metropolitan
+# population groups (RBI 2023-2024 split, averaged over its quarters)
+try:
+    popgroups = read_dataset('rbi_popgroup_panel')
+except FileNotFoundError:
+    popgroups = None
+if popgroups is not None:
+    shares = urban_share(popgroups)
+    shares = attach_keys(shares.astype({'district_gadm': str, 'state_gadm': str}), registry)
+    district_share = shares.groupby('district_id')['urban_share'].mean().rename('urban_share')
+    df['urban_share'] = df['district_id'].map(district_share)
+    df['is_urban'] = (df['urban_share'] > district_share.median()).astype(int).where(df['urban_share'].notna())
+    print(f"  ✓ Urban deposit share: {len(district_share)} districts, median {district_share.median():.2f}")
+    print(f"  ✓ Urban districts (share > median): {df.groupby('district_id')['is_urban'].first().sum():.0f}")
+else:
+    # Fallback: median deposits as an urban proxy
+    print(f"  ⚠ {dataset_path('rbi_popgroup_panel')} not found (run Script 13); using median deposits as urban proxy")
+    median_deposits = df.groupby('district_id')['deposits'].median()
+    df['is_urban'] = (df['district_id'].map(median_deposits).fillna(0) > median_deposits.median()).astype(int)
+    print(f"  ✓ Urban districts (proxy): {df.groupby('district_id')['is_urban'].first().sum()}")
 
 # H4b: High vs Low Flood Exposure (≥3 floods in sample)
-flood_count = df.groupby('district_gadm')['flood_exposure_ruleA_qt'].sum()
-df['high_flood_exposure'] = df['district_gadm'].map(lambda x: 1 if flood_count.get(x, 0) >= 3 else 0)
-print(f"  ✓ High-exposure districts: {df.groupby('district_gadm')['high_flood_exposure'].first().sum()}")
+flood_count = df.groupby('district_id')['flood_exposure_ruleA_qt'].sum()
+df['high_flood_exposure'] = (df['district_id'].map(flood_count).fillna(0) >= 3).astype(int)
+print(f"  ✓ High-exposure districts: {df.groupby('district_id')['high_flood_exposure'].first().sum()}")
 
 # H4c: Monsoon Season (Q3 = Jul-Sep)
 df['monsoon_quarter'] = (df['q'] == 3).astype(int)
@@ -77,34 +100,36 @@ print(f"  Initial: {len(df):,} obs")
 df_reg = df[['deposits_change_qt', 'flood_exposure_ruleA_qt', 
              'is_urban', 'high_flood_exposure', 'monsoon_quarter',
              'flood_x_urban', 'flood_x_highexp', 'flood_x_monsoon',
-             'district_gadm', 'quarter']].dropna()
+             'district_id', 'quarter_id']].dropna()
 
 print(f"  After restrictions: {len(df_reg):,} obs")
 print(f"  Dropped: {len(df) - len(df_reg):,} obs ({100*(len(df) - len(df_reg))/len(df):.1f}%)")
 
 # ============================================================================
-# [6/7] ENCODE FIXED EFFECTS
+# [6/7] FIXED EFFECTS
 # ============================================================================
-print("\n[6/7] Encoding fixed effects...")
-df_reg = pd.get_dummies(df_reg, columns=['district_gadm', 'quarter'], drop_first=True, dtype=float)
-print(f"  ✓ District FE: {df_reg.filter(regex='^district_gadm_').shape[1]:,} dummies")
-print(f"  ✓ Quarter FE: {df_reg.filter(regex='^quarter_').shape[1]:,} dummies")
+print("\n[6/7] Absorbing fixed effects...")
+# District + quarter FE projected out (fe_absorb.py). The district-level dummies
+# (is_urban, high_flood_exposure) and monsoon_quarter are absorbed by them and
+# reported as omitted; the flood main effect and interactions are identified.
+# All three models share the sample, so the FE structure is read off the first fit.
+FE_COLS = ['district_id', 'quarter_id']
+X_cols_base = ['flood_exposure_ruleA_qt']
+model_urban = ols_absorbed(df_reg, 'deposits_change_qt', X_cols_base + ['is_urban', 'flood_x_urban'], fe=FE_COLS)
+fe = model_urban.fe
+print(f"  ✓ District FE: {fe.n_groups[0]:,} groups (absorbed)")
+print(f"  ✓ Quarter FE: {fe.n_groups[1]:,} groups (absorbed)")
+print(f"  ✓ Singletons dropped: {fe.n_singletons}")
 
 # ============================================================================
 # [7/7] RUN HETEROGENEITY REGRESSIONS
 # ============================================================================
 print("\n[7/7] Running heterogeneity regressions...")
 
-# Prepare regressors
-X_cols_base = ['flood_exposure_ruleA_qt'] + [c for c in df_reg.columns if c.startswith(('district_', 'quarter_'))]
-
 results = {}
-y = df_reg['deposits_change_qt']
 
 # H4a: Urban vs Rural
 print("\n  [H4a] Urban vs Rural Heterogeneity...")
-X_urban = df_reg[X_cols_base + ['is_urban', 'flood_x_urban']]
-model_urban = sm.OLS(y, X_urban).fit()
 results['urban'] = {
     'flood_coef': model_urban.params.get('flood_exposure_ruleA_qt', np.nan),
     'interaction_coef': model_urban.params.get('flood_x_urban', np.nan),
@@ -116,8 +141,8 @@ print("  ✓ Urban model complete")
 
 # H4b: High vs Low Exposure
 print("\n  [H4b] High vs Low Flood Exposure...")
-X_exp = df_reg[X_cols_base + ['high_flood_exposure', 'flood_x_highexp']]
-model_exp = sm.OLS(y, X_exp).fit()
+model_exp = ols_absorbed(df_reg, 'deposits_change_qt', X_cols_base + ['high_flood_exposure', 'flood_x_highexp'],
+                         fe=FE_COLS)
 results['exposure'] = {
     'flood_coef': model_exp.params.get('flood_exposure_ruleA_qt', np.nan),
     'interaction_coef': model_exp.params.get('flood_x_highexp', np.nan),
@@ -129,8 +154,8 @@ print("  ✓ Exposure model complete")
 
 # H4c: Monsoon vs Non-monsoon
 print("\n  [H4c] Monsoon vs Non-Monsoon Quarters...")
-X_mon = df_reg[X_cols_base + ['monsoon_quarter', 'flood_x_monsoon']]
-model_mon = sm.OLS(y, X_mon).fit()
+model_mon = ols_absorbed(df_reg, 'deposits_change_qt', X_cols_base + ['monsoon_quarter', 'flood_x_monsoon'],
+                         fe=FE_COLS)
 results['monsoon'] = {
     'flood_coef': model_mon.params.get('flood_exposure_ruleA_qt', np.nan),
     'interaction_coef': model_mon.params.get('flood_x_monsoon', np.nan),
@@ -140,6 +165,15 @@ results['monsoon'] = {
 }
 print("  ✓ Monsoon model complete")
 
+# Interaction SEs under other covariance estimators (same fits, no refitting)
+print("\n  Interaction SEs by estimator:")
+for label, model, term in [('H4a', model_urban, 'flood_x_urban'), ('H4b', model_exp, 'flood_x_highexp'),
+                           ('H4c', model_mon, 'flood_x_monsoon')]:
+    se_table = model.se_table()
+    se_table = se_table[se_table['variable'] == term]
+    print(f"    [{label}] " + " | ".join(f"{v}: {se:.4f} (p={p:.3f})" for v, se, p in
+                                      se_table[['vcov', 'std_error', 'p_value']].itertuples(index=False)))
+
 # ============================================================================
 # [8/7] DISPLAY RESULTS
 # ============================================================================
@@ -0,0 +1,104 @@
+"""
+31_build_spatial_exposure.py - Neighbour (spillover) flood exposure
+
+Floods in an adjacent district can drive migration and deposit flows even when
+the own district is not flooded. This script precomputes sparse district
+weights (queen, rook, k-nearest, distance band) from the dissolved GADM L2
+geometry and adds row-standardised spatial lags of flood exposure to the
+flood exposure panel.
+
+INPUT:
+  - 01_Data_Raw/District_Boundaries/gadm41_IND_2.shp
+  - 02_Data_Intermediate/flood_exposure_panel.parquet (from Script 10)
+
+OUTPUT:
+  - 02_Data_Intermediate/spatial_weights/W_{queen,rook,knn,distance}.npz
+  - 02_Data_Intermediate/spatial_weights/district_index.csv
+  - 02_Data_Intermediate/flood_exposure_panel.parquet (adds flood_nbr_* columns)
+
+New columns (share of neighbours exposed in the quarter, 0-1):
+  flood_nbr_queen_ruleA_qt, flood_nbr_queen_ruleB_qt,
+  flood_nbr_rook_ruleA_qt,  flood_nbr_rook_ruleB_qt
+"""
+
+import time
+import numpy as np
+
+from spatial_weights import (
+    load_district_geometries, build_weights, row_standardize,
+    spatial_lag, exposure_matrix, save_weights, WEIGHT_KINDS
+)
+from data_store import read_dataset, write_dataset
+
+GADM_PATH = '01_Data_Raw/District_Boundaries/gadm41_IND_2.shp'
+PANEL_DATASET = 'flood_exposure_panel'
+WEIGHTS_DIR = '02_Data_Intermediate/spatial_weights'
+
+KNN_K = 5
+DISTANCE_BAND_KM = 100.0
+
+# Spatial lags written to the panel (the other variants are saved for robustness)
+LAG_KINDS = ['queen', 'rook']
+EXPOSURE_COLS = {'ruleA': 'flood_exposure_ruleA_qt', 'ruleB': 'flood_exposure_ruleB_qt'}
+
+print("="*70)
+print("SPATIAL SPILLOVER EXPOSURE")
+print("="*70)
+
+# === STEP 1: Dissolved district geometry ===
+print(f"\n[1/4] Loading dissolved GADM L2 districts...")
+districts = load_district_geometries(GADM_PATH)
+print(f"  ✓ Districts (state-district pairs): {len(districts)}")
+
+# === STEP 2: Build and save weights ===
+print(f"\n[2/4] Building sparse weights matrices...")
+weights = {}
+for kind in WEIGHT_KINDS:
+    t0 = time.perf_counter()
+    W = build_weights(districts, kind=kind, k=KNN_K, band_km=DISTANCE_BAND_KM)
+    save_weights(W, districts, WEIGHTS_DIR, kind)
+    weights[kind] = W
+
+    n_links = np.asarray(W.sum(axis=1)).ravel()
+    print(f"  ✓ {kind:<8}: {W.nnz:,} links | mean neighbours {n_links.mean():.2f} | "
+          f"islands {(n_links == 0).sum()} | {time.perf_counter() - t0:.2f}s")
+
+# === STEP 3: Spatial lags of exposure ===
+print(f"\n[3/4] Computing neighbour exposure (W @ exposure, all quarters at once)...")
+panel = read_dataset(PANEL_DATASET)
+panel = panel.drop(columns=[c for c in panel.columns if c.startswith('flood_nbr_')])
+
+matrices = {}
+for rule, col in EXPOSURE_COLS.items():
+    matrices[rule], row_pos, col_pos = exposure_matrix(panel, districts, col)
+
+unmatched = (row_pos < 0).sum()
+if unmatched > 0:
+    print(f"  ⚠ {unmatched} panel rows have no geometry; neighbour exposure set to NaN")
+
+t0 = time.perf_counter()
+for kind in LAG_KINDS:
+    W_std = row_standardize(weights[kind])
+    for rule, E in matrices.items():
+        lag = spatial_lag(W_std, E)
+        values = np.full(len(panel), np.nan)
+        values[row_pos >= 0] = lag[row_pos[row_pos >= 0], col_pos[row_pos >= 0]]
+        panel[f'flood_nbr_{kind}_{rule}_qt'] = values
+elapsed_ms = (time.perf_counter() - t0) * 1000
+print(f"  ✓ {len(LAG_KINDS) * len(matrices)} spatial lags in {elapsed_ms:.1f} ms")
+
+for kind in LAG_KINDS:
+    col = f'flood_nbr_{kind}_ruleA_qt'
+    print(f"  ✓ {col}: {(panel[col] > 0).mean()*100:.1f}% of district-quarters have a flooded neighbour")
+
+# === STEP 4: Save ===
+print(f"\n[4/4] Saving flood exposure panel...")
+panel_path = write_dataset(panel, PANEL_DATASET)
+print(f"  ✓ Saved: {panel_path} ({len(panel):,} rows, {len(panel.columns)} columns)")
+print(f"  ✓ Weights: {WEIGHTS_DIR}/")
+
+print("="*70)
+print("SPATIAL EXPOSURE COMPLETE")
+print("="*70)
+print("\nNEXT STEP: Re-run Script 14 to carry neighbour exposure into the master panel")
+print("="*70)
@@ -0,0 +1,116 @@
+"""
+32_build_distance_decay_exposure.py - Distance-decay flood exposure
+
+Continuous exposure that decays with haversine distance from
+  (a) flooded districts (Rule A / Rule B, own district excluded), and
+  (b) geolocated EM-DAT event points (Latitude/Longitude, where reported).
+
+Kernel weights come from a KD-tree radius query over district centroids, so
+only pairs inside the kernel support are materialised (no all-pairs distance
+matrix). Exposure for all quarters is one sparse product K @ E, which keeps
+memory linear in units × periods when scaling to L3 tehsils / monthly data.
+
+INPUT:
+  - 01_Data_Raw/District_Boundaries/gadm41_IND_2.shp
+  - 01_Data_Raw/EMDAT_Disasters/public_emdat_custom_request_2026-01-02_c149ea93-8fbf-4f6e-a8f6-3b41cc622ed0.xlsx
+  - 02_Data_Intermediate/flood_exposure_panel.parquet (from Scripts 10/31)
+
+OUTPUT:
+  - 02_Data_Intermediate/flood_exposure_panel.parquet (adds flood_decay_* columns)
+
+Column naming: flood_decay_{kernel}{bandwidth}km_{source}_qt
+  e.g. flood_decay_gaussian50km_ruleB_qt, flood_decay_cutoff100km_events_qt
+"""
+
+import time
+import numpy as np
+import pandas as pd
+
+from spatial_weights import (
+    load_district_geometries, district_centroids, distance_decay_matrix,
+    event_period_matrix, exposure_matrix
+)
+from data_store import read_dataset, write_dataset
+
+GADM_PATH = '01_Data_Raw/District_Boundaries/gadm41_IND_2.shp'
+EMDAT_PATH = '01_Data_Raw/EMDAT_Disasters/public_emdat_custom_request_2026-01-02_c149ea93-8fbf-4f6e-a8f6-3b41cc622ed0.xlsx'
+PANEL_DATASET = 'flood_exposure_panel'
+
+# (kernel, bandwidth_km) specifications written to the panel
+KERNEL_SPECS = [
+    ('gaussian', 50),
+    ('bisquare', 100),
+    ('cutoff', 50),
+    ('cutoff', 100),
+]
+EXPOSURE_COLS = {'ruleA': 'flood_exposure_ruleA_qt', 'ruleB': 'flood_exposure_ruleB_qt'}
+
+print("="*70)
+print("DISTANCE-DECAY FLOOD EXPOSURE")
+print("="*70)
+
+# === STEP 1: District centroids ===
+print(f"\n[1/4] Loading district centroids...")
+districts = load_district_geometries(GADM_PATH)
+lon, lat = district_centroids(districts)
+print(f"  ✓ Districts: {len(districts)}")
+
+# === STEP 2: Exposure matrices ===
+print(f"\n[2/4] Building district × quarter exposure matrices...")
+panel = read_dataset(PANEL_DATASET)
+panel = panel.drop(columns=[c for c in panel.columns if c.startswith('flood_decay_')])
+
+matrices = {}
+for source, col in EXPOSURE_COLS.items():
+    matrices[source], row_pos, col_pos = exposure_matrix(panel, districts, col)
+quarter_nums = np.unique(panel['quarter_num'].to_numpy())
+print(f"  ✓ Matrix shape: {matrices['ruleA'].shape[0]} districts × {matrices['ruleA'].shape[1]} quarters")
+
+# Geolocated events (raw file is read-only; only rows with coordinates + month are used)
+emdat = pd.read_excel(EMDAT_PATH)
+events = emdat.dropna(subset=['Latitude', 'Longitude', 'Start Year', 'Start Month']).copy()
+events['quarter'] = (events['Start Year'].astype(int).astype(str) + 'Q' +
+                     ((events['Start Month'].astype(int) - 1) // 3 + 1).astype(str))
+quarter_lookup = panel[['quarter', 'quarter_num']].drop_duplicates().set_index('quarter')['quarter_num']
+events['quarter_num'] = events['quarter'].map(quarter_lookup)
+events = events.dropna(subset=['quarter_num'])
+event_pos = np.searchsorted(quarter_nums, events['quarter_num'].astype(int).to_numpy())
+E_events = event_period_matrix(event_pos, len(quarter_nums))
+print(f"  ✓ Geolocated events in panel window: {len(events)} (of {len(emdat)})")
+
+# === STEP 3: Kernel exposure ===
+print(f"\n[3/4] Computing kernel-weighted exposure...")
+t_start = time.perf_counter()
+valid = row_pos >= 0
+for kernel, bandwidth in KERNEL_SPECS:
+    t0 = time.perf_counter()
+    K_districts = distance_decay_matrix(lon, lat, lon, lat, kernel, bandwidth, exclude_self=True)
+    K_events = distance_decay_matrix(lon, lat, events['Longitude'].to_numpy(),
+                                     events['Latitude'].to_numpy(), kernel, bandwidth)
+
+    results = {source: np.asarray(K_districts @ E) for source, E in matrices.items()}
+    results['events'] = (K_events @ E_events).toarray()
+
+    for source, decay in results.items():
+        values = np.full(len(panel), np.nan)
+        values[valid] = decay[row_pos[valid], col_pos[valid]]
+        panel[f'flood_decay_{kernel}{bandwidth}km_{source}_qt'] = values
+
+    print(f"  ✓ {kernel:<8} {bandwidth:>4} km: {K_districts.nnz:,} district pairs, "
+          f"{K_events.nnz:,} event pairs ({(time.perf_counter() - t0)*1000:.0f} ms)")
+print(f"  ✓ All kernels: {(time.perf_counter() - t_start):.2f}s")
+
+# === STEP 4: Save ===
+print(f"\n[4/4] Saving flood exposure panel...")
+panel_path = write_dataset(panel, PANEL_DATASET)
+decay_cols = [c for c in panel.columns if c.startswith('flood_decay_')]
+print(f"  ✓ Saved: {panel_path}")
+print(f"  ✓ Columns added: {len(decay_cols)}")
+for col in decay_cols:
+    print(f"     - {col} (non-zero: {(panel[col] > 0).mean()*100:.1f}%)")
+
+print("="*70)
+print("DISTANCE-DECAY EXPOSURE COMPLETE")
+print("="*70)
+print("\nNEXT STEP: Re-run Script 14 to carry decay exposure into the master panel")
+print("="*70)
@@ -0,0 +1,102 @@
+"""
+Script 33: Flood Event Study (Leads and Lags)
+Phase 4 - Relative-time effects of floods on deposits and lights, -8..+8 quarters
+"""
+
+import pandas as pd
+
+from panel_keys import load_registry, attach_keys
+from event_study import add_event_time, event_study, EVENT_WINDOW, REFERENCE
+from data_store import read_dataset
+
+print("=" * 70)
+print("PHASE 4: FLOOD EVENT STUDY (Leads and Lags)")
+print("=" * 70)
+print()
+
+OUTCOMES = ['deposit_change_qt', 'lights_change_qt']
+
+# ============================================================================
+# STEP 1: Load data
+# ============================================================================
+print("[1/5] Loading regression panel and flood timeline...")
+registry = load_registry()
+df = attach_keys(read_dataset('regression_panel_final'), registry)
+floods = attach_keys(read_dataset('flood_exposure_panel'), registry)  # all quarters, incl. the 2016Q3-2017Q1 gap
+print(f"  ✓ Regression panel: {len(df):,} rows")
+print(f"  ✓ Flood timeline: {len(floods):,} district-quarters, "
+      f"{int((floods['flood_exposure_ruleA_qt'] > 0).sum()):,} Rule A flood quarters")
+print()
+
+# ============================================================================
+# STEP 2: Relative-time indicators
+# ============================================================================
+print("[2/5] Building relative-time indicators...")
+
+# Counts of floods at each relative time (repeated events add up), endpoints binned
+df, event_cols = add_event_time(df, events=floods, treatment='flood_exposure_ruleA_qt',
+                                window=EVENT_WINDOW, reference=REFERENCE)
+events_per_district = floods.groupby('district_id')['flood_exposure_ruleA_qt'].apply(lambda s: int((s > 0).sum()))
+
+print(f"  ✓ Window: {EVENT_WINDOW[0]}..+{EVENT_WINDOW[1]} quarters (endpoints binned), reference k = {REFERENCE}")
+print(f"  ✓ Districts with ≥1 flood: {(events_per_district > 0).sum()}, with ≥2: {(events_per_district > 1).sum()}")
+print(f"  ✓ {len(event_cols)} indicator columns")
+print()
+
+# ============================================================================
+# STEP 3: Estimate
+# ============================================================================
+print("[3/5] Estimating event studies (district + quarter FE, district-clustered SEs)...")
+
+tables, pretrends, results = [], {}, {}
+for outcome in OUTCOMES:
+    table, result, pretrend = event_study(df, outcome, event_cols, fe=['district_id', 'quarter_id'],
+                                          vcov='cluster')
+    tables.append(table)
+    pretrends[outcome] = pretrend
+    results[outcome] = result
+    print(f"  ✓ {outcome}: N = {result.nobs:,}, pre-trend F({pretrend['df_num']}, {pretrend['df_den']}) = "
+          f"{pretrend['F']:.3f}, p = {pretrend['p_value']:.4f}")
+print()
+
+# ============================================================================
+# STEP 4: Results
+# ============================================================================
+print("[4/5] Event-study coefficients...")
+print()
+event_table = pd.concat(tables, ignore_index=True)
+for outcome in OUTCOMES:
+    print(f"  [{outcome}]")
+    print(event_table.loc[event_table['outcome'] == outcome,
+                          ['rel_time', 'coefficient', 'std_error', 'ci_lower', 'ci_upper', 'p_value', 'n_cells']]
+          .to_string(index=False, float_format=lambda v: f"{v:.5f}"))
+    print()
+
+# ============================================================================
+# STEP 5: Save outputs
+# ============================================================================
+print("[5/5] Saving outputs...")
+
+# Plot-ready: one row per outcome × relative time, reference period at zero
+event_table.to_csv('05_Outputs/Tables/07_event_study.csv', index=False)
+
+with open('05_Outputs/Logs/33_event_study.txt', 'w', encoding='utf-8') as f:
+    f.write("=" * 70 + "\n")
+    f.write("FLOOD EVENT STUDY (Rule A, relative time -8..+8)\n")
+    f.write("=" * 70 + "\n\n")
+    f.write(f"Reference period: k = {REFERENCE}; endpoints binned (k ≤ {EVENT_WINDOW[0]}, k ≥ {EVENT_WINDOW[1]})\n")
+    f.write("Indicators count events, so repeated floods in a district add up\n\n")
+    for outcome in OUTCOMES:
+        pretrend = pretrends[outcome]
+        f.write(f"[{outcome}]\n")
+        f.write(f"N observations: {results[outcome].nobs:,}\n")
+        f.write(f"Pre-trend joint test (leads k < {REFERENCE}): F({pretrend['df_num']}, {pretrend['df_den']}) = "
+                f"{pretrend['F']:.3f}, p = {pretrend['p_value']:.4f}\n")
+        f.write(results[outcome].summary() + "\n\n")
+
+print("=" * 70)
+print("EVENT STUDY COMPLETE")
+print("=" * 70)
+print(f"Table: 05_Outputs/Tables/07_event_study.csv")
+print(f"Log:   05_Outputs/Logs/33_event_study.txt")
+print("=" * 70)
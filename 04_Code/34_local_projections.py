@@ -0,0 +1,84 @@
+"""
+Script 34: Local-Projection Impulse Responses to Floods
+Phase 4 - Cumulative deposit and lights responses 0-8 quarters after a flood
+"""
+
+import pandas as pd
+
+from panel_keys import load_registry, attach_keys
+from local_projections import local_projections, HORIZONS, SHOCK_LAGS, OUTCOME_LAGS
+from data_store import read_dataset
+
+print("=" * 70)
+print("PHASE 4: LOCAL PROJECTIONS (Flood Impulse Responses)")
+print("=" * 70)
+print()
+
+OUTCOMES = ['log_deposits', 'log_lights_qt']
+SHOCK = 'flood_exposure_ruleA_qt'
+
+# ============================================================================
+# STEP 1: Load data
+# ============================================================================
+print("[1/4] Loading regression panel...")
+df = attach_keys(read_dataset('regression_panel_final'), load_registry())
+print(f"  ✓ Loaded: {len(df):,} rows, {df['district_id'].nunique()} districts")
+print()
+
+# ============================================================================
+# STEP 2: Estimate impulse responses
+# ============================================================================
+print("[2/4] Estimating local projections (district + quarter FE, district-clustered SEs)...")
+print(f"  Response: log y(t+h) - log y(t-1), h = {min(HORIZONS)}..{max(HORIZONS)}")
+print(f"  Controls: {SHOCK_LAGS} flood lags, {OUTCOME_LAGS} lags of each outcome's growth")
+
+tables, all_results = [], {}
+for sample in ['common', 'horizon']:
+    table, results = local_projections(df, OUTCOMES, SHOCK, sample=sample)
+    tables.append(table)
+    all_results[sample] = results
+    n_min, n_max = table['nobs'].min(), table['nobs'].max()
+    print(f"  ✓ {sample} sample: N = {n_min:,}" + (f"-{n_max:,}" if n_max > n_min else "") + " per projection")
+print()
+
+lp_table = pd.concat(tables, ignore_index=True)
+
+# ============================================================================
+# STEP 3: Results
+# ============================================================================
+print("[3/4] Impulse responses...")
+print()
+for outcome in OUTCOMES:
+    view = lp_table[lp_table['outcome'] == outcome].pivot(index='horizon', columns='sample',
+                                                          values=['coefficient', 'std_error'])
+    view.columns = [f"{stat}_{sample}" for stat, sample in view.columns]
+    print(f"  [{outcome}]")
+    print(view.to_string(float_format=lambda v: f"{v:.5f}"))
+    print()
+
+# ============================================================================
+# STEP 4: Save outputs
+# ============================================================================
+print("[4/4] Saving outputs...")
+
+lp_table.to_csv('05_Outputs/Tables/08_local_projections.csv', index=False)
+
+with open('05_Outputs/Logs/34_local_projections.txt', 'w', encoding='utf-8') as f:
+    f.write("=" * 70 + "\n")
+    f.write("LOCAL PROJECTIONS: FLOOD IMPULSE RESPONSES (Rule A)\n")
+    f.write("=" * 70 + "\n\n")
+    f.write(f"Response: log y(t+h) - log y(t-1), h = {min(HORIZONS)}..{max(HORIZONS)}\n")
+    f.write(f"Controls: flood lags 1-{SHOCK_LAGS}, growth lags 1-{OUTCOME_LAGS} of {', '.join(OUTCOMES)}\n")
+    f.write("common:  all horizons on the rows where every lead is observed\n")
+    f.write("horizon: each horizon on its own complete rows\n\n")
+    f.write(lp_table.to_string(index=False, float_format=lambda v: f"{v:.6f}") + "\n\n")
+    for outcome in OUTCOMES:
+        f.write(f"[{outcome}, h = {max(HORIZONS)}, common sample]\n")
+        f.write(all_results['common'][(outcome, max(HORIZONS))].summary() + "\n\n")
+
+print("=" * 70)
+print("LOCAL PROJECTIONS COMPLETE")
+print("=" * 70)
+print(f"Table: 05_Outputs/Tables/08_local_projections.csv")
+print(f"Log:   05_Outputs/Logs/34_local_projections.txt")
+print("=" * 70)
@@ -0,0 +1,103 @@
+"""
+analytics_db.py - Local DuckDB database with views over the pipeline outputs
+
+Every dataset in data_store.DATASETS, plus the crosswalk / registry tables and
+the RBI population-group panel, is registered as a view in
+
+    02_Data_Intermediate/analytics.duckdb
+
+Views read the Parquet file (or the CSV copy if no Parquet exists yet) at
+query time, so they never go stale and nothing is copied into the database;
+DuckDB only scans the columns and row groups a query touches. Views are
+re-registered on every connect(), which picks up new datasets and moved
+checkouts.
+
+Usage:
+    from analytics_db import query
+    query("SELECT state_gadm, avg(deposits IS NOT NULL) FROM master_panel_raw GROUP BY 1")
+
+    python 04_Code/analytics_db.py                      # (re)build views and list them
+    python 04_Code/analytics_db.py "SELECT ... FROM ..." # run one query and print it
+"""
+
+import os
+import sys
+import duckdb
+
+from data_store import DATASETS, dataset_path
+
+DB_PATH = '02_Data_Intermediate/analytics.duckdb'
+
+# Tables outside the typed store (hand-maintained or text-heavy files)
+EXTRA_TABLES = {
+    'district_registry': '02_Data_Intermediate/district_registry.csv',
+    'district_crosswalk': '02_Data_Intermediate/district_crosswalk_draft.csv',
+    'emdat_district_matches': '02_Data_Intermediate/emdat_district_matches.csv',
+    'emdat_districts_parsed': '02_Data_Intermediate/emdat_districts_parsed.csv',
+    'crosswalk_store': '02_Data_Intermediate/crosswalk_store.csv',
+}
+
+
+def table_sources():
+    """View name → file backing it (Parquet preferred), for files that exist."""
+    sources = {}
+    for name in DATASETS:
+        for fmt in ('parquet', 'csv'):
+            path = dataset_path(name, fmt)
+            if os.path.exists(path):
+                sources[name] = path
+                break
+    for name, path in EXTRA_TABLES.items():
+        if os.path.exists(path):
+            sources[name] = path
+    return sources
+
+
+def _reader(path):
+    path = os.path.abspath(path).replace("'", "''")
+    if path.endswith('.parquet'):
+        return f"read_parquet('{path}')"
+    return f"read_csv_auto('{path}', header=true)"
+
+
+def refresh_views(con):
+    """Create or replace one view per table file; returns the registered names."""
+    sources = table_sources()
+    for name, path in sources.items():
+        con.execute(f'CREATE OR REPLACE VIEW "{name}" AS SELECT * FROM {_reader(path)}')
+    return sorted(sources)
+
+
+def connect(path=DB_PATH, read_only=False):
+    """Open the analytics database with views registered (in-memory if path is None)."""
+    if path is None:
+        con = duckdb.connect()
+    else:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        con = duckdb.connect(path, read_only=read_only)
+    if not read_only:
+        refresh_views(con)
+    return con
+
+
+def query(sql, params=None, con=None):
+    """Run one SQL statement and return a pandas DataFrame."""
+    own = con is None
+    con = connect() if own else con
+    try:
+        return con.execute(sql, params or []).df()
+    finally:
+        if own:
+            con.close()
+
+
+if __name__ == '__main__':
+    con = connect()
+    if len(sys.argv) > 1:
+        print(con.execute(' '.join(sys.argv[1:])).df().to_string(index=False))
+    else:
+        for name in refresh_views(con):
+            n = con.execute(f'SELECT count(*) FROM "{name}"').fetchone()[0]
+            print(f"  ✓ {name:<28} {n:>8,} rows")
+        print(f"  ✓ Database: {DB_PATH}")
+    con.close()
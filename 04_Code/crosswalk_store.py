@@ -0,0 +1,166 @@
+"""
+crosswalk_store.py - Persistent name → GADM crosswalk with a manual override layer
+
+The store keeps every (source, state, name) that has ever been matched,
+together with score, scope and the vintage it was first seen in. Each run
+only scores names that are not in the store yet, so rerun cost scales with
+the number of new names. Manual fixes live in a separate, hand-edited
+overrides file and always win over fuzzy matches.
+
+Files:
+  - 02_Data_Intermediate/crosswalk_store.csv   (machine-maintained, append-only)
+  - 00_Admin/crosswalk_overrides.csv           (human-maintained)
+
+Overrides columns: source, state_source, name_source, district_gadm, state_gadm, note
+  - source is 'rbi' or 'emdat'; state_source may be blank (EM-DAT tokens carry no state)
+  - a blank district_gadm records an explicit "no GADM match"
+"""
+
+import os
+from datetime import date
+import numpy as np
+import pandas as pd
+
+from district_matching import normalize_name
+
+STORE_PATH = '02_Data_Intermediate/crosswalk_store.csv'
+OVERRIDES_PATH = '00_Admin/crosswalk_overrides.csv'
+
+KEY_COLS = ['source', 'state_key', 'name_key']
+STORE_COLS = [
+    'source', 'state_source', 'name_source', 'state_key', 'name_key',
+    'district_gadm', 'state_gadm', 'score', 'matched', 'match_scope',
+    'vintage', 'added_on'
+]
+OVERRIDE_COLS = ['source', 'state_source', 'name_source', 'district_gadm', 'state_gadm', 'note']
+
+
+def add_keys(df, state_col='state_source', name_col='name_source'):
+    """Attach normalised state/name join keys."""
+    df = df.copy()
+    df['state_key'] = df[state_col].map(normalize_name)
+    df['name_key'] = df[name_col].map(normalize_name)
+    return df
+
+
+def load_store(path=STORE_PATH):
+    """Load the persistent store (empty frame with the right columns if absent)."""
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=STORE_COLS)
+    store = pd.read_csv(path, keep_default_na=False, na_values=[''])
+    store['state_key'] = store['state_key'].fillna('')
+    store['matched'] = store['matched'].astype(bool)
+    return store[STORE_COLS]
+
+
+def save_store(store, path=STORE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    store.sort_values(KEY_COLS).to_csv(path, index=False)
+
+
+def load_overrides(path=OVERRIDES_PATH):
+    """Load manual overrides keyed like the store."""
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=OVERRIDE_COLS + ['state_key', 'name_key'])
+    overrides = pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[''])
+    overrides['source'] = overrides['source'].str.strip().str.lower()
+    overrides = add_keys(overrides)
+    dupes = overrides.duplicated(KEY_COLS, keep='last')
+    if dupes.any():
+        print(f"   ⚠ {dupes.sum()} duplicate override keys; last entry wins")
+    return overrides[~dupes]
+
+
+def update_store(store, queries, matcher, source, vintage, valid_gadm=None, **match_kwargs):
+    """
+    Match only queries whose (source, state, name) key is not yet in the store.
+
+    queries: DataFrame with state_source, name_source (state may be None)
+    valid_gadm: optional set of (district_gadm, state_gadm) in the current GADM;
+                stored matches pointing outside it are treated as stale and rematched.
+    Stored fuzzy matches of this source scoring below the current `threshold`
+    (when passed through to the matcher) are rematched as well.
+    Returns (store, n_new).
+    """
+    queries = add_keys(queries.assign(source=source)).drop_duplicates(KEY_COLS)
+
+    if valid_gadm is not None and len(store) > 0:
+        pairs = list(zip(store['district_gadm'], store['state_gadm']))
+        stale = store['matched'] & ~pd.Series([p in valid_gadm for p in pairs], index=store.index)
+        if stale.any():
+            print(f"   ⚠ {stale.sum()} stored matches no longer in GADM; rematching")
+            store = store[~stale]
+
+    threshold = match_kwargs.get('threshold')
+    if threshold is not None and len(store) > 0:
+        weak = ((store['source'] == source) & store['matched']
+                & store['match_scope'].isin(['state', 'all_india']) & (store['score'] < threshold))
+        if weak.any():
+            print(f"   ⚠ {weak.sum()} stored fuzzy matches below threshold {threshold}; rematching")
+            store = store[~weak]
+
+    known = pd.MultiIndex.from_frame(store[KEY_COLS]) if len(store) > 0 else None
+    if known is not None:
+        is_new = ~pd.MultiIndex.from_frame(queries[KEY_COLS]).isin(known)
+        new = queries[is_new]
+    else:
+        new = queries
+    if len(new) == 0:
+        return store, 0
+
+    result = matcher.match(new['name_source'], new['state_source'], **match_kwargs)
+    added = pd.DataFrame({
+        'source': source,
+        'state_source': new['state_source'].to_numpy(),
+        'name_source': new['name_source'].to_numpy(),
+        'state_key': new['state_key'].to_numpy(),
+        'name_key': new['name_key'].to_numpy(),
+        'district_gadm': result['district_match'].to_numpy(),
+        'state_gadm': result['state_match'].to_numpy(),
+        'score': result['score'].round(2).to_numpy(),
+        'matched': result['matched'].to_numpy(),
+        'match_scope': result['match_scope'].to_numpy(),
+        'vintage': vintage,
+        'added_on': date.today().isoformat(),
+    })
+    store = pd.concat([store, added], ignore_index=True) if len(store) > 0 else added
+    return store, len(added)
+
+
+def resolve(store, overrides, source):
+    """
+    Final crosswalk for one source: fuzzy matches from the store with overrides applied.
+    Adds match_method: 'override', 'key_<type>' (exact/alias/folded/phonetic),
+    'fuzzy_state', 'fuzzy_all_india' or 'unmatched'.
+    """
+    resolved = store[store['source'] == source].copy()
+    scope = resolved['match_scope'].astype(str)
+    resolved['match_method'] = np.where(
+        ~resolved['matched'], 'unmatched',
+        np.where(scope.isin(['state', 'all_india']), 'fuzzy_' + scope, 'key_' + scope)
+    )
+
+    src_overrides = overrides[overrides['source'] == source]
+    if len(src_overrides) > 0:
+        resolved = resolved.merge(
+            src_overrides[['state_key', 'name_key', 'district_gadm', 'state_gadm']],
+            on=['state_key', 'name_key'], how='left', suffixes=('', '_override'), indicator=True
+        )
+        # EM-DAT overrides may omit the state: fall back to a name-only key
+        stateless = src_overrides[src_overrides['state_key'] == '']
+        if len(stateless) > 0:
+            by_name = stateless.set_index('name_key')
+            fill = (resolved['_merge'] == 'left_only') & resolved['name_key'].isin(by_name.index)
+            resolved.loc[fill, 'district_gadm_override'] = resolved.loc[fill, 'name_key'].map(by_name['district_gadm'])
+            resolved.loc[fill, 'state_gadm_override'] = resolved.loc[fill, 'name_key'].map(by_name['state_gadm'])
+            resolved.loc[fill, '_merge'] = 'both'
+
+        hit = resolved['_merge'] == 'both'
+        resolved.loc[hit, 'district_gadm'] = resolved.loc[hit, 'district_gadm_override']
+        resolved.loc[hit, 'state_gadm'] = resolved.loc[hit, 'state_gadm_override']
+        resolved.loc[hit, 'matched'] = resolved.loc[hit, 'district_gadm'].notna()
+        resolved.loc[hit, 'match_method'] = 'override'
+        resolved = resolved.drop(columns=['district_gadm_override', 'state_gadm_override', '_merge'])
+
+    resolved['matched'] = resolved['matched'].astype(bool)
+    return resolved.reset_index(drop=True)
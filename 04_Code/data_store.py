@@ -0,0 +1,281 @@
+"""
+data_store.py - Typed columnar storage for the intermediate and clean panels
+
+Each dataset has a fixed location and an explicit column schema. Writes cast
+every column to its schema dtype and fail on anything that would not survive
+the cast (text in an integer column, NaN in a key, out-of-range values), so a
+dataset always reads back with the same dtypes: `q` is int8 everywhere,
+never 'Q1' in one file and 1 in another.
+
+Storage is Parquet (pyarrow): column projection and row filters are pushed
+down to the file, and categoricals (district/state names, quarter labels)
+round-trip as dictionary columns. A CSV copy is written next to each Parquet
+file for sharing and for the CSVs the repo ships (EXPORT_CSV); reads always
+prefer Parquet and fall back to the CSV only if the Parquet file is absent.
+
+Usage:
+    df = read_dataset('regression_panel_final', columns=['district_id', 'quarter_id', 'deposits'],
+                      filters=[('year', '>=', 2018)])
+    write_dataset(df, 'analysis_panel_final')
+
+    python 04_Code/data_store.py convert          # CSV → Parquet for every dataset present
+    python 04_Code/data_store.py export <name>    # Parquet → CSV
+"""
+
+import os
+import sys
+import numpy as np
+import pandas as pd
+
+INTERMEDIATE_DIR = '02_Data_Intermediate'
+CLEAN_DIR = '03_Data_Clean'
+
+# Keep a CSV copy of every dataset written (the repo tracks these for sharing)
+EXPORT_CSV = True
+
+# Integer/category dtypes for key and time columns shared by all panels
+KEY_SCHEMA = {
+    'district_id': 'int32',
+    'district_gadm': 'category',
+    'state_gadm': 'category',
+    'year': 'int16',
+    'q': 'int8',
+    'quarter': 'category',
+    'quarter_num': 'int16',
+    'quarter_id': 'int16',
+}
+FLOOD_SCHEMA = {
+    'flood_exposure_ruleA_qt': 'int8',
+    'flood_exposure_ruleB_qt': 'int8',
+}
+VIIRS_SCHEMA = {
+    'mean_radiance': 'float64',
+    'pixel_count': 'float64',  # NaN where a district-quarter has no VIIRS
+}
+
+# name → directory, required columns, typed columns, dtype for any other column
+# ('float64': extra columns must be numeric; None: no extra columns allowed)
+DATASETS = {
+    'district_quarter_skeleton': {
+        'dir': INTERMEDIATE_DIR,
+        'required': ['district_gadm', 'state_gadm', 'year', 'q', 'quarter'],
+        'schema': KEY_SCHEMA,
+        'extra': None,
+    },
+    'flood_exposure_panel': {
+        'dir': INTERMEDIATE_DIR,
+        'required': ['district_gadm', 'state_gadm', 'quarter', *FLOOD_SCHEMA],
+        'schema': {**KEY_SCHEMA, **FLOOD_SCHEMA},
+        'extra': 'float64',  # flood_nbr_* / flood_decay_* from Scripts 31-32
+    },
+    'rbi_deposits_panel': {
+        'dir': INTERMEDIATE_DIR,
+        'required': ['district_gadm', 'state_gadm', 'quarter', 'deposits'],
+        'schema': {**KEY_SCHEMA, 'district_rbi': 'string', 'state_rbi': 'string'},
+        'extra': 'float64',
+    },
+    'rbi_metrics_panel': {
+        'dir': INTERMEDIATE_DIR,
+        'required': ['district_gadm', 'state_gadm', 'quarter', 'metric', 'value'],
+        'schema': {**KEY_SCHEMA, 'metric': 'category', 'value': 'float64'},
+        'extra': None,
+    },
+    'rbi_popgroup_panel': {
+        'dir': INTERMEDIATE_DIR,
+        'required': ['district_gadm', 'state_gadm', 'population_group', 'quarter', 'deposits'],
+        'schema': {**KEY_SCHEMA, 'population_group': 'category'},
+        'extra': 'float64',
+    },
+    'master_panel_raw': {
+        'dir': INTERMEDIATE_DIR,
+        'required': ['district_gadm', 'state_gadm', 'quarter', *FLOOD_SCHEMA],
+        'schema': {**KEY_SCHEMA, **FLOOD_SCHEMA},
+        'extra': 'float64',
+    },
+    'master_panel_analysis': {
+        'dir': INTERMEDIATE_DIR,
+        'required': ['district_gadm', 'state_gadm', 'quarter', *FLOOD_SCHEMA],
+        'schema': {**KEY_SCHEMA, **FLOOD_SCHEMA},
+        'extra': 'float64',
+    },
+    'master_panel_viirs_test': {
+        'dir': INTERMEDIATE_DIR,
+        'required': ['district_gadm', 'state_gadm', 'quarter', 'mean_radiance'],
+        'schema': {**KEY_SCHEMA, **FLOOD_SCHEMA, **VIIRS_SCHEMA},
+        'extra': 'float64',
+    },
+    'viirs_monthly_panel': {
+        'dir': INTERMEDIATE_DIR,
+        'required': ['gadm_district', 'gadm_state', 'year', 'month', 'mean_radiance'],
+        'schema': {
+            'gadm_district': 'category', 'gadm_state': 'category', 'district_id': 'int32',
+            'year': 'int16', 'month': 'int8', 'month_id': 'int16',
+            'mean_radiance': 'float64', 'pixel_count': 'int32',
+        },
+        'extra': None,
+    },
+    'viirs_quarterly_panel': {
+        'dir': INTERMEDIATE_DIR,
+        'required': ['gadm_district', 'gadm_state', 'year', 'q', 'quarter', 'mean_radiance'],
+        'schema': {
+            'gadm_district': 'category', 'gadm_state': 'category',
+            **{k: v for k, v in KEY_SCHEMA.items() if k not in ('district_gadm', 'state_gadm')},
+            'mean_radiance': 'float64', 'pixel_count': 'int32',
+        },
+        'extra': None,
+    },
+    'analysis_panel_final': {
+        'dir': CLEAN_DIR,
+        'required': ['district_gadm', 'state_gadm', 'quarter', 'deposits', 'mean_radiance'],
+        'schema': {**KEY_SCHEMA, **FLOOD_SCHEMA, **VIIRS_SCHEMA},
+        'extra': 'float64',
+    },
+    'regression_panel_final': {
+        'dir': CLEAN_DIR,
+        'required': ['district_gadm', 'state_gadm', 'quarter', 'deposit_change_qt', 'lights_change_qt'],
+        'schema': {**KEY_SCHEMA, **FLOOD_SCHEMA, **VIIRS_SCHEMA},
+        'extra': 'float64',
+    },
+}
+
+_FILTER_OPS = {
+    '==': lambda s, v: s == v, '=': lambda s, v: s == v, '!=': lambda s, v: s != v,
+    '<': lambda s, v: s < v, '<=': lambda s, v: s <= v,
+    '>': lambda s, v: s > v, '>=': lambda s, v: s >= v,
+    'in': lambda s, v: s.isin(v), 'not in': lambda s, v: ~s.isin(v),
+}
+
+
+def dataset_path(name, fmt='parquet'):
+    """File path of a dataset ('parquet' or 'csv')."""
+    spec = _spec(name)
+    return os.path.join(spec['dir'], f'{name}.{fmt}')
+
+
+def _spec(name):
+    if name not in DATASETS:
+        raise KeyError(f"Unknown dataset '{name}' (known: {sorted(DATASETS)})")
+    return DATASETS[name]
+
+
+def _cast(series, dtype, name, col):
+    """Cast one column, refusing casts that would change or drop values."""
+    if dtype == 'category':
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            return series
+        # Sorted, ordered categories: 'YYYYQn' labels sort chronologically, so min/max work
+        return series.astype(pd.CategoricalDtype(sorted(series.dropna().unique()), ordered=True))
+    if dtype == 'string':
+        return series.astype('string')
+    if series.dtype == object or pd.api.types.is_string_dtype(series.dtype):
+        numeric = pd.to_numeric(series, errors='coerce')
+        if (numeric.isna() & series.notna()).any():
+            bad = series[numeric.isna() & series.notna()].unique()[:3]
+            raise TypeError(f"{name}.{col}: non-numeric values {list(bad)} for dtype {dtype}")
+        series = numeric
+    if np.issubdtype(np.dtype(dtype), np.integer):
+        if series.isna().any():
+            raise TypeError(f"{name}.{col}: {int(series.isna().sum())} missing values in {dtype} column")
+        info = np.iinfo(np.dtype(dtype))
+        if len(series) > 0 and (series.min() < info.min or series.max() > info.max):
+            raise TypeError(f"{name}.{col}: values outside {dtype} range")
+        cast = series.astype(dtype)
+        if not np.array_equal(cast.to_numpy(np.float64), series.to_numpy(np.float64)):
+            raise TypeError(f"{name}.{col}: non-integer values in {dtype} column")
+        return cast
+    return series.astype(dtype)
+
+
+def conform(df, name, strict=True):
+    """
+    Cast `df` to the dataset schema. strict (used on write) also requires the
+    required columns and rejects extra columns the schema does not allow.
+    """
+    spec = _spec(name)
+    if strict:
+        missing = [c for c in spec['required'] if c not in df.columns]
+        if missing:
+            raise ValueError(f"{name}: missing required columns {missing}")
+    out = {}
+    for col in df.columns:
+        if col in spec['schema']:
+            out[col] = _cast(df[col], spec['schema'][col], name, col)
+        elif spec['extra'] is not None:
+            out[col] = _cast(df[col], spec['extra'], name, col)
+        elif strict:
+            raise ValueError(f"{name}: column '{col}' is not in the schema")
+        else:
+            out[col] = df[col]
+    return pd.DataFrame(out, index=df.index)
+
+
+def _apply_filters(df, filters):
+    """Row filters in pyarrow's [(col, op, value), ...] form, for the CSV fallback."""
+    if not filters:
+        return df
+    keep = np.ones(len(df), dtype=bool)
+    for col, op, value in filters:
+        keep &= _FILTER_OPS[op](df[col], value).to_numpy(dtype=bool)
+    return df[keep].reset_index(drop=True)
+
+
+def read_dataset(name, columns=None, filters=None):
+    """
+    Read a dataset with its schema dtypes. `columns` projects, `filters` is a
+    pyarrow-style list of (column, op, value) tuples applied at read time.
+    """
+    parquet_path = dataset_path(name, 'parquet')
+    if os.path.exists(parquet_path):
+        df = pd.read_parquet(parquet_path, columns=columns, filters=filters)
+        return conform(df, name, strict=False)
+
+    csv_path = dataset_path(name, 'csv')
+    if not os.path.exists(csv_path):
+        raise FileNotFoundError(f"{name}: neither {parquet_path} nor {csv_path} exists")
+    filter_cols = [c for c, _, _ in filters or []]
+    usecols = None if columns is None else list(dict.fromkeys(list(columns) + filter_cols))
+    df = conform(pd.read_csv(csv_path, usecols=usecols), name, strict=False)
+    df = _apply_filters(df, filters)
+    return df if columns is None else df[list(columns)]
+
+
+def write_dataset(df, name, csv=None):
+    """Validate against the schema and write Parquet (plus the CSV copy if enabled)."""
+    df = conform(df.reset_index(drop=True), name, strict=True)
+    parquet_path = dataset_path(name, 'parquet')
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    tmp_path = parquet_path + '.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, parquet_path)
+    if EXPORT_CSV if csv is None else csv:
+        df.to_csv(dataset_path(name, 'csv'), index=False)
+    return parquet_path
+
+
+def export_csv(name, path=None):
+    """Write a CSV copy of a stored dataset."""
+    path = path or dataset_path(name, 'csv')
+    read_dataset(name).to_csv(path, index=False)
+    return path
+
+
+def convert_all():
+    """Build Parquet files from the CSVs present (one-off migration)."""
+    for name in DATASETS:
+        csv_path = dataset_path(name, 'csv')
+        if not os.path.exists(csv_path):
+            continue
+        df = conform(pd.read_csv(csv_path), name, strict=False)
+        write_dataset(df, name, csv=False)
+        print(f"  ✓ {name}: {len(df):,} rows → {dataset_path(name)}")
+
+
+if __name__ == '__main__':
+    command = sys.argv[1] if len(sys.argv) > 1 else 'convert'
+    if command == 'convert':
+        convert_all()
+    elif command == 'export' and len(sys.argv) > 2:
+        print(f"  ✓ {export_csv(sys.argv[2])}")
+    else:
+        print("Usage: python 04_Code/data_store.py [convert | export <dataset>]")
+        sys.exit(1)
@@ -0,0 +1,182 @@
+"""
+district_lineage.py - Apportion source-district panels onto fixed GADM 4.1 districts
+
+Districts reported by RBI change over time: new districts are carved out of
+GADM parents (Telangana 2016, Andhra Pradesh 2022, Rajasthan 2023, ...) and
+some names are reused for smaller successor units. A name-only crosswalk
+therefore merges or drops units inconsistently across quarters.
+
+The lineage table lists, for each source unit, the GADM district(s) it falls
+in, the share of the source unit assigned to each, and the quarters in which
+the row is effective:
+
+    00_Admin/district_lineage.csv
+    state_source, name_source, state_gadm, district_gadm, share, approximate,
+    effective_from, effective_to, note
+
+`approximate` marks rows that assign a unit carved from several GADM
+parents wholly to its primary parent (share 1.0 where area shares are not
+yet known); load_lineage(include_approximate=False) drops them, leaving those
+source units unmapped in their effective quarters.
+
+Blank effective_from / effective_to are open-ended. For each period the
+lineage rows active in that period replace the crosswalk mapping of the same
+source unit; every other matched source unit maps 1:1 via the crosswalk. This
+gives a sparse (source-unit × GADM-unit) apportionment matrix A_t, and the
+GADM panel is A_t.T @ X_t for the source values X_t. Periods between two
+lineage breakpoints share one matrix, so only a handful of matrices are built
+for the whole 2004-2024 panel.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from district_matching import normalize_name
+
+LINEAGE_PATH = '00_Admin/district_lineage.csv'
+LINEAGE_COLS = [
+    'state_source', 'name_source', 'state_gadm', 'district_gadm', 'share', 'approximate',
+    'effective_from', 'effective_to', 'note'
+]
+
+# Open-ended effective windows
+_MIN_PERIOD = np.iinfo(np.int32).min
+_MAX_PERIOD = np.iinfo(np.int32).max
+
+
+def quarter_index(quarter):
+    """'2016Q4' → year * 4 + (q - 1); blank/NaN → None."""
+    if quarter is None or (isinstance(quarter, float) and np.isnan(quarter)) or str(quarter).strip() == '':
+        return None
+    year, q = str(quarter).upper().split('Q')
+    return int(year) * 4 + int(q) - 1
+
+
+def load_lineage(path=LINEAGE_PATH, include_approximate=True):
+    """
+    Load the lineage table with normalised keys and integer period bounds.
+    include_approximate=False drops primary-parent approximations of
+    multi-parent carve-outs.
+    """
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=LINEAGE_COLS + ['state_key', 'district_key', 'period_from', 'period_to'])
+    lineage = pd.read_csv(path, dtype=str, keep_default_na=False, na_values=[''])
+    lineage['share'] = lineage['share'].fillna('1').astype(float)
+    approximate = lineage['approximate'] if 'approximate' in lineage.columns else pd.Series('', index=lineage.index)
+    lineage['approximate'] = approximate.fillna('').str.strip().str.upper().isin(['TRUE', '1', 'YES'])
+    if not include_approximate:
+        lineage = lineage[~lineage['approximate']].reset_index(drop=True)
+    lineage['state_key'] = lineage['state_source'].map(normalize_name)
+    lineage['district_key'] = lineage['name_source'].map(normalize_name)
+    lineage['period_from'] = [
+        _MIN_PERIOD if (p := quarter_index(q)) is None else p for q in lineage['effective_from']
+    ]
+    lineage['period_to'] = [
+        _MAX_PERIOD if (p := quarter_index(q)) is None else p for q in lineage['effective_to']
+    ]
+
+    # Shares of one source unit within one window should sum to 1
+    totals = lineage.groupby(['state_key', 'district_key', 'period_from', 'period_to'])['share'].sum()
+    off = totals[(totals - 1.0).abs() > 1e-6]
+    if len(off) > 0:
+        print(f"   ⚠ {len(off)} lineage source units have shares not summing to 1")
+    return lineage
+
+
+def lineage_breakpoints(lineage, periods):
+    """
+    Split sorted periods into regimes with a constant set of active lineage rows.
+    Returns list of (period_positions, active_lineage_rows).
+    """
+    periods = np.asarray(periods)
+    active = np.zeros((len(lineage), len(periods)), dtype=bool)
+    if len(lineage) > 0:
+        lo = lineage['period_from'].to_numpy()[:, None]
+        hi = lineage['period_to'].to_numpy()[:, None]
+        active = (periods[None, :] >= lo) & (periods[None, :] <= hi)
+
+    # Periods with identical activity columns share a regime
+    _, regime_of = np.unique(active.T, axis=0, return_inverse=True)
+    regime_of = np.asarray(regime_of).ravel()
+    regimes = []
+    for r in np.unique(regime_of):
+        cols = np.flatnonzero(regime_of == r)
+        regimes.append((cols, lineage[active[:, cols[0]]]))
+    return regimes
+
+
+def apportionment_matrix(source_index, gadm_index, crosswalk, lineage_active):
+    """
+    Sparse (n_source × n_gadm) apportionment matrix for one regime.
+
+    source_index: DataFrame with state_key, district_key (row order of X)
+    gadm_index:   DataFrame with district_gadm, state_gadm (column order of output)
+    crosswalk:    DataFrame with state_key, district_key, district_gadm, state_gadm
+                  for matched source units
+    lineage_active: lineage rows active in this regime (override the crosswalk)
+    """
+    gadm_pos = pd.Series(
+        np.arange(len(gadm_index)),
+        index=pd.MultiIndex.from_frame(gadm_index[['district_gadm', 'state_gadm']])
+    )
+    source_pos = pd.Series(
+        np.arange(len(source_index)),
+        index=pd.MultiIndex.from_frame(source_index[['state_key', 'district_key']])
+    )
+
+    lineage_keys = pd.MultiIndex.from_frame(lineage_active[['state_key', 'district_key']])
+    xwalk = crosswalk[~pd.MultiIndex.from_frame(crosswalk[['state_key', 'district_key']]).isin(lineage_keys)]
+    links = pd.concat([
+        xwalk[['state_key', 'district_key', 'district_gadm', 'state_gadm']].assign(share=1.0),
+        lineage_active[['state_key', 'district_key', 'district_gadm', 'state_gadm', 'share']],
+    ], ignore_index=True)
+
+    rows = source_pos.reindex(pd.MultiIndex.from_frame(links[['state_key', 'district_key']])).to_numpy()
+    cols = gadm_pos.reindex(pd.MultiIndex.from_frame(links[['district_gadm', 'state_gadm']])).to_numpy()
+    keep = ~(pd.isna(rows) | pd.isna(cols))
+    A = sparse.coo_matrix(
+        (links['share'].to_numpy(dtype=np.float64)[keep],
+         (rows[keep].astype(np.int64), cols[keep].astype(np.int64))),
+        shape=(len(source_index), len(gadm_index))
+    ).tocsr()
+    A.sum_duplicates()
+    return A
+
+
+def apportion_panel(X, periods, source_index, gadm_index, crosswalk, lineage):
+    """
+    Map a (n_source × n_periods) value matrix onto GADM units.
+
+    NaN source values count as missing: the GADM value is the apportioned sum
+    of reported sources and `reported` counts contributing source units.
+    Returns (Y, reported, matrices): Y and reported are (n_gadm × n_periods),
+    matrices is a list of (period_positions, A) per regime.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    present = ~np.isnan(X)
+    X0 = np.where(present, X, 0.0)
+
+    Y = np.zeros((len(gadm_index), X.shape[1]), dtype=np.float64)
+    reported = np.zeros_like(Y)
+    matrices = []
+    for cols, active in lineage_breakpoints(lineage, periods):
+        A = apportionment_matrix(source_index, gadm_index, crosswalk, active)
+        Y[:, cols] = A.T @ X0[:, cols]
+        reported[:, cols] = (A != 0).astype(np.float64).T @ present[:, cols]
+        matrices.append((cols, A))
+    return Y, reported, matrices
+
+
+def unmapped_sources(X, periods, source_index, crosswalk, lineage):
+    """Boolean (n_source × n_periods) mask of reported values with no GADM mapping."""
+    present = ~np.isnan(np.asarray(X, dtype=np.float64))
+    mapped = np.zeros_like(present)
+    xwalk_keys = pd.MultiIndex.from_frame(crosswalk[['state_key', 'district_key']])
+    src_keys = pd.MultiIndex.from_frame(source_index[['state_key', 'district_key']])
+    mapped |= src_keys.isin(xwalk_keys)[:, None]
+    for cols, active in lineage_breakpoints(lineage, periods):
+        in_lineage = src_keys.isin(pd.MultiIndex.from_frame(active[['state_key', 'district_key']]))
+        mapped[:, cols] |= in_lineage[:, None]
+    return present & ~mapped
@@ -0,0 +1,280 @@
+"""
+district_matching.py - Batch district-name matching for the crosswalk scripts
+
+Matches (district, state) queries from RBI / EM-DAT against GADM district
+names in two passes:
+
+  1) Key index (O(1) hash lookups): normalised name, curated/GADM aliases,
+     transliteration-folded key and a phonetic consonant key. A key hit is
+     accepted only if it is unique within the query's state block (or
+     all-India when the query has no state; phonetic keys need a state).
+  2) Fuzzy residual: each unresolved query is scored only against GADM
+     districts in its own state (plus known successor states), falling back
+     to all-India candidates when the state block has no match above
+     threshold or the query has no state. Scores come from rapidfuzz's
+     process.cdist, which builds the query × candidate score matrix in C
+     across all cores.
+"""
+
+import os
+import re
+import numpy as np
+import pandas as pd
+from rapidfuzz import fuzz, process
+
+# Historical / source-specific state names → GADM 4.1 state(s) holding those districts
+STATE_ALIASES = {
+    'ANDAMAN AND NICOBAR ISLANDS': ['ANDAMAN AND NICOBAR'],
+    'ANDHRA PRADESH': ['ANDHRA PRADESH', 'TELANGANA'],  # pre-2014 vintages include Telangana
+    'CHHATISGARH': ['CHHATTISGARH'],
+    'DADRA AND NAGAR HAVELI AND DAMAN AND DIU': ['DADRA AND NAGAR HAVELI', 'DAMAN AND DIU'],
+    'DELHI': ['NCT OF DELHI'],
+    'JAMMU AND KASHMIR': ['JAMMU AND KASHMIR'],
+    'LADAKH': ['JAMMU AND KASHMIR'],  # GADM 4.1 keeps Ladakh districts under J&K
+    'ORISSA': ['ODISHA'],
+    'PONDICHERRY': ['PUDUCHERRY'],
+    'UTTARANCHAL': ['UTTARAKHAND'],
+}
+
+ALIASES_PATH = '00_Admin/district_aliases.csv'
+
+# Romanisation variants common in Indian place names, applied in order
+_TRANSLIT_RULES = [
+    ('AA', 'A'), ('EE', 'I'), ('OO', 'U'), ('OU', 'U'), ('AU', 'O'),
+    ('PH', 'F'), ('BH', 'B'), ('DH', 'D'), ('GH', 'G'), ('JH', 'J'), ('KH', 'K'), ('TH', 'T'),
+    ('SH', 'S'), ('CH', 'C'), ('W', 'V'), ('Z', 'J'), ('Q', 'K'), ('Y', 'I'),
+]
+# Tokens that carry no identity ("Tenkasi Districts", "Udalguri District")
+_NOISE_TOKENS = {'DISTRICT', 'DISTRICTS', 'DISTRCITS', 'DISTRCI', 'DIST', 'THE'}
+
+_PUNCT = re.compile(r'[^A-Z0-9 ]+')
+_SPACES = re.compile(r'\s+')
+_REPEATS = re.compile(r'(.)\1+')
+_VOWELS = re.compile(r'[AEIOU]')
+
+
+def normalize_name(name):
+    """Uppercase, '&' → 'AND', punctuation to spaces, collapse whitespace."""
+    if name is None or (isinstance(name, float) and np.isnan(name)):
+        return ''
+    s = str(name).upper().replace('&', ' AND ')
+    s = _PUNCT.sub(' ', s)
+    return _SPACES.sub(' ', s).strip()
+
+
+def fold_transliteration(key):
+    """Collapse romanisation variants: BARDDHAMAN / BARDHAMAN → BARDAMAN."""
+    tokens = [t for t in key.split(' ') if t and t not in _NOISE_TOKENS]
+    folded = []
+    for token in tokens:
+        for src, dst in _TRANSLIT_RULES:
+            token = token.replace(src, dst)
+        folded.append(_REPEATS.sub(r'\1', token))
+    return ' '.join(folded)
+
+
+def phonetic_key(key):
+    """Consonant skeleton of the folded key (first letter kept): KANCHEEPURAM → KNCPRM."""
+    tokens = fold_transliteration(key).split(' ')
+    return ' '.join(_REPEATS.sub(r'\1', t[:1] + _VOWELS.sub('', t[1:]).replace('H', ''))
+                    for t in tokens if t)
+
+
+KEY_FUNCTIONS = {
+    'exact': lambda key: key,
+    'folded': fold_transliteration,
+    'phonetic': phonetic_key,
+}
+
+
+def build_alias_table(gadm=None, aliases_path=ALIASES_PATH):
+    """
+    Alias → GADM district table from the curated aliases file plus GADM VARNAME_2.
+    gadm: optional frame with NAME_1, NAME_2, VARNAME_2 columns.
+    Returns DataFrame with alias, district_gadm, state_gadm.
+    """
+    frames = []
+    if aliases_path and os.path.exists(aliases_path):
+        curated = pd.read_csv(aliases_path, dtype=str)
+        frames.append(curated[['alias', 'district_gadm', 'state_gadm']])
+    if gadm is not None and 'VARNAME_2' in gadm.columns:
+        var = gadm[['NAME_2', 'NAME_1', 'VARNAME_2']].dropna()
+        var = var.assign(alias=var['VARNAME_2'].str.split(r'[|,]')).explode('alias')
+        var['alias'] = var['alias'].str.strip()
+        var = var[~var['alias'].isin(['', 'NA'])]
+        frames.append(var.rename(columns={'NAME_2': 'district_gadm', 'NAME_1': 'state_gadm'})
+                      [['alias', 'district_gadm', 'state_gadm']])
+    if not frames:
+        return pd.DataFrame(columns=['alias', 'district_gadm', 'state_gadm'])
+    return pd.concat(frames, ignore_index=True).drop_duplicates()
+
+
+def state_block_keys(state):
+    """GADM state keys that a source state name can map to."""
+    key = normalize_name(state)
+    if not key:
+        return []
+    return STATE_ALIASES.get(key, [key])
+
+
+class DistrictMatcher:
+    """
+    Pre-normalised GADM choices with a state-block index.
+
+    Usage:
+        matcher = DistrictMatcher(gadm_districts)   # columns: district_gadm, state_gadm
+        result = matcher.match(names, states, threshold=90)
+    """
+
+    def __init__(self, choices, district_col='district_gadm', state_col='state_gadm',
+                 aliases=None, workers=-1):
+        self.choices = choices[[district_col, state_col]].reset_index(drop=True)
+        self.district_col = district_col
+        self.state_col = state_col
+        self.workers = workers
+        self.keys = np.array([normalize_name(d) for d in self.choices[district_col]], dtype=object)
+
+        self.state_keys = np.array([normalize_name(s) for s in self.choices[state_col]], dtype=object)
+        self.blocks = {s: np.flatnonzero(self.state_keys == s) for s in np.unique(self.state_keys)}
+        self.all_positions = np.arange(len(self.choices))
+        self.index = self._build_index(aliases)
+
+    def _build_index(self, aliases):
+        """
+        Hash index {key_type: {key: tuple(positions)}} over GADM names and aliases.
+        Alias keys are looked up after exact names so a GADM name always wins.
+        """
+        position_of = {(k, s): i for i, (k, s) in enumerate(zip(self.keys, self.state_keys))}
+        entries = [(key, pos) for pos, key in enumerate(self.keys)]
+        alias_entries = []
+        if aliases is not None:
+            for alias, district, state in aliases[['alias', 'district_gadm', 'state_gadm']].itertuples(index=False):
+                pos = position_of.get((normalize_name(district), normalize_name(state)))
+                if pos is not None:
+                    alias_entries.append((normalize_name(alias), pos))
+
+        index = {}
+        for key_type, source in [('exact', entries), ('alias', alias_entries)]:
+            index[key_type] = self._group_keys(source)
+        for key_type in ('folded', 'phonetic'):
+            fn = KEY_FUNCTIONS[key_type]
+            index[key_type] = self._group_keys([(fn(k), p) for k, p in entries + alias_entries])
+        return index
+
+    @staticmethod
+    def _group_keys(entries):
+        grouped = {}
+        for key, pos in entries:
+            if key:
+                grouped.setdefault(key, set()).add(pos)
+        return {k: tuple(sorted(v)) for k, v in grouped.items()}
+
+    def lookup(self, name, state=None):
+        """
+        Resolve a name through the key index. Returns (position, key_type) or (-1, None).
+        Candidates are restricted to the state block when the state is known; a hit must
+        be unique to be accepted. Phonetic keys are only used within a state block.
+        """
+        key = normalize_name(name)
+        if not key:
+            return -1, None
+        block = set(self._candidates(state).tolist())
+        for key_type in ('exact', 'alias', 'folded', 'phonetic'):
+            if key_type == 'phonetic' and not block:
+                break  # consonant skeletons are too coarse to trust all-India
+            lookup_key = key if key_type in ('exact', 'alias') else KEY_FUNCTIONS[key_type](key)
+            hits = self.index[key_type].get(lookup_key, ())
+            if block:
+                hits = [h for h in hits if h in block]
+            if len(hits) == 1:
+                return hits[0], key_type
+        return -1, None
+
+    def _candidates(self, state):
+        """Positions of GADM choices in the query's state block (empty if unknown)."""
+        blocks = [self.blocks[k] for k in state_block_keys(state) if k in self.blocks]
+        if not blocks:
+            return np.array([], dtype=np.int64)
+        return np.concatenate(blocks)
+
+    def _score(self, query_keys, positions):
+        """Best candidate position and score for each query key against one candidate set."""
+        scores = process.cdist(
+            query_keys, self.keys[positions].tolist(),
+            scorer=fuzz.ratio, dtype=np.float32, workers=self.workers
+        )
+        best = scores.argmax(axis=1)
+        return positions[best], scores[np.arange(len(query_keys)), best]
+
+    def match(self, names, states=None, threshold=90, fallback_threshold=90):
+        """
+        Match each (name, state) pair; returns one row per query with
+        match_position, district/state of the best candidate, score, matched flag
+        and match_scope: key-index hits ('exact', 'alias', 'folded', 'phonetic',
+        score 100), fuzzy matches ('state', 'all_india') or 'none'.
+
+        Fuzzy ratios in the 80s within a state still pair different districts
+        (SANGAREDDY → Ranga Reddy, EASTERN WEST KHASI HILLS → South West Khasi
+        Hills), so the default `threshold` is 90; genuine spelling variants
+        below it belong in the overrides file (crosswalk_store).
+
+        Queries with no usable state are scored all-India at `threshold`. Queries
+        whose state block has no candidate above `threshold` may only match
+        across states at the stricter `fallback_threshold`, so cross-state
+        matches are limited to near-identical names.
+        """
+        names = list(names)
+        states = [None] * len(names) if states is None else list(states)
+        query_keys = np.array([normalize_name(n) for n in names], dtype=object)
+
+        n = len(names)
+        best_pos = np.full(n, -1, dtype=np.int64)
+        best_score = np.zeros(n, dtype=np.float64)
+        scope = np.array(['none'] * n, dtype=object)
+
+        # 0) Key index: exact / alias / transliteration-folded / phonetic hash hits
+        for i, (name, state) in enumerate(zip(names, states)):
+            pos, key_type = self.lookup(name, state)
+            if pos >= 0:
+                best_pos[i], best_score[i], scope[i] = pos, 100.0, key_type
+        resolved = best_pos >= 0
+
+        # 1) State-blocked fuzzy scoring on the residual: one score matrix per distinct state
+        state_series = pd.Series([normalize_name(s) for s in states])
+        residual = state_series[~resolved]
+        for state_key, idx in residual.groupby(residual).groups.items():
+            idx = np.asarray(idx)
+            positions = self._candidates(state_key)
+            if len(positions) == 0:
+                continue
+            pos, score = self._score(query_keys[idx].tolist(), positions)
+            best_pos[idx], best_score[idx] = pos, score
+            scope[idx] = 'state'
+
+        # 2) All-India fallback for unblocked or below-threshold queries
+        fallback = np.flatnonzero(~resolved & (best_score < threshold) & (query_keys != ''))
+        if len(fallback) > 0:
+            pos, score = self._score(query_keys[fallback].tolist(), self.all_positions)
+            required = np.where(scope[fallback] == 'state', max(threshold, fallback_threshold), threshold)
+            take = (score >= required) | (scope[fallback] == 'none')
+            rows = fallback[take]
+            best_pos[rows], best_score[rows] = pos[take], score[take]
+            scope[rows] = 'all_india'
+
+        matched = (best_score >= threshold) & (best_pos >= 0)
+        district = np.full(n, None, dtype=object)
+        state = np.full(n, None, dtype=object)
+        district[matched] = self.choices[self.district_col].to_numpy()[best_pos[matched]]
+        state[matched] = self.choices[self.state_col].to_numpy()[best_pos[matched]]
+        scope[~matched] = 'none'
+
+        return pd.DataFrame({
+            'query': names,
+            'query_state': states,
+            'match_position': np.where(matched, best_pos, -1),
+            'district_match': district,
+            'state_match': state,
+            'score': best_score,
+            'matched': matched,
+            'match_scope': scope,
+        })
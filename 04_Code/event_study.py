@@ -0,0 +1,150 @@
+"""
+event_study.py - Event-study designs with binned relative-time indicators and absorbed FEs
+
+Each flood quarter of a district is an event. With repeated events a
+district-quarter can sit at several relative times at once, so the design
+follows the distributed-lag form of the event study (Schmidheiny & Siegloch):
+
+    D_k(i, t) = number of events of unit i at t - k          lo < k < hi
+    D_hi(i, t) = number of events at t - hi or earlier        (binned endpoint)
+    D_lo(i, t) = number of events at t - lo or later          (binned endpoint)
+
+With a single event per unit this is the usual set of relative-time dummies
+with the endpoints binned. The reference period (default k = -1) is
+omitted, so every coefficient is relative to the quarter before an event.
+
+Indicators are built on the unit × period grid (PanelArray) of the event
+series by index arithmetic on the integer period positions: interior
+k are shifted copies of the event grid and the binned ends are read off one
+cumulative sum, so the cost is O(units × periods × window) with no loop
+over events. That holds for monthly tehsil grids as well as district quarters.
+Periods missing from the event frame count as no event; build the grid from
+the full flood timeline (flood_exposure_panel) rather than the estimation
+sample, so events in dropped quarters still set the relative times around them.
+
+Usage:
+    df, cols = add_event_time(df, events=flood_panel, treatment='flood_exposure_ruleA_qt')
+    table, result, pretrend = event_study(df, 'deposit_change_qt', cols)
+    table   # rel_time, coefficient, std_error, ci_lower, ci_upper, ... (reference row = 0)
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.stats import f as f_dist
+
+from panel_keys import PANEL_KEYS, DISTRICT_KEY, QUARTER_KEY
+from panel_array import PanelArray
+from fe_absorb import ols_absorbed
+
+EVENT_WINDOW = (-8, 8)
+REFERENCE = -1
+
+
+def rel_time_name(k, prefix='event'):
+    """Column name for relative time k: event_m8, ..., event_0, ..., event_p8."""
+    return f"{prefix}_m{-k}" if k < 0 else (f"{prefix}_0" if k == 0 else f"{prefix}_p{k}")
+
+
+def event_time_grid(events, window=EVENT_WINDOW, bin_ends=True):
+    """
+    Relative-time counts from a units × periods event-count grid (NaN = no
+    event). Returns {k: units × periods array} for every k in the window.
+    """
+    lo, hi = window
+    E = np.nan_to_num(np.asarray(events, dtype=np.float64))
+    n_periods = E.shape[1]
+    t = np.arange(n_periods)
+    cum = np.concatenate([np.zeros((E.shape[0], 1)), np.cumsum(E, axis=1)], axis=1)  # cum[:, j] = Σ_{s<j}
+    out = {}
+    for k in range(lo, hi + 1):
+        if bin_ends and k == hi:
+            out[k] = cum[:, np.clip(t - hi + 1, 0, n_periods)]                           # events at s ≤ t - hi
+        elif bin_ends and k == lo:
+            out[k] = cum[:, [n_periods]] - cum[:, np.clip(t - lo, 0, n_periods)]        # events at s ≥ t - lo
+        else:
+            source = t - k
+            inside = (source >= 0) & (source < n_periods)
+            out[k] = np.where(inside, E[:, np.clip(source, 0, n_periods - 1)], 0.0)
+    return out
+
+
+def add_event_time(df, events=None, treatment='flood_exposure_ruleA_qt', window=EVENT_WINDOW,
+                   reference=REFERENCE, bin_ends=True, unit_col=DISTRICT_KEY, time_col=QUARTER_KEY,
+                   prefix='event'):
+    """
+    Add relative-time indicator columns to (a copy of) `df`. Events are the
+    cells of `events` (default `df`) with `treatment` > 0. Returns the frame
+    and {k: column} for the estimated relative times (reference excluded).
+    Rows whose unit or period is not on the event grid get NaN.
+    """
+    events = df if events is None else events
+    panel = PanelArray.from_frame(events, [treatment], unit_col=unit_col, time_col=time_col)
+    grid = (panel[treatment] > 0).astype(np.float64)
+    indicators = event_time_grid(grid, window=window, bin_ends=bin_ends)
+
+    # Grid position of each row of df
+    units = df[unit_col].to_numpy()
+    periods = df[time_col].to_numpy().astype(np.int64)
+    row = np.searchsorted(panel.units, units)
+    col = periods - panel.periods[0]
+    on_grid = ((row < len(panel.units)) & (panel.units[np.minimum(row, len(panel.units) - 1)] == units)
+               & (col >= 0) & (col < len(panel.periods)))
+    row, col = np.where(on_grid, row, 0), np.where(on_grid, col, 0)
+
+    df = df.copy()
+    columns = {}
+    for k, values in indicators.items():
+        if k == reference:
+            continue
+        name = rel_time_name(k, prefix)
+        df[name] = np.where(on_grid, values[row, col], np.nan)
+        columns[k] = name
+    return df, columns
+
+
+def pretrend_test(result, lead_names):
+    """Joint Wald F test that all lead coefficients are zero, under result's covariance."""
+    names = [n for n in lead_names if n in result.params.index]
+    if not names:
+        return {'F': np.nan, 'df_num': 0, 'df_den': np.nan, 'p_value': np.nan}
+    b = result.params[names].to_numpy()
+    V = result.cov_params.loc[names, names].to_numpy()
+    F = float(b @ np.linalg.solve(V, b)) / len(names)
+    return {'F': F, 'df_num': len(names), 'df_den': result.df_t,
+            'p_value': float(f_dist.sf(F, len(names), result.df_t))}
+
+
+def event_study(df, y, columns, fe=PANEL_KEYS, vcov='cluster', cluster=None, reference=REFERENCE,
+                controls=(), bin_ends=True, alpha=0.05):
+    """
+    Estimate the event study of `y` on the indicators `columns` ({k: column},
+    from add_event_time) with absorbed FEs. Returns (table, result, pretrend):
+    a plot-ready frame with one row per relative time including the reference
+    period at zero, the AbsorbResult, and the joint test of the leads
+    (k < reference).
+    """
+    ks = sorted(columns)
+    result = ols_absorbed(df, y, [columns[k] for k in ks] + list(controls), fe=fe, vcov=vcov, cluster=cluster)
+    ci = result.conf_int(alpha)
+    used = df.loc[result.fe.keep]
+    lo, hi = min(ks + [reference]), max(ks + [reference])
+
+    rows = []
+    for k in range(lo, hi + 1):
+        name = columns.get(k)
+        if k == reference:
+            rows.append({'rel_time': k, 'variable': 'reference', 'coefficient': 0.0, 'std_error': 0.0,
+                         'ci_lower': 0.0, 'ci_upper': 0.0, 'p_value': np.nan, 'n_cells': np.nan,
+                         'binned': False, 'reference': True})
+        elif name is not None and name in result.params.index:
+            rows.append({'rel_time': k, 'variable': name, 'coefficient': result.params[name],
+                         'std_error': result.bse[name], 'ci_lower': ci.loc[name, 'lower'],
+                         'ci_upper': ci.loc[name, 'upper'], 'p_value': result.pvalues[name],
+                         'n_cells': int((used[name] > 0).sum()), 'binned': bin_ends and k in (ks[0], ks[-1]),
+                         'reference': False})
+    table = pd.DataFrame(rows)
+    table['outcome'] = y
+    table['nobs'] = result.nobs
+    table['vcov'] = result.vcov
+    pretrend = pretrend_test(result, [columns[k] for k in ks if k < reference])
+    return table, result, pretrend
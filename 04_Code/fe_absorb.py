@@ -0,0 +1,285 @@
+"""
+fe_absorb.py - Linear regression with absorbed high-dimensional fixed effects
+
+Fixed effects are never built as dummy columns. Every variable is instead
+projected off the FE space by alternating projections (method of alternating
+projections / iterated within-transformation): subtract district means, then
+quarter means, and repeat until nothing changes. Group means are sparse
+indicator products, so memory is O(N × k) for k regressors, not
+O(N × (k + n_districts + n_quarters)), and the same FixedEffects object
+demeans any number of variables.
+
+By Frisch-Waugh-Lovell, OLS on the demeaned variables gives the coefficients
+of interest exactly. The residual degrees of freedom subtract the number of
+absorbed parameters: sum of group counts minus redundant levels, where the
+redundancies of the first two FEs are the connected components of the
+district-quarter bipartite graph, and each further FE is counted as one
+redundancy. Singleton groups (one observation) are dropped first, since they
+are fitted perfectly and only inflate the degrees of freedom.
+
+Usage:
+    res = ols_absorbed(df, 'deposit_change_qt', ['flood_exposure_ruleA_qt'],
+                       fe=['district_id', 'quarter_id'], vcov='cluster')   # district-clustered
+    res.params, res.bse, res.pvalues, res.summary_frame()
+    res.with_vcov('DK').bse                                  # other SEs without refitting
+
+    fe = FixedEffects.from_frame(df, ['district_id', 'quarter_id'])
+    Xd = fe.demean(df.loc[fe.keep, cols].to_numpy())   # reuse across specifications
+"""
+
+import copy
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.stats import t as t_dist
+
+from panel_keys import PANEL_KEYS
+from panel_vcov import compute_vcov
+
+# Alternating projections stop when no value moves by more than this (relative to its scale)
+DEMEAN_TOL = 1e-10
+DEMEAN_MAXITER = 10_000
+
+# Demeaned regressor treated as absorbed by the FEs (collinear) below this share of its variance
+COLLINEAR_TOL = 1e-9
+
+
+class FixedEffects:
+    """Integer-coded FE dimensions over the rows kept for estimation."""
+
+    def __init__(self, codes, names=None, keep=None):
+        self.codes = [np.asarray(c, dtype=np.int64) for c in codes]
+        self.names = list(names) if names is not None else [f'fe{i}' for i in range(len(self.codes))]
+        self.keep = keep
+        self.n_singletons = 0
+        self.nobs = len(self.codes[0]) if self.codes else 0
+        self.n_groups = [int(c.max()) + 1 if len(c) else 0 for c in self.codes]
+        self.counts = [np.bincount(c, minlength=g).astype(np.float64) for c, g in zip(self.codes, self.n_groups)]
+        self._indicators = [
+            sparse.csr_matrix((np.ones(self.nobs), (np.arange(self.nobs), c)), shape=(self.nobs, g))
+            for c, g in zip(self.codes, self.n_groups)
+        ]
+        self.n_absorbed = self._absorbed_dof()
+
+    @classmethod
+    def from_frame(cls, df, fe_cols=PANEL_KEYS, mask=None, drop_singletons=True):
+        """
+        Build from FE columns of `df`; `mask` selects estimation rows (e.g. complete
+        cases). Singletons are removed iteratively (dropping one can create another).
+        `keep` is the boolean row mask over `df` that the FE codes refer to.
+        """
+        keep = np.ones(len(df), dtype=bool) if mask is None else np.asarray(mask, dtype=bool).copy()
+        raw = [df[col].to_numpy() for col in fe_cols]
+        n_start = int(keep.sum())
+        while drop_singletons:
+            singleton = np.zeros(len(df), dtype=bool)
+            for values in raw:
+                codes, uniques = pd.factorize(values[keep])
+                sizes = np.bincount(codes, minlength=len(uniques))
+                singleton[np.flatnonzero(keep)[sizes[codes] == 1]] = True
+            if not singleton.any():
+                break
+            keep &= ~singleton
+        codes = [pd.factorize(values[keep])[0] for values in raw]
+        fe = cls(codes, names=fe_cols, keep=keep)
+        fe.n_singletons = n_start - int(keep.sum())
+        return fe
+
+    def _absorbed_dof(self):
+        """Absorbed parameters: total levels minus redundant ones."""
+        if not self.codes:
+            return 0
+        total = sum(self.n_groups)
+        if len(self.codes) == 1:
+            return total
+        # Bipartite graph between levels of FE 0 and FE 1: one redundancy per component
+        g0, g1 = self.n_groups[:2]
+        adjacency = sparse.csr_matrix(
+            (np.ones(self.nobs), (self.codes[0], self.codes[1] + g0)), shape=(g0 + g1, g0 + g1))
+        n_components = connected_components(adjacency, directed=False)[0]
+        return total - n_components - (len(self.codes) - 2)
+
+    def demean(self, values, tol=DEMEAN_TOL, maxiter=DEMEAN_MAXITER):
+        """
+        Project columns of `values` (N or N × k) off the FE space. All columns are
+        swept together; a single FE dimension converges in one pass.
+        """
+        X = np.array(values, dtype=np.float64, copy=True)
+        squeeze = X.ndim == 1
+        if squeeze:
+            X = X[:, None]
+        if not self.codes:
+            return X[:, 0] if squeeze else X
+        scale = np.maximum(np.abs(X).max(axis=0), 1.0)
+        for iteration in range(maxiter):
+            largest_step = 0.0
+            for D, counts in zip(self._indicators, self.counts):
+                means = (D.T @ X) / counts[:, None]
+                X -= D @ means
+                largest_step = max(largest_step, float((np.abs(means).max(axis=0) / scale).max()))
+            if len(self.codes) == 1 or largest_step < tol:
+                break
+        else:
+            print(f"   ⚠ FE demeaning did not converge in {maxiter} iterations (last step {largest_step:.2e})")
+        self.iterations = iteration + 1
+        return X[:, 0] if squeeze else X
+
+
+class AbsorbResult:
+    """Coefficients of interest from an FE-absorbed regression (statsmodels-like names)."""
+
+    def __init__(self, names, params, Xd, resid, bread, df_resid, tss_within, fe, groups, omitted):
+        self.names = names
+        self.params = pd.Series(params, index=names, dtype=np.float64)
+        self.Xd = Xd
+        self.resid = resid
+        self.bread = bread
+        self.nobs = len(resid)
+        self.df_resid = df_resid
+        self.rsquared_within = 1.0 - float(resid @ resid) / tss_within if tss_within > 0 else np.nan
+        self.fe = fe
+        self.groups = groups
+        self.omitted = omitted
+
+    def set_vcov(self, vcov='iid', cluster=None, maxlag=None):
+        """
+        (Re)compute the covariance in place from the stored scores; see
+        panel_vcov. `cluster` names the grouping columns in `self.groups`
+        (default: first FE for 'cluster', first two for 'twoway', second, the
+        period, for 'DK').
+        """
+        if cluster is None:
+            cluster = {'cluster': self.fe.names[:1], 'twoway': self.fe.names[:2],
+                       'DK': self.fe.names[1:2]}.get(vcov, [])
+        cluster = [cluster] if isinstance(cluster, str) else list(cluster)
+        groups = [self.groups[c] for c in cluster]
+        n_params = self.Xd.shape[1] + self.fe.n_absorbed
+        if vcov in ('cluster', 'twoway'):
+            n_params -= nested_levels(self.fe, groups)
+        cov, self.df_t = compute_vcov(vcov, self.bread, self.Xd, self.resid, self.df_resid,
+                                      n_params=n_params, groups=groups, maxlag=maxlag)
+        self.vcov = vcov if not cluster else f"{vcov} ({', '.join(cluster)})"
+        self.cluster, self.maxlag = cluster, maxlag
+        self.cov_params = pd.DataFrame(cov, index=self.names, columns=self.names)
+        self.bse = pd.Series(np.sqrt(np.diag(cov)), index=self.names)
+        self.tvalues = self.params / self.bse
+        self.pvalues = pd.Series(2 * t_dist.sf(np.abs(self.tvalues), self.df_t), index=self.names)
+        return self
+
+    def with_vcov(self, vcov, cluster=None, maxlag=None):
+        """Copy of the result with another covariance estimator (no refit)."""
+        return copy.copy(self).set_vcov(vcov, cluster=cluster, maxlag=maxlag)
+
+    def conf_int(self, alpha=0.05):
+        crit = t_dist.ppf(1 - alpha / 2, self.df_t)
+        return pd.DataFrame({'lower': self.params - crit * self.bse, 'upper': self.params + crit * self.bse})
+
+    def summary_frame(self):
+        frame = pd.DataFrame({
+            'coefficient': self.params, 'std_error': self.bse,
+            't_statistic': self.tvalues, 'p_value': self.pvalues,
+        })
+        return frame.join(self.conf_int())
+
+    def se_table(self, kinds=('iid', 'HC1', 'cluster', 'twoway', 'DK')):
+        """Standard errors of every coefficient under several estimators (long frame)."""
+        rows = []
+        for kind in kinds:
+            res = self.with_vcov(kind)
+            for name in self.names:
+                rows.append({'variable': name, 'vcov': res.vcov, 'coefficient': res.params[name],
+                             'std_error': res.bse[name], 'p_value': res.pvalues[name]})
+        return pd.DataFrame(rows)
+
+    def summary(self):
+        fe_desc = ', '.join(f"{name} ({g})" for name, g in zip(self.fe.names, self.fe.n_groups)) or 'none'
+        lines = [
+            "=" * 70,
+            "OLS with absorbed fixed effects",
+            "=" * 70,
+            f"N obs:            {self.nobs:,}",
+            f"Fixed effects:    {fe_desc}; {self.fe.n_absorbed} absorbed parameters",
+            f"Singletons drop:  {self.fe.n_singletons}",
+            f"Residual df:      {self.df_resid:,}",
+            f"Within R²:        {self.rsquared_within:.4f}",
+            f"Covariance:       {self.vcov}",
+            "-" * 70,
+            self.summary_frame().to_string(float_format=lambda v: f"{v:.6f}"),
+        ]
+        if self.omitted:
+            lines.append(f"Omitted (collinear with fixed effects): {', '.join(self.omitted)}")
+        lines.append("=" * 70)
+        return "\n".join(lines)
+
+
+def nested_levels(fe, groups):
+    """
+    FE levels nested within one of the cluster variables (e.g. district FE
+    under district clustering); they do not count in the small-sample K.
+    """
+    nested = 0
+    for codes, n in zip(getattr(fe, 'codes', []), fe.n_groups):
+        for g in groups:
+            g_codes = pd.factorize(np.asarray(g))[0]
+            per_level = pd.Series(g_codes).groupby(codes).nunique()
+            if (per_level <= 1).all():
+                nested += n
+                break
+    return min(nested, fe.n_absorbed)
+
+
+def drop_collinear(Xd, names, X_raw=None, tol=COLLINEAR_TOL):
+    """
+    Drop demeaned columns the FEs absorb (variance ~0, e.g. district-invariant
+    dummies) or that are linear combinations of earlier columns. Returns kept positions.
+    """
+    base = Xd if X_raw is None else X_raw - X_raw.mean(axis=0)
+    keep = []
+    for j in range(Xd.shape[1]):
+        ref = max(float(base[:, j] @ base[:, j]), 1e-300)
+        if float(Xd[:, j] @ Xd[:, j]) <= tol * ref:
+            continue
+        if keep:
+            coef = np.linalg.lstsq(Xd[:, keep], Xd[:, j], rcond=None)[0]
+            resid = Xd[:, j] - Xd[:, keep] @ coef
+            if float(resid @ resid) <= tol * float(Xd[:, j] @ Xd[:, j]):
+                continue
+        keep.append(j)
+    return keep
+
+
+def fit_demeaned(yd, Xd, names, fe, vcov='iid', X_raw=None, groups=None, cluster=None, maxlag=None):
+    """
+    OLS on already-demeaned data (FixedEffects.demean output). `groups` maps
+    names to arrays over the estimation rows used for clustered covariances.
+    """
+    kept = drop_collinear(Xd, names, X_raw)
+    omitted = [n for j, n in enumerate(names) if j not in kept]
+    names = [names[j] for j in kept]
+    Xd = Xd[:, kept]
+
+    bread = np.linalg.inv(Xd.T @ Xd)
+    beta = bread @ (Xd.T @ yd)
+    resid = yd - Xd @ beta
+    df_resid = len(yd) - Xd.shape[1] - fe.n_absorbed
+    result = AbsorbResult(names, beta, Xd, resid, bread, df_resid, float(yd @ yd), fe, groups or {}, omitted)
+    return result.set_vcov(vcov, cluster=cluster, maxlag=maxlag)
+
+
+def ols_absorbed(df, y, x, fe=PANEL_KEYS, vcov='iid', cluster=None, maxlag=None, drop_singletons=True):
+    """
+    Regress column `y` on columns `x` with the `fe` columns absorbed. Rows with a
+    missing y, x or FE value are dropped. `vcov` is one of panel_vcov.VCOV_KINDS;
+    `cluster` names FE or other columns of `df` to cluster on. Returns an
+    AbsorbResult; the kept rows are `result.fe.keep`.
+    """
+    x = [x] if isinstance(x, str) else list(x)
+    group_cols = list(dict.fromkeys([*fe, *([cluster] if isinstance(cluster, str) else cluster or [])]))
+    complete = df[[y, *x, *group_cols]].notna().all(axis=1).to_numpy()
+    fe_obj = FixedEffects.from_frame(df, fe, mask=complete, drop_singletons=drop_singletons)
+    X_raw = df.loc[fe_obj.keep, x].to_numpy(dtype=np.float64)
+    data = fe_obj.demean(np.column_stack([df.loc[fe_obj.keep, y].to_numpy(dtype=np.float64), X_raw]))
+    groups = {col: df.loc[fe_obj.keep, col].to_numpy() for col in group_cols}
+    return fit_demeaned(data[:, 0], data[:, 1:], x, fe_obj, vcov=vcov, X_raw=X_raw,
+                        groups=groups, cluster=cluster, maxlag=maxlag)
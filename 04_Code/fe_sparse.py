@@ -0,0 +1,230 @@
+"""
+fe_sparse.py - Sparse fixed-effect designs solved by LSMR, with FE estimates
+
+fe_absorb.py sweeps group means and never produces the FE coefficients. When
+they are needed (district trends, state × quarter effects) the FE blocks are
+assembled here as one scipy.sparse matrix and solved iteratively. The matrix
+has one non-zero per block per row, so a state × quarter block on a tehsil
+panel costs N entries rather than N × (n_states × n_quarters).
+
+Block specs:
+    'district_id'                        one indicator per district
+    ('state_gadm', 'quarter_id')         one indicator per state × quarter cell
+    slope('district_id', 'trend')        one slope on `trend` per district
+
+Every indicator block keeps all its levels, so the design is rank deficient
+and LSMR returns some least-squares solution; residuals and fitted values do
+not depend on which. The absorbed degrees of freedom are the rank, counted as
+in fe_absorb: levels minus connected components of the first two indicator
+blocks (one per state for district + state × quarter, since districts nest
+in states), minus one per further indicator block, plus the rank of the
+slope columns after projecting off the indicator blocks (a district slope
+on `trend` next to quarter FEs loses one: the slopes sum to `trend`, which
+the quarter block spans). Singleton groups are dropped first, as in FixedEffects.from_frame. Columns are scaled to unit norm
+(Jacobi preconditioning) before LSMR.
+
+FE estimates are reported under an explicit normalization: within each
+connected component of the first indicator block and a later one, the later
+block's estimates have mean zero and the first block carries the level. For
+('state_gadm', 'quarter_id') next to district FEs that makes the state ×
+quarter effects mean zero per state over its quarters, and the district
+effects district levels. Slope blocks are not normalized.
+
+SparseFE has the same interface as fe_absorb.FixedEffects (demean, names,
+n_groups, n_absorbed, keep), so fit_demeaned() and everything built on it
+accepts either.
+
+Usage:
+    fe = SparseFE(df, ['district_id', ('state_gadm', 'quarter_id')], mask=complete)
+    res = fe.fit(df, 'deposit_change_qt', ['flood_exposure_ruleA_qt'])
+    res.params, res.bse                     # coefficients of interest
+    res.fe_estimates[('state_gadm', 'quarter_id')]   # tidy: state_gadm, quarter_id, estimate
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+from scipy.sparse.linalg import lsmr, lsqr
+
+from fe_absorb import FixedEffects, fit_demeaned, COLLINEAR_TOL
+
+SOLVER_TOL = 1e-10
+SOLVER_MAXITER = 20_000
+
+
+def slope(group, var):
+    """Block spec: a separate slope on column `var` for each level of `group`."""
+    return {'group': group, 'slope': var}
+
+
+def block_name(spec):
+    if isinstance(spec, dict):
+        return f"{spec['group']}×{spec['slope']}"
+    if isinstance(spec, tuple):
+        return '×'.join(spec)
+    return spec
+
+
+def _projected_rank(fe, S, tol=COLLINEAR_TOL, chunk=256):
+    """
+    Rank of the sparse columns `S` after projecting off the indicator FEs in
+    `fe`: the Gram matrix S'MS is built a chunk of columns at a time (M is
+    idempotent, so S'MS = S'(MS)) and its eigenvalues counted after scaling
+    to unit diagonal. Columns the FEs absorb entirely are dropped first.
+    """
+    gram = np.empty((S.shape[1], S.shape[1]))
+    for start in range(0, S.shape[1], chunk):
+        gram[:, start:start + chunk] = S.T @ fe.demean(S[:, start:start + chunk].toarray())
+    raw = np.asarray(S.multiply(S).sum(axis=0)).ravel()
+    live = np.diag(gram) > tol * np.maximum(raw, 1e-300)
+    if not live.any():
+        return 0
+    gram = gram[np.ix_(live, live)]
+    d = np.sqrt(np.diag(gram))
+    eigenvalues = np.linalg.eigvalsh((gram + gram.T) / 2 / np.outer(d, d))
+    return int((eigenvalues > np.sqrt(tol) * eigenvalues.max()).sum())
+
+
+def _spec_columns(spec):
+    if isinstance(spec, dict):
+        return [spec['group'], spec['slope']]
+    return list(spec) if isinstance(spec, tuple) else [spec]
+
+
+class SparseFE:
+    """Sparse FE design over the estimation rows, with an iterative solver."""
+
+    def __init__(self, df, specs, mask=None, drop_singletons=True, solver='lsmr'):
+        if solver not in ('lsmr', 'lsqr'):
+            raise ValueError(f"Unknown solver '{solver}' (expected 'lsmr' or 'lsqr')")
+        self.specs = list(specs)
+        self.names = [block_name(s) for s in self.specs]
+        self.solver = solver
+        columns = list(dict.fromkeys(c for s in self.specs for c in _spec_columns(s)))
+        complete = df[columns].notna().all(axis=1).to_numpy().copy()
+        if mask is not None:
+            complete &= np.asarray(mask, dtype=bool)
+
+        # Indicator blocks as integer codes: singleton dropping and the rank come from fe_absorb
+        indicators = [i for i, s in enumerate(self.specs) if not isinstance(s, dict)]
+        fe_frame = pd.DataFrame({self.names[i]: df.groupby(_spec_columns(self.specs[i]), sort=True,
+                                                           observed=True).ngroup().to_numpy()
+                                 for i in indicators})
+        fe = FixedEffects.from_frame(fe_frame, [self.names[i] for i in indicators], mask=complete,
+                                     drop_singletons=drop_singletons)
+        self.keep = fe.keep
+        self.n_singletons = fe.n_singletons
+        self.nobs = int(self.keep.sum())
+
+        rows = df.loc[self.keep, columns].reset_index(drop=True)
+        blocks, self.levels, self.codes, self.n_groups = [], [], [], []
+        for spec in self.specs:
+            if isinstance(spec, dict):
+                codes, labels = self._codes(rows, [spec['group']])
+                values = rows[spec['slope']].to_numpy(dtype=np.float64)
+            else:
+                codes, labels = self._codes(rows, _spec_columns(spec))
+                values = np.ones(self.nobs)
+            block = sparse.csc_matrix((values, (np.arange(self.nobs), codes)), shape=(self.nobs, len(labels)))
+            block.eliminate_zeros()
+            blocks.append(block)
+            self.levels.append(labels)
+            self.codes.append(codes)
+            self.n_groups.append(len(labels))
+
+        self.matrix = sparse.hstack(blocks, format='csc') if blocks else sparse.csc_matrix((self.nobs, 0))
+        norms = np.sqrt(np.asarray(self.matrix.multiply(self.matrix).sum(axis=0))).ravel()
+        self.col_scale = np.where(norms > 0, 1.0 / np.where(norms > 0, norms, 1.0), 0.0)
+        self._scaled = (self.matrix @ sparse.diags(self.col_scale)).tocsr()
+        slopes = [b for b, s in zip(blocks, self.specs) if isinstance(s, dict)]
+        self.n_absorbed = fe.n_absorbed + (_projected_rank(fe, sparse.hstack(slopes, format='csc')) if slopes else 0)
+
+    @staticmethod
+    def _codes(rows, cols):
+        """Integer codes and a frame of level labels for one block."""
+        codes = rows.groupby(cols, sort=True, observed=True).ngroup().to_numpy()
+        labels = rows[cols].drop_duplicates().sort_values(cols).reset_index(drop=True)
+        return codes, labels
+
+    def solve(self, values, tol=SOLVER_TOL, maxiter=SOLVER_MAXITER):
+        """FE coefficients minimising ||values - D b|| for each column of `values`."""
+        V = np.asarray(values, dtype=np.float64)
+        squeeze = V.ndim == 1
+        V = V[:, None] if squeeze else V
+        method = lsmr if self.solver == 'lsmr' else lsqr
+        coef = np.empty((self.matrix.shape[1], V.shape[1]))
+        self.iterations = []
+        for j in range(V.shape[1]):
+            out = method(self._scaled, V[:, j], atol=tol, btol=tol, maxiter=maxiter)
+            coef[:, j] = out[0] * self.col_scale
+            self.iterations.append(int(out[2]))
+        return coef[:, 0] if squeeze else coef
+
+    def demean(self, values):
+        """Residual of each column after projecting on the FE design."""
+        V = np.asarray(values, dtype=np.float64)
+        return V - self.matrix @ self.solve(V)
+
+    def normalize(self, coef):
+        """
+        Shift FE coefficients to the documented normalization: within each
+        connected component of the first indicator block and each later one,
+        the later block averages zero and the first absorbs the difference.
+        Fitted values are unchanged.
+        """
+        coef = np.array(coef, dtype=np.float64, copy=True)
+        offsets = np.cumsum([0, *self.n_groups])
+        indicators = [i for i, s in enumerate(self.specs) if not isinstance(s, dict)]
+        if len(indicators) < 2:
+            return coef
+        first = indicators[0]
+        n0 = self.n_groups[first]
+        for b in indicators[1:]:
+            nb = self.n_groups[b]
+            adjacency = sparse.csr_matrix(
+                (np.ones(self.nobs), (self.codes[first], self.codes[b] + n0)), shape=(n0 + nb, n0 + nb))
+            n_components, component = connected_components(adjacency, directed=False)
+            comp0, comp_b = component[:n0], component[n0:]
+            block = coef[offsets[b]:offsets[b + 1]]
+            means = (np.bincount(comp_b, block, minlength=n_components)
+                     / np.maximum(np.bincount(comp_b, minlength=n_components), 1))
+            coef[offsets[b]:offsets[b + 1]] -= means[comp_b]
+            coef[offsets[first]:offsets[first + 1]] += means[comp0]
+        return coef
+
+    def estimates(self, coef):
+        """
+        Split a stacked FE coefficient vector into one tidy frame per block,
+        after normalize().
+        """
+        coef = self.normalize(coef)
+        out, start = {}, 0
+        for spec, labels, n in zip(self.specs, self.levels, self.n_groups):
+            frame = labels.copy()
+            frame['estimate'] = coef[start:start + n]
+            out[spec if not isinstance(spec, dict) else block_name(spec)] = frame
+            start += n
+        return out
+
+    def fit(self, df, y, x, vcov='iid', cluster=None, maxlag=None):
+        """
+        OLS of `y` on `x` with these FE blocks: coefficients of interest by
+        partialling out (FWL), then the FE estimates from the remaining residual.
+        The result is an fe_absorb.AbsorbResult with `fe_estimates` attached.
+        """
+        x = [x] if isinstance(x, str) else list(x)
+        rows = self.keep & df[[y, *x]].notna().all(axis=1).to_numpy()
+        if not np.array_equal(rows, self.keep):
+            raise ValueError("SparseFE.fit: y/x have missing values on FE rows; pass them in `mask`")
+        X_raw = df.loc[self.keep, x].to_numpy(dtype=np.float64)
+        y_raw = df.loc[self.keep, y].to_numpy(dtype=np.float64)
+        data = self.demean(np.column_stack([y_raw, X_raw]))
+        group_cols = [c for c in self.specs if isinstance(c, str)]
+        group_cols += [c for c in ([cluster] if isinstance(cluster, str) else cluster or []) if c not in group_cols]
+        groups = {col: df.loc[self.keep, col].to_numpy() for col in group_cols}
+        result = fit_demeaned(data[:, 0], data[:, 1:], x, self, vcov=vcov, X_raw=X_raw,
+                              groups=groups, cluster=cluster, maxlag=maxlag)
+        beta = result.params.reindex(x).fillna(0.0).to_numpy()
+        result.fe_estimates = self.estimates(self.solve(y_raw - X_raw @ beta))
+        return result
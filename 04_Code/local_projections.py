@@ -0,0 +1,162 @@
+"""
+local_projections.py - Local-projection impulse responses as one multi-outcome FE system
+
+A Jordà local projection regresses the outcome h periods ahead on the shock
+at t and the same controls for every horizon:
+
+    y_{i,t+h} - y_{i,t-1} = β_h shock_{i,t} + Σ_j γ_hj shock_{i,t-j}
+                            + Σ_y Σ_j δ_hj Δy_{i,t-j} + α_i + τ_t + ε_{i,t+h}
+
+Only the left-hand side changes with h (and with the outcome), so all
+(outcome, horizon) pairs share one design matrix. The outcome leads are
+column shifts of the PanelArray grid, so they stop at the 2016Q3-2017Q1
+gap instead of jumping across it. The FEs are then partialled out of the
+regressors and every left-hand column in one FixedEffects.demean call, the
+coefficients for all columns come from one multi-right-hand-side solve with
+the shared bread (X'X)^-1, and only the covariance is computed per column
+from that column's residuals (horizon-specific cluster-robust SEs; the
+overlapping errors of an h-step projection are serially correlated within a
+district, which district clustering covers).
+
+    sample='common'   every column on the rows where all leads are observed:
+                      one demean and one solve for the whole IRF
+    sample='horizon'  each column on its own complete rows (the usual LP
+                      sample); columns with the same rows share a demean
+                      and solve, so the cost grows with the number of
+                      distinct samples, at most one per horizon
+
+Usage:
+    table, results = local_projections(df, ['log_deposits', 'log_lights_qt'],
+                                       'flood_exposure_ruleA_qt')
+    table   # outcome, horizon, coefficient, std_error, ci_lower, ci_upper, ...
+    results[('log_deposits', 4)].summary()
+"""
+
+import numpy as np
+import pandas as pd
+
+from panel_keys import PANEL_KEYS, DISTRICT_KEY, QUARTER_KEY
+from panel_array import PanelArray
+from fe_absorb import FixedEffects, AbsorbResult, drop_collinear
+
+HORIZONS = range(0, 9)
+SHOCK_LAGS = 2
+OUTCOME_LAGS = 2
+RESPONSES = ['cumulative', 'difference']
+SAMPLES = ['common', 'horizon']
+
+
+def lp_design(df, outcomes, shock, horizons=HORIZONS, shock_lags=SHOCK_LAGS, outcome_lags=OUTCOME_LAGS,
+              controls=(), response='cumulative', unit_col=DISTRICT_KEY, time_col=QUARTER_KEY):
+    """
+    Left-hand columns {(outcome, h): column} and regressor names, added to a
+    copy of `df`. `outcomes` are (log) levels; 'cumulative' responses are
+    y_{t+h} - y_{t-1}, 'difference' responses Δy_{t+h}. Regressors are the
+    shock, its lags 1..shock_lags, lags 1..outcome_lags of Δy for every
+    outcome, and `controls`.
+    """
+    if response not in RESPONSES:
+        raise ValueError(f"Unknown response '{response}' (expected one of {RESPONSES})")
+    panel = PanelArray.from_frame(df, [*outcomes, shock], unit_col=unit_col, time_col=time_col)
+    df = df.copy()
+
+    lhs = {}
+    for y in outcomes:
+        change = panel.diff(y)
+        base = panel.lag(y, 1)
+        for h in horizons:
+            values = panel.lead(y, h) - base if response == 'cumulative' else panel.lead(change, h)
+            lhs[(y, h)] = f"{y}_h{h}"
+            df[lhs[(y, h)]] = panel.gather(values)
+
+    x_names = [shock]
+    for j in range(1, shock_lags + 1):
+        df[f"{shock}_L{j}"] = panel.gather(panel.lag(shock, j))
+        x_names.append(f"{shock}_L{j}")
+    for y in outcomes:
+        change = panel.diff(y)
+        for j in range(1, outcome_lags + 1):
+            df[f"d_{y}_L{j}"] = panel.gather(panel.lag(change, j))
+            x_names.append(f"d_{y}_L{j}")
+    return df, lhs, x_names + list(controls)
+
+
+def _fit_block(df, lhs_cols, x_names, mask, fe, group_cols, vcov, cluster, maxlag):
+    """Demean and solve every column of `lhs_cols` on the rows in `mask` at once."""
+    fe_obj = FixedEffects.from_frame(df, fe, mask=mask)
+    X_raw = df.loc[fe_obj.keep, x_names].to_numpy(dtype=np.float64)
+    Y_raw = df.loc[fe_obj.keep, lhs_cols].to_numpy(dtype=np.float64)
+    data = fe_obj.demean(np.column_stack([Y_raw, X_raw]))
+    Yd, Xd = data[:, :len(lhs_cols)], data[:, len(lhs_cols):]
+
+    kept = drop_collinear(Xd, x_names, X_raw)
+    names = [x_names[j] for j in kept]
+    omitted = [n for j, n in enumerate(x_names) if j not in kept]
+    Xd = Xd[:, kept]
+    bread = np.linalg.inv(Xd.T @ Xd)
+    B = bread @ (Xd.T @ Yd)                                     # k × (outcomes · horizons)
+    E = Yd - Xd @ B
+    df_resid = len(Yd) - Xd.shape[1] - fe_obj.n_absorbed
+    groups = {col: df.loc[fe_obj.keep, col].to_numpy() for col in group_cols}
+
+    results = {}
+    for m, col in enumerate(lhs_cols):
+        result = AbsorbResult(names, B[:, m], Xd, E[:, m], bread, df_resid, float(Yd[:, m] @ Yd[:, m]),
+                              fe_obj, groups, omitted)
+        results[col] = result.set_vcov(vcov, cluster=cluster, maxlag=maxlag)
+    return results
+
+
+def local_projections(df, outcomes, shock, horizons=HORIZONS, shock_lags=SHOCK_LAGS,
+                      outcome_lags=OUTCOME_LAGS, controls=(), fe=PANEL_KEYS, vcov='cluster', cluster=None,
+                      maxlag=None, sample='common', response='cumulative', alpha=0.05):
+    """
+    Impulse responses of each of `outcomes` to `shock` over `horizons` with
+    absorbed FEs. Returns (table, results): one row per outcome × horizon
+    with the shock coefficient, its SE and confidence interval (NaN where the
+    shock is collinear with the FEs on that sample), and the AbsorbResult of
+    every projection keyed by (outcome, horizon).
+    """
+    if sample not in SAMPLES:
+        raise ValueError(f"Unknown sample '{sample}' (expected one of {SAMPLES})")
+    outcomes = [outcomes] if isinstance(outcomes, str) else list(outcomes)
+    horizons = list(horizons)
+    design, lhs, x_names = lp_design(df, outcomes, shock, horizons, shock_lags, outcome_lags, controls,
+                                     response)
+    group_cols = list(dict.fromkeys([*fe, *([cluster] if isinstance(cluster, str) else cluster or [])]))
+    base = design[[*x_names, *group_cols]].notna().all(axis=1).to_numpy()
+    observed = design[list(lhs.values())].notna().to_numpy()
+
+    # Columns observed on the same rows are solved together
+    if sample == 'common':
+        blocks = [(list(lhs.values()), base & observed.all(axis=1))]
+    else:
+        by_rows = {}
+        for m, col in enumerate(lhs.values()):
+            mask = base & observed[:, m]
+            by_rows.setdefault(mask.tobytes(), (mask, []))[1].append(col)
+        blocks = [(cols, mask) for mask, cols in by_rows.values()]
+
+    fitted = {}
+    for cols, mask in blocks:
+        fitted.update(_fit_block(design, cols, x_names, mask, fe, group_cols, vcov, cluster, maxlag))
+
+    rows, results = [], {}
+    for (y, h), col in lhs.items():
+        result = results[(y, h)] = fitted[col]
+        row = {'outcome': y, 'horizon': h, 'coefficient': np.nan, 'std_error': np.nan, 'ci_lower': np.nan,
+               'ci_upper': np.nan, 'p_value': np.nan, 'nobs': result.nobs, 'vcov': result.vcov}
+        if shock in result.params.index:
+            ci = result.conf_int(alpha)
+            row.update(coefficient=result.params[shock], std_error=result.bse[shock],
+                       ci_lower=ci.loc[shock, 'lower'], ci_upper=ci.loc[shock, 'upper'],
+                       p_value=result.pvalues[shock])
+        else:
+            # No within variation in the shock on this sample (absorbed by the FEs)
+            print(f"   ⚠ {y}, h = {h}: '{shock}' omitted as collinear with the fixed effects")
+        rows.append(row)
+    table = pd.DataFrame(rows)
+    table['shock'] = shock
+    table['response'] = response
+    table['sample'] = sample
+    return table, results
@@ -0,0 +1,175 @@
+"""
+panel_array.py - Dense district × quarter arrays with gap-aware time operators
+
+A PanelArray holds each variable as an (n_districts × n_periods) float64
+array. Rows are district_id values, columns are a contiguous run of
+quarter_id values (see panel_keys), so a period missing from the long
+frame, such as the 2016Q3-2017Q1 blackout dropped by Script 17, is an
+all-NaN column and not a skipped row. Lags, leads, differences, rolling
+windows and cumulative sums are then column shifts on the array and
+cannot jump across a gap.
+
+Usage:
+    panel = PanelArray.from_frame(df, ['deposits', 'flood_exposure_ruleA_qt'])
+    df['flood_L1'] = panel.gather(panel.lag('flood_exposure_ruleA_qt', 1))
+    df['d_log_dep'] = panel.gather(panel.diff(np.log1p(panel['deposits'])))
+
+Operators take a variable name or an array of the panel's shape and return
+an array; `gather` maps an array back onto the rows of the source frame.
+"""
+
+import numpy as np
+import pandas as pd
+
+from panel_keys import DISTRICT_KEY, QUARTER_KEY
+
+
+class PanelArray:
+    """Variables on a dense (unit × period) grid with NaN for unobserved cells."""
+
+    def __init__(self, units, periods, data=None, row_pos=None, col_pos=None):
+        self.units = np.asarray(units)
+        self.periods = np.asarray(periods)
+        self.data = {} if data is None else dict(data)
+        # Position of each source-frame row on the grid (for gather)
+        self.row_pos = row_pos
+        self.col_pos = col_pos
+
+    @property
+    def shape(self):
+        return len(self.units), len(self.periods)
+
+    @classmethod
+    def from_frame(cls, df, columns, unit_col=DISTRICT_KEY, time_col=QUARTER_KEY, periods=None):
+        """
+        Scatter long-format columns onto the grid. Periods default to the full
+        integer range min..max of `time_col`, so interior gaps become NaN columns.
+        (unit, period) pairs must be unique.
+        """
+        unit_vals = df[unit_col].to_numpy()
+        time_vals = df[time_col].to_numpy().astype(np.int64)
+        units = np.unique(unit_vals)
+        if periods is None:
+            periods = np.arange(time_vals.min(), time_vals.max() + 1)
+        periods = np.asarray(periods, dtype=np.int64)
+
+        row_pos = np.searchsorted(units, unit_vals)
+        col_pos = np.searchsorted(periods, time_vals)
+        inside = (col_pos < len(periods)) & (periods[np.minimum(col_pos, len(periods) - 1)] == time_vals)
+        flat = row_pos * len(periods) + col_pos
+        if pd.Index(flat[inside]).has_duplicates:
+            raise ValueError(f"PanelArray: duplicate ({unit_col}, {time_col}) rows")
+        col_pos = np.where(inside, col_pos, -1)
+
+        panel = cls(units, periods, row_pos=row_pos, col_pos=col_pos)
+        for col in columns:
+            values = np.full(panel.shape, np.nan)
+            values[row_pos[inside], col_pos[inside]] = df[col].to_numpy(dtype=np.float64)[inside]
+            panel.data[col] = values
+        return panel
+
+    def __getitem__(self, name):
+        return self.data[name]
+
+    def __setitem__(self, name, values):
+        values = np.asarray(values, dtype=np.float64)
+        if values.shape != self.shape:
+            raise ValueError(f"PanelArray: expected shape {self.shape}, got {values.shape}")
+        self.data[name] = values
+
+    def __contains__(self, name):
+        return name in self.data
+
+    def _array(self, x):
+        return self.data[x] if isinstance(x, str) else np.asarray(x, dtype=np.float64)
+
+    # === Time operators ===
+
+    def lag(self, x, k=1):
+        """Value k periods earlier (k < 0 is a lead); NaN where that period is missing."""
+        x = self._array(x)
+        out = np.full_like(x, np.nan)
+        if k == 0:
+            out[:] = x
+        elif k > 0:
+            out[:, k:] = x[:, :-k]
+        else:
+            out[:, :k] = x[:, -k:]
+        return out
+
+    def lead(self, x, k=1):
+        """Value k periods later."""
+        return self.lag(x, -k)
+
+    def diff(self, x, k=1):
+        """x_t - x_{t-k}."""
+        x = self._array(x)
+        return x - self.lag(x, k)
+
+    def pct_change(self, x, k=1):
+        """x_t / x_{t-k} - 1 (inf where the base is zero, like pandas)."""
+        x = self._array(x)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return x / self.lag(x, k) - 1.0
+
+    def rolling(self, x, window, stat='mean', min_periods=None):
+        """
+        Trailing window over periods t-window+1..t ('sum', 'mean' or 'count' of
+        observed values). Cells with fewer than min_periods observed values
+        (default: the full window) are NaN.
+        """
+        x = self._array(x)
+        min_periods = window if min_periods is None else min_periods
+        observed = ~np.isnan(x)
+        csum = np.cumsum(np.where(observed, x, 0.0), axis=1)
+        ccount = np.cumsum(observed, axis=1, dtype=np.int64)
+        total = csum - self.lag(csum, window)
+        count = ccount - self.lag(ccount, window)
+        # First window-1 periods: lag is NaN, so the window starts at period 0
+        head = np.isnan(total)
+        total[head], count[head] = csum[head], ccount[head]
+
+        if stat == 'sum':
+            out = total
+        elif stat == 'mean':
+            with np.errstate(invalid='ignore', divide='ignore'):
+                out = total / count
+        elif stat == 'count':
+            out = count.astype(np.float64)
+        else:
+            raise ValueError(f"Unknown rolling stat: {stat}")
+        return np.where(count >= min_periods, out, np.nan)
+
+    def cumsum(self, x):
+        """Running sum over observed periods; NaN in unobserved cells."""
+        x = self._array(x)
+        return np.where(np.isnan(x), np.nan, np.nancumsum(x, axis=1))
+
+    def unit_reduce(self, x, stat='sum'):
+        """Per-unit reduction over periods (nansum / nanmean / nanmedian), NaN-aware."""
+        fn = {'sum': np.nansum, 'mean': np.nanmean, 'median': np.nanmedian}[stat]
+        return fn(self._array(x), axis=1)
+
+    # === Back to long format ===
+
+    def gather(self, x):
+        """Values of an array at the rows of the frame the panel was built from."""
+        x = self._array(x)
+        out = np.full(len(self.row_pos), np.nan)
+        hit = self.col_pos >= 0
+        out[hit] = x[self.row_pos[hit], self.col_pos[hit]]
+        return out
+
+    def to_frame(self, columns=None, unit_col=DISTRICT_KEY, time_col=QUARTER_KEY, dropna=True):
+        """Long frame of the grid; dropna removes cells where every column is NaN."""
+        columns = list(self.data) if columns is None else list(columns)
+        n_units, n_periods = self.shape
+        frame = pd.DataFrame({
+            unit_col: np.repeat(self.units, n_periods),
+            time_col: np.tile(self.periods, n_units),
+        })
+        for col in columns:
+            frame[col] = self.data[col].ravel()
+        if dropna and columns:
+            frame = frame[frame[columns].notna().any(axis=1)].reset_index(drop=True)
+        return frame
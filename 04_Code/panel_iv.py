@@ -0,0 +1,415 @@
+"""
+panel_iv.py - Instrumental-variables (2SLS / LIML) regression with absorbed fixed effects
+
+The fixed effects are partialled out of every variable once (FixedEffects.demean)
+and the IV algebra runs on the demeaned columns (FWL holds for k-class
+estimators, since the FE dummies are exogenous regressors and instruments).
+PartialledPanel holds those demeaned columns for one estimation sample, so any
+number of instrument sets, endogenous variables and methods are fitted from
+the same matrices; a specification costs a few k × k products.
+
+k-class estimator, with X = [endog, exog] and Z = [instruments, exog]:
+    X_k  = X - κ M_Z X            (κ = 1: 2SLS, X_k = P_Z X; κ = LIML root)
+    β    = (X_k'X)^-1 X_k'y
+The covariance is the usual sandwich with bread (X_k'X)^-1 and scores
+x_k,i · e_i, where e = y - Xβ are the structural residuals (not the
+fitted-value residuals of a manual second stage), so every panel_vcov
+estimator (iid, HC1, cluster, twoway, DK) applies unchanged.
+
+Diagnostics (recomputed under the same covariance estimator as the coefficients):
+    first_stage     per endogenous variable: partial R² and Wald F of the
+                    excluded instruments
+    kp_f            Kleibergen-Paap rk Wald F (rk statistic / L): robust test
+                    of under-identification / weak instruments; equals the
+                    first-stage F with one endogenous variable
+    cd_f            Cragg-Donald Wald F (the same statistic under iid errors)
+    overid          Sargan (iid) or Hansen J (robust, two-step GMM) when
+                    instruments outnumber endogenous variables
+
+weak_iv_sets() inverts the Anderson-Rubin and conditional LR tests over a
+grid of β values (one endogenous variable). Both stay valid however weak the
+first stage is; the sets can be unbounded or a union of intervals. The grid is
+evaluated as batched L × L solves on the partialled reduced form.
+
+Usage:
+    panel = PartialledPanel(df, ['deposit_change_qt', 'lights_change_qt',
+                                 'flood_exposure_ruleA_qt', 'flood_exposure_ruleB_qt'])
+    res = iv_fit(panel, 'deposit_change_qt', ['lights_change_qt'],
+                 ['flood_exposure_ruleA_qt', 'flood_exposure_ruleB_qt'], vcov='cluster')
+    res.params, res.bse, res.kp_f, res.overid, res.first_stage
+    grid, sets = weak_iv_sets(res)          # AR / CLR sets under the same covariance
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import eigh, sqrtm
+from scipy.special import gammaln, roots_jacobi
+from scipy.stats import chi2, f as f_dist
+
+from panel_keys import PANEL_KEYS
+from panel_vcov import compute_vcov
+from fe_absorb import FixedEffects, AbsorbResult, nested_levels, drop_collinear
+
+IV_METHODS = ['2sls', 'liml']
+
+# Weak-IV confidence sets: default grid of β values (± span Wald SEs around the estimate)
+WEAK_IV_GRID_POINTS = 10_000
+WEAK_IV_SPAN = 20
+CLR_QUADRATURE_NODES = 64
+
+
+class PartialledPanel:
+    """FE-partialled columns over one estimation sample, demeaned once."""
+
+    def __init__(self, df, columns, fe=PANEL_KEYS, cluster=None, mask=None, drop_singletons=True):
+        self.columns = list(dict.fromkeys(columns))
+        cluster = [cluster] if isinstance(cluster, str) else list(cluster or [])
+        group_cols = list(dict.fromkeys([*fe, *cluster]))
+        complete = df[[*self.columns, *group_cols]].notna().all(axis=1).to_numpy()
+        if mask is not None:
+            complete &= np.asarray(mask, dtype=bool)
+        self.fe = FixedEffects.from_frame(df, fe, mask=complete, drop_singletons=drop_singletons)
+        self.raw = df.loc[self.fe.keep, self.columns].to_numpy(dtype=np.float64)
+        self.data = self.fe.demean(self.raw)
+        self.groups = {col: df.loc[self.fe.keep, col].to_numpy() for col in group_cols}
+        self._position = {col: j for j, col in enumerate(self.columns)}
+        self.nobs = self.data.shape[0]
+
+    def matrix(self, cols, raw=False):
+        """Demeaned (or raw) columns `cols` as an N × k array."""
+        missing = [c for c in cols if c not in self._position]
+        if missing:
+            raise KeyError(f"PartialledPanel: columns not partialled: {missing}")
+        source = self.raw if raw else self.data
+        return source[:, [self._position[c] for c in cols]]
+
+
+def _residualise(A, W):
+    """A minus its projection on the columns of W (no-op when W is empty)."""
+    if W.shape[1] == 0:
+        return A
+    return A - W @ np.linalg.lstsq(W, A, rcond=None)[0]
+
+
+def liml_kappa(y, endog, Z, exog):
+    """Smallest root κ of det(Y'M_W Y - κ Y'M_Z Y) = 0, Y = [y, endog]."""
+    Y = np.column_stack([y, endog])
+    A = _residualise(Y, exog)
+    B = _residualise(Y, Z)
+    return float(eigh(A.T @ A, B.T @ B, eigvals_only=True)[0])
+
+
+def _vec_pi_cov(kind, Z, V, df_resid, n_params, groups, maxlag):
+    """
+    Covariance of vec(Π̂) for the multivariate first stage V = X - ZΠ̂.
+    The scores of column k of Π̂ are z_i v_ik, stacked column-major.
+    """
+    ZZ_inv = np.linalg.inv(Z.T @ Z)
+    if kind == 'iid':
+        return np.kron(V.T @ V / df_resid, ZZ_inv)
+    scores = np.hstack([Z * V[:, [k]] for k in range(V.shape[1])])
+    bread = np.kron(np.eye(V.shape[1]), ZZ_inv)
+    cov, _ = compute_vcov(kind, bread, scores, np.ones(len(V)), df_resid,
+                          n_params=n_params, groups=groups, maxlag=maxlag)
+    return cov
+
+
+def rk_wald(X, Z, cov_pi, df_resid):
+    """
+    Kleibergen-Paap (2006) rk Wald statistic for H0: rank(Π) = K - 1, where
+    Π (L × K) are first-stage coefficients of X (N × K) on Z (N × L), both
+    already partialled off the exogenous regressors. Returns (statistic, df).
+    """
+    L, K = Z.shape[1], X.shape[1]
+    ZZ = Z.T @ Z
+    Pi = np.linalg.solve(ZZ, Z.T @ X)
+    V = X - Z @ Pi
+    G = np.linalg.cholesky(ZZ).T                                    # G'G = Z'Z
+    F = np.linalg.cholesky(np.linalg.inv(V.T @ V / df_resid)).T     # F'F = Σ_v^-1
+    theta = G @ Pi @ F.T
+    U, _, Vt = np.linalg.svd(theta)
+    Vm = Vt.T
+    q = K - 1
+    U22, V22 = U[q:, q:], Vm[q:, q:]
+    A_perp = U[:, q:] @ np.linalg.inv(U22) @ np.real(sqrtm(U22 @ U22.T))
+    B_perp = np.real(sqrtm(V22 @ V22.T)) @ np.linalg.inv(V22.T) @ Vm[:, q:].T
+    transform = np.kron(B_perp, A_perp.T)
+    lam = transform @ theta.ravel(order='F')
+    cov_theta = np.kron(F, G) @ cov_pi @ np.kron(F, G).T
+    omega = transform @ cov_theta @ transform.T
+    stat = float(lam @ np.linalg.solve(omega, lam))
+    return stat, (L - q) * (K - q)
+
+
+class IVResult(AbsorbResult):
+    """AbsorbResult for a k-class IV fit, with first-stage and overidentification diagnostics."""
+
+    def __init__(self, names, params, Xk, resid, bread, df_resid, tss_within, fe, groups, omitted,
+                 method, kappa, y, X, Z, endog, instruments, exog):
+        super().__init__(names, params, Xk, resid, bread, df_resid, tss_within, fe, groups, omitted)
+        self.method = method
+        self.kappa = kappa
+        self.y, self.X, self.Z = y, X, Z
+        self.endog, self.instruments, self.exog = endog, instruments, exog
+
+    def set_vcov(self, vcov='iid', cluster=None, maxlag=None):
+        super().set_vcov(vcov, cluster=cluster, maxlag=maxlag)
+        self.vcov_kind = vcov
+        self._diagnostics()
+        return self
+
+    def reduced_form(self):
+        """
+        Excluded instruments, endogenous variables and outcome, all partialled
+        off the exogenous regressors, with the first-stage residual df, the
+        small-sample K and the cluster arrays of the current covariance.
+        """
+        groups = [self.groups[c] for c in self.cluster]
+        n_endog, n_excl = len(self.endog), len(self.instruments)
+        W = self.Z[:, n_excl:]
+        Z1 = _residualise(self.Z[:, :n_excl], W)
+        X1 = _residualise(self.X[:, :n_endog], W)
+        y1 = _residualise(self.y[:, None], W)[:, 0]
+        df_first = self.nobs - self.Z.shape[1] - self.fe.n_absorbed
+        n_params = self.Z.shape[1] + self.fe.n_absorbed
+        if self.vcov_kind in ('cluster', 'twoway'):
+            n_params -= nested_levels(self.fe, groups)
+        return Z1, X1, y1, df_first, n_params, groups
+
+    def _diagnostics(self):
+        kind, maxlag, n_excl = self.vcov_kind, self.maxlag, len(self.instruments)
+        Z1, X1, _, df_first, n_params, groups = self.reduced_form()
+
+        # First stage, one endogenous variable at a time
+        ZZ_inv = np.linalg.inv(Z1.T @ Z1)
+        rows = []
+        for k, name in enumerate(self.endog):
+            pi = ZZ_inv @ (Z1.T @ X1[:, k])
+            v = X1[:, k] - Z1 @ pi
+            cov, df_t = compute_vcov(kind, ZZ_inv, Z1, v, df_first, n_params=n_params,
+                                     groups=groups, maxlag=maxlag)
+            wald = float(pi @ np.linalg.solve(cov, pi))
+            rows.append({'endogenous': name, 'partial_r2': 1 - float(v @ v) / float(X1[:, k] @ X1[:, k]),
+                         'F': wald / n_excl, 'df_num': n_excl, 'df_den': df_t,
+                         'p_value': float(f_dist.sf(wald / n_excl, n_excl, df_t))})
+        self.first_stage = pd.DataFrame(rows).set_index('endogenous')
+
+        # Kleibergen-Paap under this covariance; Cragg-Donald is the iid case
+        V = X1 - Z1 @ (ZZ_inv @ (Z1.T @ X1))
+        cov_pi = _vec_pi_cov(kind, Z1, V, df_first, n_params, groups, maxlag)
+        self.kp_rk, self.kp_df = rk_wald(X1, Z1, cov_pi, df_first)
+        self.kp_f = self.kp_rk / n_excl
+        self.kp_p = float(chi2.sf(self.kp_rk, self.kp_df))
+        cd_rk, _ = rk_wald(X1, Z1, _vec_pi_cov('iid', Z1, V, df_first, n_params, groups, maxlag), df_first)
+        self.cd_f = cd_rk / n_excl
+
+        self.overid = self._overid(kind, groups, maxlag, n_params) if n_excl > len(self.endog) else None
+
+    def _overid(self, kind, groups, maxlag, n_params):
+        """Sargan (iid) or Hansen J from two-step efficient GMM (robust kinds)."""
+        dof = len(self.instruments) - len(self.endog)
+        Z, X, y = self.Z, self.X, self.y
+        e = self.resid
+        if kind == 'iid':
+            Ze = Z.T @ e
+            stat, name = self.nobs * float(Ze @ np.linalg.solve(Z.T @ Z, Ze)) / float(e @ e), 'Sargan'
+        else:
+            S, _ = compute_vcov(kind, np.eye(Z.shape[1]), Z, e, self.df_resid, n_params=n_params,
+                                groups=groups, maxlag=maxlag)
+            W = np.linalg.pinv(S)
+            ZX, Zy = Z.T @ X, Z.T @ y
+            beta_gmm = np.linalg.solve(ZX.T @ W @ ZX, ZX.T @ W @ Zy)
+            g = Z.T @ (y - X @ beta_gmm)
+            stat, name = float(g @ W @ g), 'Hansen J'
+        return {'test': name, 'statistic': stat, 'df': dof, 'p_value': float(chi2.sf(stat, dof))}
+
+    def summary(self):
+        fe_desc = ', '.join(f"{name} ({g})" for name, g in zip(self.fe.names, self.fe.n_groups)) or 'none'
+        method = 'LIML' if self.method == 'liml' else '2SLS'
+        lines = [
+            "=" * 70,
+            f"IV ({method}) with absorbed fixed effects",
+            "=" * 70,
+            f"N obs:            {self.nobs:,}",
+            f"Fixed effects:    {fe_desc}; {self.fe.n_absorbed} absorbed parameters",
+            f"Endogenous:       {', '.join(self.endog)}",
+            f"Instruments:      {', '.join(self.instruments)}",
+            f"Exogenous:        {', '.join(self.exog) or 'none'}",
+            f"Residual df:      {self.df_resid:,}",
+            f"Covariance:       {self.vcov}",
+        ]
+        if self.method == 'liml':
+            lines.append(f"LIML kappa:       {self.kappa:.6f}")
+        lines += [
+            "-" * 70,
+            self.summary_frame().to_string(float_format=lambda v: f"{v:.6f}"),
+            "-" * 70,
+            "First stage (excluded instruments):",
+            self.first_stage.to_string(float_format=lambda v: f"{v:.4f}"),
+            f"Kleibergen-Paap rk Wald F: {self.kp_f:.3f} (rk = {self.kp_rk:.3f}, "
+            f"χ²({self.kp_df}) p = {self.kp_p:.4f})",
+            f"Cragg-Donald Wald F:       {self.cd_f:.3f}",
+        ]
+        if self.overid is not None:
+            o = self.overid
+            lines.append(f"{o['test']} overid:{'':<{max(1, 16 - len(o['test']))}}"
+                         f"{o['statistic']:.3f} (χ²({o['df']}) p = {o['p_value']:.4f})")
+        if self.omitted:
+            lines.append(f"Omitted (collinear with fixed effects): {', '.join(self.omitted)}")
+        lines.append("=" * 70)
+        return "\n".join(lines)
+
+
+def iv_fit(panel, y, endog, instruments, exog=(), method='2sls', vcov='iid', cluster=None, maxlag=None):
+    """
+    IV regression of `y` on `endog` (instrumented by `instruments`) and `exog`,
+    all columns of the PartialledPanel `panel`. `method` is '2sls' or 'liml';
+    `vcov`/`cluster`/`maxlag` as in fe_absorb.ols_absorbed. Instruments or
+    exogenous regressors absorbed by the fixed effects are dropped.
+    """
+    if method not in IV_METHODS:
+        raise ValueError(f"Unknown IV method '{method}' (expected one of {IV_METHODS})")
+    endog = [endog] if isinstance(endog, str) else list(endog)
+    instruments = [instruments] if isinstance(instruments, str) else list(instruments)
+    exog = [exog] if isinstance(exog, str) else list(exog)
+
+    # Exogenous regressors first, so an instrument collinear with them is the one dropped
+    z_names = [*exog, *instruments]
+    z_kept = drop_collinear(panel.matrix(z_names), z_names, panel.matrix(z_names, raw=True))
+    omitted = [n for j, n in enumerate(z_names) if j not in z_kept]
+    exog = [n for n in exog if n not in omitted]
+    instruments = [n for n in instruments if n not in omitted]
+    if len(instruments) < len(endog):
+        raise ValueError(f"Under-identified: {len(instruments)} instrument(s) for {len(endog)} "
+                         f"endogenous variable(s) (dropped: {omitted or 'none'})")
+
+    names = [*endog, *exog]
+    yd = panel.matrix([y])[:, 0]
+    X = panel.matrix(names)
+    Z = panel.matrix([*instruments, *exog])
+    W = panel.matrix(exog)
+
+    kappa = 1.0 if method == '2sls' else liml_kappa(yd, X[:, :len(endog)], Z, W)
+    X_k = X - kappa * _residualise(X, Z)
+    bread = np.linalg.inv(X_k.T @ X)
+    bread = (bread + bread.T) / 2
+    beta = bread @ (X_k.T @ yd)
+    resid = yd - X @ beta
+    df_resid = panel.nobs - X.shape[1] - panel.fe.n_absorbed
+    result = IVResult(names, beta, X_k, resid, bread, df_resid, float(yd @ yd), panel.fe, panel.groups,
+                      omitted, method, kappa, yd, X, Z, endog, instruments, exog)
+    return result.set_vcov(vcov, cluster=cluster, maxlag=maxlag)
+
+
+def _clr_pvalue(clr, r, n_excl, n_nodes=CLR_QUADRATURE_NODES):
+    """
+    P(LR > clr | r) for the conditional likelihood-ratio test with `n_excl`
+    instruments (Andrews, Moreira & Stock 2007), by Gauss-Jacobi quadrature
+    over s in (-1, 1) with weight (1 - s²)^((k-3)/2); vectorised over the grid.
+    """
+    k = n_excl
+    if k == 1:
+        return chi2.sf(clr, 1)
+    a = (k - 3) / 2
+    nodes, weights = roots_jacobi(n_nodes, a, a)
+    const = np.exp(gammaln(k / 2) - gammaln((k - 1) / 2)) / np.sqrt(np.pi)
+    x = np.maximum(clr, 1e-300)[:, None]
+    cdf = chi2.cdf((x + r[:, None]) / (1 + (r[:, None] / x) * nodes ** 2), k)
+    return np.clip(1 - const * (cdf @ weights), 0.0, 1.0)
+
+
+def _accepted_intervals(grid, accepted):
+    """Maximal runs of accepted grid points as (lower, upper); ±inf when a run reaches a grid end."""
+    intervals = []
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], accepted.astype(np.int8), [0]])))
+    for start, stop in zip(edges[::2], edges[1::2] - 1):
+        lower = -np.inf if start == 0 else grid[start]
+        upper = np.inf if stop == len(grid) - 1 else grid[stop]
+        intervals.append((lower, upper))
+    return intervals
+
+
+def format_set(intervals, digits=4):
+    """Confidence set as text, e.g. '[-0.2371, 0.1377]' or '(-inf, -0.4] ∪ [0.1, inf)'; '∅' if empty."""
+    if not intervals:
+        return '∅'
+    parts = []
+    for lower, upper in intervals:
+        left = '(-inf' if np.isneginf(lower) else f"[{lower:.{digits}f}"
+        right = 'inf)' if np.isposinf(upper) else f"{upper:.{digits}f}]"
+        parts.append(f"{left}, {right}")
+    return ' ∪ '.join(parts)
+
+
+def weak_iv_sets(result, grid=None, n_points=WEAK_IV_GRID_POINTS, span=WEAK_IV_SPAN, alpha=0.05):
+    """
+    Anderson-Rubin and conditional LR confidence sets for the single
+    endogenous coefficient of an IVResult, by test inversion over `grid`
+    (default: n_points values within ±span Wald SEs of the estimate). Both
+    use the result's covariance estimator (e.g. district-clustered).
+
+    With π_y, π_x the reduced-form coefficients of y and x on the excluded
+    instruments, the null β = b has moments π(b) = π_y - b π_x, and the
+    covariance of π(b) is quadratic in b:
+        V_ff(b) = V_yy - 2b V_xy + b² V_xx
+    The three L × L blocks come from three panel_vcov calls (scores of y, of
+    x, and of y + x); every grid point is then one batched L × L solve.
+
+        AR(b)  = π(b)' V_ff^-1 π(b)                         ~ χ²(L)
+        D(b)   = π_x - V_xf V_ff^-1 π(b),  V_xf = V_xy - b V_xx
+        LM(b)  = (π' V_ff^-1 D)² / (D' V_ff^-1 D)           ~ χ²(1)
+        r(b)   = D' (V_xx - V_xf V_ff^-1 V_xf')^-1 D        (conditioning statistic)
+        CLR(b) = ½ [AR - r + sqrt((AR + r)² - 4 (AR - LM) r)], p-value given r
+
+    Returns (grid frame: beta, ar_stat, ar_p, clr_stat, clr_p; sets frame:
+    test, set, lower, upper, bounded). A set reaching a grid end is reported
+    as unbounded on that side. Under two-way clustering the eigenvalue clip
+    makes V_ff(b) only approximately quadratic.
+    """
+    if len(result.endog) != 1:
+        raise ValueError("weak_iv_sets: AR/CLR sets need exactly one endogenous variable")
+    endog = result.endog[0]
+    if grid is None:
+        centre, se = result.params[endog], result.bse[endog]
+        grid = np.linspace(centre - span * se, centre + span * se, n_points)
+    grid = np.asarray(grid, dtype=np.float64)
+
+    Z1, X1, y1, df_first, n_params, groups = result.reduced_form()
+    x1 = X1[:, 0]
+    n_excl = Z1.shape[1]
+    ZZ_inv = np.linalg.inv(Z1.T @ Z1)
+    pi_y, pi_x = ZZ_inv @ (Z1.T @ y1), ZZ_inv @ (Z1.T @ x1)
+    v_y, v_x = y1 - Z1 @ pi_y, x1 - Z1 @ pi_x
+
+    def block(resid):
+        cov, _ = compute_vcov(result.vcov_kind, ZZ_inv, Z1, resid, df_first, n_params=n_params,
+                              groups=groups, maxlag=result.maxlag)
+        return cov
+
+    V_yy, V_xx, V_sum = block(v_y), block(v_x), block(v_y + v_x)
+    V_xy = (V_sum - V_yy - V_xx) / 2
+
+    b = grid[:, None, None]
+    pi = pi_y[None, :] - grid[:, None] * pi_x[None, :]                 # nb × L
+    V_ff = V_yy[None] - 2 * b * V_xy[None] + b ** 2 * V_xx[None]       # nb × L × L
+    V_xf = V_xy[None] - b * V_xx[None]
+    Vinv_pi = np.linalg.solve(V_ff, pi[..., None])[..., 0]
+    ar = np.einsum('bl,bl->b', pi, Vinv_pi)
+
+    D = pi_x[None, :] - np.einsum('blm,bm->bl', V_xf, Vinv_pi)
+    Vinv_D = np.linalg.solve(V_ff, D[..., None])[..., 0]
+    lm = np.einsum('bl,bl->b', pi, Vinv_D) ** 2 / np.einsum('bl,bl->b', D, Vinv_D)
+    V_dd = V_xx[None] - V_xf @ np.linalg.solve(V_ff, np.swapaxes(V_xf, 1, 2))
+    r = np.einsum('bl,bl->b', D, np.linalg.solve(V_dd, D[..., None])[..., 0])
+    clr = 0.5 * (ar - r + np.sqrt(np.maximum((ar + r) ** 2 - 4 * (ar - lm) * r, 0.0)))
+
+    frame = pd.DataFrame({'beta': grid, 'ar_stat': ar, 'ar_p': chi2.sf(ar, n_excl),
+                          'clr_stat': clr, 'clr_p': _clr_pvalue(clr, r, n_excl)})
+    sets = []
+    for test in ['ar', 'clr']:
+        intervals = _accepted_intervals(grid, frame[f'{test}_p'].to_numpy() > alpha)
+        sets.append({'test': test.upper(), 'set': format_set(intervals),
+                     'lower': min((lo for lo, _ in intervals), default=np.nan),
+                     'upper': max((hi for _, hi in intervals), default=np.nan),
+                     'bounded': bool(intervals) and all(np.isfinite(v) for iv in intervals for v in iv)})
+    return frame, pd.DataFrame(sets)
@@ -0,0 +1,201 @@
+"""
+panel_keys.py - Canonical integer keys and compact dtypes for the district panels
+
+Every stage joins on the same three surrogate keys instead of name strings:
+
+  district_id  int32  position of (state_gadm, district_gadm) in the district
+                      registry; names are unique only within a state
+                      (Aurangabad, Bilaspur, Hamirpur, ... exist twice)
+  quarter_id   int16  year * 4 + (q - 1), e.g. 2019Q3 → 8078
+                      (same index as district_lineage.quarter_index)
+  month_id     int16  year * 12 + (month - 1)
+
+The registry is written by Script 09 from the GADM 4.1 districts:
+
+    02_Data_Intermediate/district_registry.csv
+    district_id, state_gadm, district_gadm
+
+Names, state names and quarter labels stay on the panels as categorical
+lookups. Joins on the keys go through `key_join`, which packs
+(district_id, quarter_id) into one int64 and aligns rows by array indexing.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+from data_store import read_dataset
+
+REGISTRY_PATH = '02_Data_Intermediate/district_registry.csv'
+
+DISTRICT_KEY = 'district_id'
+QUARTER_KEY = 'quarter_id'
+MONTH_KEY = 'month_id'
+PANEL_KEYS = [DISTRICT_KEY, QUARTER_KEY]
+
+KEY_DTYPES = {DISTRICT_KEY: np.int32, QUARTER_KEY: np.int16, MONTH_KEY: np.int16}
+
+
+# === Time keys ===
+
+def quarter_id(year, q):
+    """(year, quarter 1-4) → int16 quarter index."""
+    return (np.asarray(year, dtype=np.int32) * 4 + np.asarray(q, dtype=np.int32) - 1).astype(np.int16)
+
+
+def month_id(year, month):
+    """(year, month 1-12) → int16 month index."""
+    return (np.asarray(year, dtype=np.int32) * 12 + np.asarray(month, dtype=np.int32) - 1).astype(np.int16)
+
+
+def quarter_of_month(month_ids):
+    """Month index → quarter index of the calendar quarter containing it."""
+    m = np.asarray(month_ids, dtype=np.int32)
+    return ((m // 12) * 4 + (m % 12) // 3).astype(np.int16)
+
+
+def parse_quarter(labels):
+    """'2019Q3' labels → int16 quarter index."""
+    parts = pd.Series(labels, dtype=str).str.upper().str.extract(r'^(\d{4})Q([1-4])$')
+    if parts.isna().any().any():
+        bad = pd.Series(labels)[parts[0].isna().to_numpy()].unique()[:5]
+        raise ValueError(f"Unparseable quarter labels: {list(bad)}")
+    return quarter_id(parts[0].astype(int), parts[1].astype(int))
+
+
+def quarter_year(qids):
+    """Quarter index → (year, q) arrays."""
+    qids = np.asarray(qids, dtype=np.int32)
+    return (qids // 4).astype(np.int16), (qids % 4 + 1).astype(np.int8)
+
+
+def quarter_labels(qids):
+    """Quarter index → '2019Q3' labels."""
+    year, q = quarter_year(qids)
+    return pd.Series(year).astype(str).str.cat(pd.Series(q).astype(str), sep='Q').to_numpy()
+
+
+# === District registry ===
+
+def build_registry(districts, district_col='district_gadm', state_col='state_gadm'):
+    """Registry frame with district_id assigned in (state, district) order."""
+    reg = (districts[[state_col, district_col]]
+           .drop_duplicates()
+           .rename(columns={state_col: 'state_gadm', district_col: 'district_gadm'})
+           .sort_values(['state_gadm', 'district_gadm'])
+           .reset_index(drop=True))
+    reg.insert(0, DISTRICT_KEY, np.arange(len(reg), dtype=np.int32))
+    return reg
+
+
+def load_registry(path=REGISTRY_PATH):
+    """Load the registry; rebuilt from the skeleton if Script 09 has not written it yet."""
+    if os.path.exists(path):
+        reg = pd.read_csv(path, dtype={'state_gadm': str, 'district_gadm': str})
+        reg[DISTRICT_KEY] = reg[DISTRICT_KEY].astype(np.int32)
+        return reg
+    skeleton = read_dataset('district_quarter_skeleton', columns=['district_gadm', 'state_gadm'])
+    return build_registry(skeleton.astype(str))
+
+
+def save_registry(registry, path=REGISTRY_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    registry.to_csv(path, index=False)
+
+
+def district_ids(registry, districts, states):
+    """
+    Look up district_id for (district, state) name pairs; -1 where the pair is
+    not in the registry. Both names are required, so same-named districts in
+    different states never collide.
+    """
+    index = pd.MultiIndex.from_frame(registry[['state_gadm', 'district_gadm']])
+    query = pd.MultiIndex.from_arrays([pd.Series(states, dtype=object).to_numpy(),
+                                       pd.Series(districts, dtype=object).to_numpy()])
+    return index.get_indexer(query).astype(np.int32)
+
+
+# === Attaching keys / compact schema ===
+
+def attach_keys(df, registry, district_col='district_gadm', state_col='state_gadm'):
+    """
+    Add district_id / quarter_id / month_id from whichever name and time columns
+    the frame carries (year+q, quarter label, year+month). Existing keys are kept.
+    Rows whose district is not in the registry get district_id -1.
+    """
+    df = df.copy()
+    if DISTRICT_KEY not in df.columns and district_col in df.columns and state_col in df.columns:
+        df[DISTRICT_KEY] = district_ids(registry, df[district_col], df[state_col])
+        n_missing = int((df[DISTRICT_KEY] < 0).sum())
+        if n_missing > 0:
+            print(f"   ⚠ {n_missing} rows with districts not in the registry (district_id = -1)")
+    if MONTH_KEY not in df.columns and {'year', 'month'} <= set(df.columns):
+        df[MONTH_KEY] = month_id(df['year'], df['month'])
+    if QUARTER_KEY not in df.columns:
+        if 'quarter' in df.columns:
+            df[QUARTER_KEY] = parse_quarter(df['quarter'])
+        elif {'year', 'q'} <= set(df.columns):
+            df[QUARTER_KEY] = quarter_id(df['year'], df['q'])
+        elif MONTH_KEY in df.columns:
+            df[QUARTER_KEY] = quarter_of_month(df[MONTH_KEY])
+    return df.astype({k: t for k, t in KEY_DTYPES.items() if k in df.columns})
+
+
+def compact_panel(df, registry=None):
+    """
+    Categorical names and quarter labels, small integer time columns and 0/1
+    flags as int8. Category sets come from the registry so codes agree across
+    panels.
+    """
+    df = df.copy()
+    if registry is not None:
+        for col in ('district_gadm', 'state_gadm'):
+            if col in df.columns:
+                df[col] = pd.Categorical(df[col], categories=sorted(registry[col].unique()))
+    if 'quarter' in df.columns:
+        df['quarter'] = pd.Categorical(df['quarter'], categories=sorted(df['quarter'].dropna().unique()),
+                                       ordered=True)
+    for col, dtype in [('year', np.int16), ('q', np.int8), ('month', np.int8), ('quarter_num', np.int16)]:
+        if col in df.columns and df[col].notna().all():
+            df[col] = df[col].astype(dtype)
+    for col in df.columns:
+        if col.startswith('flood_exposure_') and df[col].notna().all() and df[col].isin([0, 1]).all():
+            df[col] = df[col].astype(np.int8)
+    return df
+
+
+# === Integer joins ===
+
+def pack_keys(district, quarter):
+    """(district_id, quarter_id) → single int64 key."""
+    return (np.asarray(district, dtype=np.int64) << 16) | (np.asarray(quarter, dtype=np.int64) & 0xFFFF)
+
+
+def key_join(left, right, columns, keys=PANEL_KEYS):
+    """
+    Left-join `columns` of `right` onto `left` by integer keys (validate 1:1 on
+    the right). Rows are aligned by get_indexer on the packed key; no string
+    comparison and no re-sort of `left`.
+    """
+    if len(keys) == 2:
+        right_key = pack_keys(right[keys[0]], right[keys[1]])
+        left_key = pack_keys(left[keys[0]], left[keys[1]])
+    else:
+        right_key = right[keys[0]].to_numpy(np.int64)
+        left_key = left[keys[0]].to_numpy(np.int64)
+    index = pd.Index(right_key)
+    if not index.is_unique:
+        raise ValueError(f"key_join: right side has {index.duplicated().sum()} duplicate {keys} rows")
+    pos = index.get_indexer(left_key)
+    hit = pos >= 0
+    out = left.copy()
+    if len(right) == 0:
+        for col in columns:
+            out[col] = np.nan
+        return out
+    take = np.where(hit, pos, 0)
+    for col in columns:
+        taken = right[col].iloc[take].reset_index(drop=True)
+        # Unmatched rows become NaN (ints promote to float, like a pandas left merge)
+        out[col] = (taken if hit.all() else taken.where(hit)).to_numpy()
+    return out
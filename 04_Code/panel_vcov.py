@@ -0,0 +1,130 @@
+"""
+panel_vcov.py - Sandwich variance estimators for panel regressions
+
+Every estimator here is  bread @ meat @ bread  with  bread = (X'X)^-1  and a
+meat built from the score rows  s_i = x_i * e_i. The clustered and
+Driscoll-Kraay meats only need the score sums per cluster (or per period),
+a G × k array from one sparse group-sum. Nothing N × N is ever formed, so
+the cost over the point estimate is one pass over the N × k scores.
+
+  iid      s² (X'X)^-1
+  HC1      White, scaled by N / df_resid
+  cluster  one-way (e.g. district), c = G/(G-1) · (N-1)/(N-K)
+  twoway   V_a + V_b - V_ab (Cameron-Gelbach-Miller), negative eigenvalues
+           clipped to zero; each term has its own G/(G-1)
+  DK       Driscoll-Kraay: period score sums with Bartlett-weighted
+           autocovariances up to `maxlag` periods, robust to cross-sectional
+           (spatial) correlation within a period; gaps in the period index
+           count as periods
+
+Inference uses t(df_t): df_resid for iid/HC1, G-1 for cluster, min(G_a, G_b)-1
+for twoway, T-1 for DK.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+VCOV_KINDS = ['iid', 'HC1', 'cluster', 'twoway', 'DK']
+
+
+def group_sums(values, groups):
+    """Column sums of `values` (N × k) per group; returns (G × k array, group codes)."""
+    codes, uniques = pd.factorize(np.asarray(groups), sort=True)
+    n_groups = len(uniques)
+    indicator = sparse.csr_matrix((np.ones(len(codes)), (codes, np.arange(len(codes)))),
+                                  shape=(n_groups, len(codes)))
+    return indicator @ values, codes
+
+
+def cluster_meat(scores, groups):
+    """Σ_g S_g S_g' from per-cluster score sums; returns (meat, number of clusters)."""
+    sums, _ = group_sums(scores, groups)
+    return sums.T @ sums, sums.shape[0]
+
+
+def _sandwich(bread, meat):
+    cov = bread @ meat @ bread
+    return (cov + cov.T) / 2
+
+
+def _psd(cov):
+    """Clip negative eigenvalues (two-way clustering can produce them)."""
+    eigval, eigvec = np.linalg.eigh(cov)
+    if eigval.min() >= 0:
+        return cov
+    return (eigvec * np.maximum(eigval, 0.0)) @ eigvec.T
+
+
+def vcov_iid(bread, resid, df_resid):
+    return float(resid @ resid) / df_resid * bread, df_resid
+
+
+def vcov_hc1(bread, scores, nobs, df_resid):
+    return nobs / df_resid * _sandwich(bread, scores.T @ scores), df_resid
+
+
+def vcov_cluster(bread, scores, groups, nobs, n_params):
+    """One-way cluster-robust covariance with the Stata small-sample factor."""
+    meat, G = cluster_meat(scores, groups)
+    scale = G / (G - 1) * (nobs - 1) / (nobs - n_params)
+    return scale * _sandwich(bread, meat), G - 1
+
+
+def vcov_twoway(bread, scores, groups_a, groups_b, nobs, n_params):
+    """Two-way cluster-robust covariance: V_a + V_b - V_(a∩b)."""
+    cov_a, df_a = vcov_cluster(bread, scores, groups_a, nobs, n_params)
+    cov_b, df_b = vcov_cluster(bread, scores, groups_b, nobs, n_params)
+    both = pd.factorize(pd.MultiIndex.from_arrays([np.asarray(groups_a), np.asarray(groups_b)]))[0]
+    cov_ab, _ = vcov_cluster(bread, scores, both, nobs, n_params)
+    return _psd(cov_a + cov_b - cov_ab), min(df_a, df_b)
+
+
+def default_maxlag(n_periods):
+    """Newey-West rule of thumb: floor(4 (T/100)^(2/9))."""
+    return int(np.floor(4 * (n_periods / 100) ** (2 / 9)))
+
+
+def vcov_driscoll_kraay(bread, scores, periods, nobs, n_params, maxlag=None):
+    """
+    Driscoll-Kraay covariance. `periods` are integer period indices (e.g.
+    quarter_id); score sums are laid on the full period range so lags follow
+    calendar time.
+    """
+    periods = np.asarray(periods, dtype=np.int64)
+    offset = periods - periods.min()
+    n_periods = int(offset.max()) + 1
+    sums = np.zeros((n_periods, scores.shape[1]))
+    np.add.at(sums, offset, scores)
+    T = len(np.unique(offset))
+    maxlag = default_maxlag(T) if maxlag is None else maxlag
+    meat = sums.T @ sums
+    for lag in range(1, maxlag + 1):
+        weight = 1 - lag / (maxlag + 1)
+        gamma = sums[lag:].T @ sums[:-lag]
+        meat += weight * (gamma + gamma.T)
+    scale = (nobs - 1) / (nobs - n_params)
+    return scale * _sandwich(bread, meat), T - 1
+
+
+def compute_vcov(kind, bread, X, resid, df_resid, n_params=None, groups=(), maxlag=None):
+    """
+    Covariance of the coefficients on X (demeaned regressors) and the t
+    degrees of freedom. `groups` holds the cluster arrays (one for 'cluster',
+    two for 'twoway', the period index for 'DK'); `n_params` is K in the
+    small-sample factor (regressors plus FE parameters not nested in clusters).
+    """
+    nobs = len(resid)
+    n_params = nobs - df_resid if n_params is None else n_params
+    if kind == 'iid':
+        return vcov_iid(bread, resid, df_resid)
+    scores = X * resid[:, None]
+    if kind == 'HC1':
+        return vcov_hc1(bread, scores, nobs, df_resid)
+    if kind == 'cluster':
+        return vcov_cluster(bread, scores, groups[0], nobs, n_params)
+    if kind == 'twoway':
+        return vcov_twoway(bread, scores, groups[0], groups[1], nobs, n_params)
+    if kind == 'DK':
+        return vcov_driscoll_kraay(bread, scores, groups[0], nobs, n_params, maxlag)
+    raise ValueError(f"Unknown vcov '{kind}' (expected one of {VCOV_KINDS})")
@@ -0,0 +1,250 @@
+"""
+randomization_inference.py - Permutation (randomization-inference) tests for flood timing effects
+
+The H3 distributed-lag model
+
+    y_it = Σ_{l=0..L} β_l flood_{i,t-l} + district FE + quarter FE + e_it
+
+is re-estimated on reshuffled flood exposure. If the observed effects are
+genuine, they should be extreme in the distribution of estimates obtained
+when the timing or location of floods is scrambled. Three schemes:
+
+    within_district   each district's flood series permuted across its
+                      observed quarters (breaks timing, keeps flood counts)
+    within_quarter    flood values permuted across districts within each
+                      quarter (breaks location, keeps the seasonal pattern)
+    event_blocks      each district's whole flood history rotated by a random
+                      number of observed quarters; multi-quarter events and the
+                      spacing of repeated events move as blocks
+
+Draws are integer index arrays into the district × quarter grid (PanelArray),
+built for a batch of draws at once with argsort / take_along_axis; cells
+outside the observed quarters (the 2016Q3-2017Q1 gap) never move, so the
+estimation sample is the same in every draw. Lags are taken after permuting.
+
+The outcome is partialled out of the FEs once. Per batch, the permuted
+regressors of all draws are demeaned together (one FixedEffects.demean call
+on an N × (draws × k) block), and the coefficients and district-clustered t
+statistics of every draw come from batched k × k solves and one sparse
+cluster-sum. Batches run in a process pool. p-values are two-sided,
+(1 + #{|stat*| ≥ |stat|}) / (1 + draws), for each coefficient and the sum of
+coefficients ('cumulative'), using both the coefficient and its clustered t.
+
+Usage:
+    python 04_Code/randomization_inference.py                # H3 lag model, 5,000 draws per scheme
+    python 04_Code/randomization_inference.py --draws 500 --workers 1
+
+    test = PermutationTest(df, 'deposit_change_qt', 'flood_exposure_ruleA_qt', lags=2)
+    summary, draws = test.run('within_district', n_draws=5000)
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from panel_keys import PANEL_KEYS, load_registry, attach_keys
+from panel_array import PanelArray
+from fe_absorb import FixedEffects, nested_levels
+from data_store import read_dataset
+
+SCHEMES = ['within_district', 'within_quarter', 'event_blocks']
+RI_DRAWS = 5_000
+RI_BATCH = 250
+RI_SEED = 20240612
+OUTPUT_PATH = '05_Outputs/Tables/04_H3_permutation.csv'
+
+
+class PermutationTest:
+    """Distributed-lag FE regression of `y` on `treatment` and its lags, re-estimated under permutations."""
+
+    def __init__(self, df, y, treatment, lags=0, fe=PANEL_KEYS, cluster=PANEL_KEYS[0]):
+        self.y, self.treatment, self.lags = y, treatment, lags
+        self.names = [treatment] + [f'{treatment}_L{l}' for l in range(1, lags + 1)]
+        self.panel = PanelArray.from_frame(df, [treatment], unit_col=fe[0], time_col=fe[1])
+        grid = self.panel[treatment]
+        self.grid = grid.ravel()
+        self.valid = ~np.isnan(grid)
+        n_periods = self.panel.shape[1]
+
+        # Grid position of each row's treatment at lag l
+        self.positions = np.column_stack([self.panel.row_pos * n_periods + self.panel.col_pos - l
+                                          for l in range(lags + 1)])
+        X_obs = np.column_stack([self.panel.gather(self.panel.lag(treatment, l)) for l in range(lags + 1)])
+        complete = (df[[y, *fe, cluster]].notna().all(axis=1).to_numpy()
+                    & ~np.isnan(X_obs).any(axis=1) & (self.panel.col_pos >= 0))
+        self.fe = FixedEffects.from_frame(df, fe, mask=complete)
+        self.positions = self.positions[self.fe.keep]
+        self.yd = self.fe.demean(df.loc[self.fe.keep, y].to_numpy(dtype=np.float64))
+
+        groups = df.loc[self.fe.keep, cluster].to_numpy()
+        codes, uniques = pd.factorize(groups)
+        self.n_clusters = len(uniques)
+        self.cluster_sum = sparse.csr_matrix((np.ones(len(codes)), (codes, np.arange(len(codes)))),
+                                             shape=(self.n_clusters, len(codes)))
+        nobs, k = len(self.yd), lags + 1
+        n_params = k + self.fe.n_absorbed - nested_levels(self.fe, [groups])
+        self.scale = self.n_clusters / (self.n_clusters - 1) * (nobs - 1) / (nobs - n_params)
+        self.nobs = nobs
+
+    # ------------------------------------------------------------------
+    # Draws: flat source indices into the grid, one U × T array per draw
+    # ------------------------------------------------------------------
+
+    def draw_indices(self, scheme, n_draws, rng):
+        """(n_draws × U × T) int array: cell (i, t) takes the treatment of grid cell src[i, t]."""
+        if scheme not in SCHEMES:
+            raise ValueError(f"Unknown scheme '{scheme}' (expected one of {SCHEMES})")
+        n_units, n_periods = self.valid.shape
+        if scheme == 'within_quarter':
+            cols = self._permute_rows(self.valid.T, n_draws, rng)               # d × T × U: source unit
+            return np.swapaxes(cols, 1, 2) * n_periods + np.arange(n_periods)[None, None, :]
+        if scheme == 'within_district':
+            cols = self._permute_rows(self.valid, n_draws, rng)
+        else:
+            cols = self._rotate_rows(self.valid, n_draws, rng)
+        return np.arange(n_units)[None, :, None] * n_periods + cols
+
+    @staticmethod
+    def _permute_rows(valid, n_draws, rng):
+        """Per row, a random permutation of its valid positions; invalid positions map to themselves."""
+        order = np.argsort(~valid, axis=1, kind='stable')                     # valid positions first
+        keys = rng.random((n_draws, *valid.shape))
+        keys[:, ~valid] = 2.0
+        shuffled = np.argsort(keys, axis=2, kind='stable')                    # valid ones in random order
+        src = np.broadcast_to(np.arange(valid.shape[1]), (n_draws, *valid.shape)).copy()
+        np.put_along_axis(src, np.broadcast_to(order, src.shape), shuffled, axis=2)
+        return src
+
+    @staticmethod
+    def _rotate_rows(valid, n_draws, rng):
+        """Per row, the valid positions cyclically shifted by a random offset."""
+        order = np.argsort(~valid, axis=1, kind='stable')
+        n_valid = valid.sum(axis=1)
+        shift = (rng.random((n_draws, valid.shape[0])) * np.maximum(n_valid, 1)).astype(np.int64)
+        k = np.arange(valid.shape[1])
+        rotated = np.where(k < n_valid[:, None], (k + shift[:, :, None]) % np.maximum(n_valid, 1)[:, None], k)
+        source = np.take_along_axis(np.broadcast_to(order, rotated.shape), rotated, axis=2)
+        src = np.broadcast_to(np.arange(valid.shape[1]), rotated.shape).copy()
+        np.put_along_axis(src, np.broadcast_to(order, src.shape), source, axis=2)
+        return src
+
+    # ------------------------------------------------------------------
+    # Batched estimation
+    # ------------------------------------------------------------------
+
+    def statistics(self, src):
+        """
+        Coefficients and clustered t statistics (each n_draws × (k + 1), the last
+        column the cumulative sum) for the draws in `src`; src=None is the observed data.
+        """
+        if src is None:
+            X = self.grid[self.positions][:, None, :]                         # N × 1 × k
+        else:
+            flat = src.reshape(src.shape[0], -1)
+            X = np.stack([self.grid[flat[:, self.positions[:, l]]].T for l in range(self.lags + 1)], axis=2)
+        nobs, n_draws, k = X.shape
+        Xd = self.fe.demean(X.reshape(nobs, n_draws * k)).reshape(nobs, n_draws, k)
+
+        XtX = np.einsum('nbk,nbl->bkl', Xd, Xd)
+        bread = np.linalg.inv(XtX)
+        beta = np.einsum('bkl,bl->bk', bread, np.einsum('nbk,n->bk', Xd, self.yd))
+        resid = self.yd[:, None] - np.einsum('nbk,bk->nb', Xd, beta)
+        sums = (self.cluster_sum @ (Xd * resid[:, :, None]).reshape(nobs, n_draws * k)).reshape(-1, n_draws, k)
+        meat = np.einsum('gbk,gbl->bkl', sums, sums)
+        cov = self.scale * bread @ meat @ bread
+
+        ones = np.ones(k)
+        coef = np.column_stack([beta, beta.sum(axis=1)])
+        se = np.column_stack([np.sqrt(np.einsum('bkk->bk', cov)), np.sqrt(np.einsum('k,bkl,l->b', ones, cov, ones))])
+        return coef, coef / se
+
+    def run(self, scheme='within_district', n_draws=RI_DRAWS, batch=RI_BATCH, workers=None, seed=RI_SEED):
+        """
+        Permutation distribution under `scheme`. Returns (summary frame: one
+        row per statistic with observed value and p-values; draws frame: the
+        permuted coefficients and t statistics).
+        """
+        sizes = [min(batch, n_draws - start) for start in range(0, n_draws, batch)]
+        seeds = np.random.SeedSequence([seed, SCHEMES.index(scheme)]).spawn(len(sizes))
+        tasks = [(scheme, size, s) for size, s in zip(sizes, seeds)]
+        workers = min(os.cpu_count() or 1, len(tasks)) if workers is None else workers
+        if workers <= 1:
+            parts = [self._run_batch(*task) for task in tasks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(self,)) as pool:
+                parts = list(pool.map(_run_batch_in_worker, tasks))
+        coef = np.vstack([c for c, _ in parts])
+        tstat = np.vstack([t for _, t in parts])
+
+        coef_obs, t_obs = (a[0] for a in self.statistics(None))
+        labels = self.names + ['cumulative']
+        summary = pd.DataFrame({
+            'scheme': scheme, 'variable': labels, 'coefficient': coef_obs, 't_statistic': t_obs,
+            'p_value_coef': (1 + (np.abs(coef) >= np.abs(coef_obs)).sum(axis=0)) / (1 + len(coef)),
+            'p_value_t': (1 + (np.abs(tstat) >= np.abs(t_obs)).sum(axis=0)) / (1 + len(tstat)),
+            'perm_mean': coef.mean(axis=0), 'perm_sd': coef.std(axis=0, ddof=1),
+            'draws': len(coef), 'nobs': self.nobs,
+        })
+        draws = pd.concat([pd.DataFrame(coef, columns=[f'coef_{n}' for n in labels]),
+                           pd.DataFrame(tstat, columns=[f't_{n}' for n in labels])], axis=1)
+        return summary, draws
+
+    def _run_batch(self, scheme, size, seed_seq):
+        return self.statistics(self.draw_indices(scheme, size, np.random.default_rng(seed_seq)))
+
+
+_WORKER_TEST = None
+
+
+def _init_worker(test):
+    global _WORKER_TEST
+    _WORKER_TEST = test
+
+
+def _run_batch_in_worker(task):
+    return _WORKER_TEST._run_batch(*task)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Permutation tests for the H3 distributed-lag model.")
+    parser.add_argument('--draws', type=int, default=RI_DRAWS)
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument('--schemes', nargs='+', default=SCHEMES, choices=SCHEMES)
+    args = parser.parse_args(argv)
+
+    print("=" * 70)
+    print("H3 RANDOMIZATION INFERENCE (flood timing placebo tests)")
+    print("=" * 70)
+    df = read_dataset('regression_panel_final')
+    df = attach_keys(df, load_registry())
+    df = df.sort_values(PANEL_KEYS).reset_index(drop=True)
+
+    # Same model as Script 29: contemporaneous Rule A flood + 2 lags, district + quarter FE
+    test = PermutationTest(df, 'deposit_change_qt', 'flood_exposure_ruleA_qt', lags=2)
+    print(f"  ✓ {test.nobs:,} obs, {test.n_clusters} district clusters, {args.draws:,} draws per scheme")
+
+    summaries = []
+    for scheme in args.schemes:
+        start = time.perf_counter()
+        summary, _ = test.run(scheme, n_draws=args.draws, workers=args.workers)
+        summaries.append(summary)
+        print(f"  ✓ {scheme}: {time.perf_counter() - start:.1f}s")
+    results = pd.concat(summaries, ignore_index=True)
+    results.to_csv(OUTPUT_PATH, index=False)
+
+    print()
+    print(results[['scheme', 'variable', 'coefficient', 't_statistic', 'p_value_coef', 'p_value_t']]
+          .to_string(index=False, float_format=lambda v: f"{v:.4f}"))
+    print()
+    print(f"  Table: {OUTPUT_PATH}")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,310 @@
+"""
+rbi_io.py - Cached ingestion of the RBI district deposit workbooks
+
+Each workbook is parsed once (header row 5, first sheet) into a typed Parquet
+file keyed by the SHA-256 of the workbook bytes, so any later read of an
+unchanged workbook comes from the cache and a replaced workbook is re-parsed
+automatically. Cache misses are parsed in parallel, one worker process per
+workbook; workers run this module as a script, so the calling analysis
+scripts are never re-imported by the child processes.
+
+Parsed layout:
+  - column names are strings (timestamp headers → 'YYYY-MM-DD')
+  - the row under the header ('No. of Offices' / 'Deposit' / ...) is removed
+    and kept as df.attrs['subheader'] {column: label}
+  - identifier columns (region/state/district/population group) are strings,
+    value columns are float64
+
+Two header layouts exist, both as column triplets under one quarter header:
+  - timestamp headers ('2025-09-30'): offices, accounts, deposit amount
+  - fiscal headers ('2022-23:Q3'):    offices, deposit, credit
+melt_workbook() maps both to calendar quarters vectorially and reshapes every
+quarter of a workbook to long form in one step. The 2023-2024 workbook also
+splits each district into population groups (rural → metropolitan); those rows
+keep their population_group so group-resolved panels can be built and rolled up.
+
+Usage:
+    from rbi_io import read_rbi_workbooks, melt_workbook, RBI_PATHS
+    workbooks = read_rbi_workbooks(RBI_PATHS)    # {path: DataFrame}
+    long = melt_workbook(workbooks[RBI_PATHS[0]])
+
+    python 04_Code/rbi_io.py                     # warm the cache for all workbooks
+"""
+
+import os
+import re
+import sys
+import glob
+import hashlib
+import importlib.util
+import subprocess
+from datetime import datetime
+import numpy as np
+import pandas as pd
+
+RBI_PATHS = [
+    '01_Data_Raw/RBI_Bank_Data/RBI_Deposits_2023_2024.xlsx',
+    '01_Data_Raw/RBI_Bank_Data/RBI_Deposits_2017_2022.xlsx',
+    '01_Data_Raw/RBI_Bank_Data/RBI_Deposits_2004_2017.xlsx',
+]
+CACHE_DIR = '02_Data_Intermediate/cache/rbi'
+HEADER_ROW = 5
+
+# Quarter headers: fiscal 'YYYY-YY:Qn' (Indian FY, April start) or calendar timestamps
+FISCAL_HEADER = re.compile(r'^(\d{4})-\d{2}:Q([1-4])$')
+DATE_HEADER = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+
+# Column order inside each quarter triplet when the sub-header row is unavailable
+TRIPLET_LAYOUTS = {
+    'fiscal': ['offices', 'deposits', 'credit'],
+    'date': ['offices', 'accounts', 'deposits'],
+}
+
+# RBI population groups (2023-2024 workbook only), rural → metropolitan
+POPULATION_GROUPS = ['Rural', 'Semi-urban', 'Urban', 'Metropolitan']
+URBAN_GROUPS = ['Urban', 'Metropolitan']
+
+# calamine (Rust) parses these workbooks ~6x faster than openpyxl
+EXCEL_ENGINE = 'calamine' if importlib.util.find_spec('python_calamine') else 'openpyxl'
+
+
+def file_hash(path, chunk_size=1 << 20):
+    """SHA-256 of the file contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_path(path, cache_dir=CACHE_DIR, digest=None):
+    """Parquet path for a workbook: <stem>.<hash16>.parquet."""
+    digest = digest or file_hash(path)
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return os.path.join(cache_dir, f'{stem}.{digest[:16]}.parquet')
+
+
+def _column_name(col):
+    if isinstance(col, (datetime, pd.Timestamp)):
+        return col.strftime('%Y-%m-%d')
+    return str(col)
+
+
+def parse_workbook(path, sheet_name=0, header=HEADER_ROW, engine=EXCEL_ENGINE):
+    """Parse one RBI workbook into a typed DataFrame (see module docstring)."""
+    df = pd.read_excel(path, sheet_name=sheet_name, header=header, engine=engine)
+    df.columns = [_column_name(c) for c in df.columns]
+
+    # Row 0 under the header holds the metric labels of each triplet
+    subheader = {c: str(v).strip() for c, v in df.iloc[0].items() if pd.notna(v)}
+    df = df.iloc[1:].reset_index(drop=True)
+
+    for col in df.columns:
+        values = pd.to_numeric(df[col], errors='coerce')
+        n_present = df[col].notna().sum()
+        if n_present > 0 and values.notna().sum() >= 0.5 * n_present:
+            df[col] = values.astype('float64')
+        else:
+            df[col] = df[col].astype('string').str.strip()
+    df.attrs['subheader'] = subheader
+    df.attrs['source'] = os.path.basename(path)
+    return df
+
+
+def _write_cache(path, out_path):
+    """Parse a workbook and atomically write its Parquet cache, removing stale versions."""
+    df = parse_workbook(path)
+    os.makedirs(os.path.dirname(out_path), exist_ok=True)
+    tmp_path = out_path + '.tmp'
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, out_path)
+
+    stem = os.path.basename(out_path).split('.')[0]
+    for old in glob.glob(os.path.join(os.path.dirname(out_path), f'{stem}.*.parquet')):
+        if os.path.abspath(old) != os.path.abspath(out_path):
+            os.remove(old)
+
+
+def build_cache(paths, cache_dir=CACHE_DIR, max_workers=None):
+    """
+    Ensure every workbook has an up-to-date cache file.
+    Returns {path: cache file}; misses are parsed in parallel worker processes.
+    """
+    targets = {p: cache_path(p, cache_dir) for p in paths}
+    misses = [p for p, out in targets.items() if not os.path.exists(out)]
+    if len(misses) == 1:
+        _write_cache(misses[0], targets[misses[0]])
+    elif misses:
+        max_workers = max_workers or min(len(misses), os.cpu_count() or 1)
+        script = os.path.abspath(__file__)
+        for start in range(0, len(misses), max_workers):
+            batch = misses[start:start + max_workers]
+            procs = [subprocess.Popen([sys.executable, script, p, targets[p]]) for p in batch]
+            failed = [p for p, proc in zip(batch, procs) if proc.wait() != 0]
+            if failed:
+                raise RuntimeError(f"Failed to parse RBI workbook(s): {failed}")
+    return targets
+
+
+def read_rbi_workbooks(paths=RBI_PATHS, cache_dir=CACHE_DIR):
+    """Read workbooks through the Parquet cache. Missing files are skipped with a warning."""
+    present = []
+    for p in paths:
+        if os.path.exists(p):
+            present.append(p)
+        else:
+            print(f"   ⚠ File not found, skipping: {p}")
+    targets = build_cache(present, cache_dir)
+    return {p: pd.read_parquet(targets[p]) for p in present}
+
+
+def read_rbi_workbook(path, cache_dir=CACHE_DIR):
+    """Read a single workbook through the Parquet cache."""
+    return read_rbi_workbooks([path], cache_dir)[path]
+
+
+def calendar_quarters(headers):
+    """
+    Vectorised quarter-header parsing.
+    Fiscal Qn of FY YYYY-YY → calendar Q(n+1) of YYYY, fiscal Q4 → Q1 of YYYY+1;
+    timestamp headers use the calendar quarter of the date.
+    Returns DataFrame (header, layout, year, q); layout is None for non-quarter columns.
+    """
+    h = pd.Series(list(headers), dtype='string')
+    fiscal = h.str.extract(FISCAL_HEADER.pattern).apply(pd.to_numeric)
+    dates = pd.to_datetime(h.where(h.str.match(DATE_HEADER.pattern).fillna(False)), errors='coerce')
+
+    is_fiscal = fiscal[1].notna().to_numpy()
+    is_date = dates.notna().to_numpy()
+    fiscal_q = fiscal[1].to_numpy(dtype=np.float64)
+    year = np.where(is_fiscal, fiscal[0].to_numpy(dtype=np.float64) + (fiscal_q == 4),
+                    dates.dt.year.to_numpy(dtype=np.float64))
+    q = np.where(is_fiscal, np.where(fiscal_q == 4, 1, fiscal_q + 1),
+                 ((dates.dt.month - 1) // 3 + 1).to_numpy(dtype=np.float64))
+    return pd.DataFrame({
+        'header': h.to_numpy(),
+        'layout': np.where(is_fiscal, 'fiscal', np.where(is_date, 'date', None)),
+        'year': year,
+        'q': q,
+    })
+
+
+def _metric_of(label):
+    """Map a sub-header label to a metric name."""
+    label = ' '.join(str(label).lower().split())
+    for key, metric in [('office', 'offices'), ('account', 'accounts'),
+                        ('deposit', 'deposits'), ('credit', 'credit')]:
+        if key in label:
+            return metric
+    return None
+
+
+def quarter_columns(df):
+    """
+    Locate every quarter triplet in a parsed workbook.
+    Returns DataFrame with one row per value column: position, metric, year, q, quarter.
+    """
+    headers = calendar_quarters(df.columns)
+    is_start = headers['layout'].notna().to_numpy()
+    subheader = df.attrs.get('subheader', {})
+
+    # Every column from one quarter header up to the next belongs to that quarter
+    position = np.arange(len(df.columns))
+    block = np.cumsum(is_start) - 1
+    in_block = block >= 0
+    starts = np.flatnonzero(is_start)
+    position, block = position[in_block], block[in_block]
+    offset = position - starts[block]
+    start_info = headers.iloc[starts].reset_index(drop=True)
+
+    labels = pd.Series([subheader.get(df.columns[p]) for p in position], dtype=object)
+    layout_metric = [
+        TRIPLET_LAYOUTS[lay][o] if o < len(TRIPLET_LAYOUTS[lay]) else None
+        for lay, o in zip(start_info['layout'].to_numpy()[block], offset)
+    ]
+    metric = np.where(labels.notna(), labels.map(_metric_of, na_action='ignore'), layout_metric)
+    rows = zip(position, metric, start_info['year'].to_numpy()[block], start_info['q'].to_numpy()[block])
+    cols = pd.DataFrame(rows, columns=['position', 'metric', 'year', 'q']).dropna(subset=['metric'])
+    cols[['year', 'q']] = cols[['year', 'q']].astype(int)
+    cols['quarter'] = cols['year'].astype(str) + 'Q' + cols['q'].astype(str)
+    return cols.reset_index(drop=True)
+
+
+def population_group_position(df):
+    """Position of the POPULATION GROUP column, or None for workbooks without one."""
+    for pos, col in enumerate(df.columns):
+        if ' '.join(col.upper().split()) == 'POPULATION GROUP':
+            return pos
+    return None
+
+
+def melt_workbook(df, metrics=('deposits',), state_pos=2, district_pos=3):
+    """
+    Reshape all quarter columns of a parsed workbook to long form in one step.
+    Returns DataFrame: state_rbi, district_rbi, population_group, quarter, year, q,
+    <metrics...>; population_group is missing for workbooks without the split.
+    Rows without a district name or without any requested metric are dropped.
+    """
+    cols = quarter_columns(df)
+    cols = cols[cols['metric'].isin(metrics)]
+    keep = df.iloc[:, district_pos].notna().to_numpy()
+    group_pos = population_group_position(df)
+    id_pos = [state_pos, district_pos] + ([group_pos] if group_pos is not None else [])
+    ids = df.iloc[keep, id_pos].to_numpy()
+
+    # One (row × quarter) value matrix per metric, aligned on the quarter order
+    quarters = cols[['year', 'q', 'quarter']].drop_duplicates().sort_values(['year', 'q']).reset_index(drop=True)
+    quarter_pos = pd.MultiIndex.from_frame(quarters[['year', 'q']])
+    values = {}
+    for metric in metrics:
+        m = cols[cols['metric'] == metric]
+        block = np.full((keep.sum(), len(quarters)), np.nan)
+        target = quarter_pos.get_indexer(pd.MultiIndex.from_frame(m[['year', 'q']]))
+        block[:, target] = df.iloc[keep, m['position'].to_numpy()].to_numpy(dtype=np.float64)
+        values[metric] = block.ravel()
+
+    # Only cells holding at least one metric are materialised
+    has_value = np.zeros(keep.sum() * len(quarters), dtype=bool)
+    for metric in metrics:
+        has_value |= ~np.isnan(values[metric])
+    cell = np.flatnonzero(has_value)
+    row, qpos = np.divmod(cell, len(quarters))
+    return pd.DataFrame({
+        'state_rbi': ids[row, 0],
+        'district_rbi': ids[row, 1],
+        'population_group': ids[row, 2] if group_pos is not None else None,
+        'quarter': quarters['quarter'].to_numpy()[qpos],
+        'year': quarters['year'].to_numpy()[qpos],
+        'q': quarters['q'].to_numpy()[qpos],
+        **{metric: v[cell] for metric, v in values.items()},
+    })
+
+
+def rollup_population_groups(panel, metrics=('deposits', 'offices', 'accounts')):
+    """Sum a district × population-group × quarter panel to district × quarter."""
+    keys = [c for c in ['district_gadm', 'state_gadm', 'quarter', 'year', 'q', 'quarter_num'] if c in panel.columns]
+    metrics = [m for m in metrics if m in panel.columns]
+    return panel.groupby(keys, observed=True, sort=False, as_index=False)[metrics].sum(min_count=1)
+
+
+def urban_share(panel, metric='deposits'):
+    """
+    Share of a metric held in urban + metropolitan population groups,
+    per district-quarter (DataFrame with district keys, quarter, urban_share).
+    """
+    urban = panel['population_group'].isin(URBAN_GROUPS)
+    total = rollup_population_groups(panel, metrics=(metric,))
+    in_urban = rollup_population_groups(panel[urban], metrics=(metric,))
+    keys = [c for c in total.columns if c != metric]
+    out = total.merge(in_urban, on=keys, how='left', suffixes=('', '_urban'))
+    out['urban_share'] = out[f'{metric}_urban'].fillna(0) / out[metric].where(out[metric] > 0)
+    return out[keys + ['urban_share']]
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3:
+        # Worker mode: python rbi_io.py <workbook> <parquet>
+        _write_cache(sys.argv[1], sys.argv[2])
+    else:
+        for path, out in build_cache([p for p in RBI_PATHS if os.path.exists(p)]).items():
+            print(f"  ✓ {os.path.basename(path)} → {out}")
@@ -0,0 +1,421 @@
+"""
+run_pipeline.py - Dependency-aware runner for the numbered pipeline scripts
+
+Each stage below declares the files it reads and writes (raw files, 00_Admin
+tables, and data_store datasets by name). A stage depends on the last earlier
+stage that writes one of its inputs, and on any earlier stage that reads or
+writes a file it overwrites (Scripts 31-32 update flood_exposure_panel in
+place), which gives the dependency graph:
+
+    06 → 08 → 10 → 31 → 32 → 14 → 17 → 23 → 24 → 25, 27-29
+          └→ 13 ──────────────┘     └→ 30       21 → 22 → 23
+
+Stages are skipped when nothing they depend on has changed: a stage's key is
+the SHA-256 of its script (plus the local helper modules it imports) and of
+each input. Raw and 00_Admin inputs are hashed from disk; an input written by
+an upstream stage is identified by the digest recorded when that stage last
+wrote it, so a stage that reruns but reproduces the same output does not
+trigger its dependents. Keys and digests are kept in
+
+    02_Data_Intermediate/cache/pipeline_state.json
+
+Ready stages run concurrently (13, 10 and 22 need nothing from each other), so
+a full refresh takes about as long as the critical path. A stage whose raw
+inputs are not on this machine (GADM shapefile, the external VIIRS tiles) is
+not run; its existing outputs are used as they are.
+
+Each stage's stdout/stderr goes to 05_Outputs/Logs/pipeline/<stage>.log.
+
+Usage:
+    python 04_Code/run_pipeline.py                  # run every out-of-date stage
+    python 04_Code/run_pipeline.py 24 28            # these stages and their upstream
+    python 04_Code/run_pipeline.py --dry-run        # print the plan, run nothing
+    python 04_Code/run_pipeline.py --force 13       # rerun 13 (and what changes downstream)
+    python 04_Code/run_pipeline.py -j 2             # at most 2 scripts at once
+"""
+
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(CODE_DIR)
+os.chdir(ROOT_DIR)  # scripts and paths below are relative to the repo root
+
+from data_store import DATASETS, dataset_path
+from rbi_io import RBI_PATHS, file_hash
+from crosswalk_store import STORE_PATH, OVERRIDES_PATH
+from district_matching import ALIASES_PATH
+from district_lineage import LINEAGE_PATH
+from panel_keys import REGISTRY_PATH
+from analytics_db import DB_PATH
+
+STATE_PATH = '02_Data_Intermediate/cache/pipeline_state.json'
+LOG_DIR = '05_Outputs/Logs/pipeline'
+
+GADM = '01_Data_Raw/District_Boundaries/gadm41_IND_2.shp'
+GADM_ATTRIBUTES = '01_Data_Raw/District_Boundaries/gadm41_IND_2.dbf'  # Script 08 reads names only
+EMDAT = '01_Data_Raw/EMDAT_Disasters/public_emdat_custom_request_2026-01-02_c149ea93-8fbf-4f6e-a8f6-3b41cc622ed0.xlsx'
+VIIRS_TILES = 'F:/Jaseel/VIIRS_Raw_Data_75N060E'
+EMDAT_PARSED = '02_Data_Intermediate/emdat_districts_parsed.csv'
+CROSSWALK = '02_Data_Intermediate/district_crosswalk_draft.csv'
+EMDAT_MATCHES = '02_Data_Intermediate/emdat_district_matches.csv'
+
+# Stage id → script, inputs, outputs (in the order the scripts are run by hand).
+# Inputs/outputs are file paths or data_store dataset names. The district
+# registry is written together with the skeleton by Script 09, and
+# load_registry() falls back to the skeleton, so readers list the skeleton.
+# Scripts 15-16 both open the DuckDB file read-write (one process at a time),
+# so both list it as an output, which orders them.
+STAGES = {
+    '06': {'script': '06_parse_emdat_locations.py',
+           'inputs': [EMDAT],
+           'outputs': [EMDAT_PARSED, '05_Outputs/Logs/06_parse_emdat_log.txt']},
+    '08': {'script': '08_build_district_crosswalk.py',
+           'inputs': [*RBI_PATHS, GADM_ATTRIBUTES, EMDAT_PARSED, OVERRIDES_PATH, ALIASES_PATH],
+           'outputs': [CROSSWALK, EMDAT_MATCHES, STORE_PATH]},
+    '09': {'script': '09_build_quarterly_skeleton.py',
+           'inputs': [GADM],
+           'outputs': ['district_quarter_skeleton', REGISTRY_PATH]},
+    '10': {'script': '10_build_flood_exposure.py',
+           'inputs': [GADM, EMDAT_PARSED, CROSSWALK, EMDAT_MATCHES, 'district_quarter_skeleton'],
+           'outputs': ['flood_exposure_panel']},
+    '31': {'script': '31_build_spatial_exposure.py',
+           'inputs': [GADM, 'flood_exposure_panel'],
+           'outputs': ['flood_exposure_panel', '02_Data_Intermediate/spatial_weights/district_index.csv']},
+    '32': {'script': '32_build_distance_decay_exposure.py',
+           'inputs': [GADM, EMDAT, 'flood_exposure_panel'],
+           'outputs': ['flood_exposure_panel']},
+    '11': {'script': '11_validate_flood_events.py',
+           'inputs': ['flood_exposure_panel', EMDAT_PARSED],
+           'outputs': []},
+    '12': {'script': '12_summarize_flood_exposure.py',
+           'inputs': ['flood_exposure_panel'],
+           'outputs': ['05_Outputs/Logs/12_flood_exposure_summary.txt']},
+    '13': {'script': '13_extract_rbi_deposits.py',
+           'inputs': [*RBI_PATHS, CROSSWALK, LINEAGE_PATH],
+           'outputs': ['rbi_deposits_panel', 'rbi_metrics_panel', 'rbi_popgroup_panel']},
+    '14': {'script': '14_merge_master_panel.py',
+           'inputs': ['district_quarter_skeleton', 'flood_exposure_panel', 'rbi_deposits_panel'],
+           'outputs': ['master_panel_raw']},
+    '15': {'script': '15_validate_master_panel.py',
+           'inputs': ['master_panel_raw'],
+           'outputs': ['02_Data_Intermediate/master_panel_validation_log.txt', DB_PATH]},
+    '16': {'script': '16_diagnose_missing_data.py',
+           'inputs': ['master_panel_raw'],
+           'outputs': [DB_PATH]},
+    '17': {'script': '17_prepare_analysis_sample.py',
+           'inputs': ['master_panel_raw'],
+           'outputs': ['master_panel_analysis']},
+    '21': {'script': '21_extract_viirs_full_panel.py',
+           'inputs': [GADM, VIIRS_TILES],
+           'outputs': ['viirs_monthly_panel']},
+    '22': {'script': '22_aggregate_viirs_quarterly.py',
+           'inputs': ['viirs_monthly_panel', 'district_quarter_skeleton'],
+           'outputs': ['viirs_quarterly_panel']},
+    '23': {'script': '23_merge_viirs_master.py',
+           'inputs': ['master_panel_analysis', 'viirs_quarterly_panel', 'district_quarter_skeleton'],
+           'outputs': ['analysis_panel_final']},
+    '24': {'script': '24_engineer_regression_variables.py',
+           'inputs': ['analysis_panel_final', 'district_quarter_skeleton'],
+           'outputs': ['regression_panel_final']},
+    '25': {'script': '25_descriptive_statistics.py',
+           'inputs': ['regression_panel_final'],
+           'outputs': ['05_Outputs/Tables/01_descriptive_stats.csv']},
+    '26': {'script': '26_validate_viirs_monthly.py',
+           'inputs': ['viirs_monthly_panel'],
+           'outputs': ['05_Outputs/Logs/26_viirs_monthly_validation.txt']},
+    '27': {'script': '27_regression_H1_first_stage.py',
+           'inputs': ['regression_panel_final', 'district_quarter_skeleton'],
+           'outputs': ['05_Outputs/Tables/02_H1_first_stage.csv']},
+    '28': {'script': '28_regression_H2_iv2sls.py',
+           'inputs': ['regression_panel_final', 'district_quarter_skeleton'],
+           'outputs': ['05_Outputs/Tables/03_H2_iv2sls.csv', '05_Outputs/Tables/03_H2_weak_iv_grid.csv']},
+    '29': {'script': '29_regression_H3_timing.py',
+           'inputs': ['regression_panel_final', 'district_quarter_skeleton'],
+           'outputs': ['05_Outputs/Tables/04_H3_timing.csv']},
+    '30': {'script': '30_regression_H4_heterogeneity.py',
+           'inputs': ['master_panel_analysis', 'rbi_popgroup_panel', 'district_quarter_skeleton'],
+           'outputs': ['05_Outputs/Tables/05_H4_heterogeneity.csv']},
+    '33': {'script': '33_event_study_floods.py',
+           'inputs': ['regression_panel_final', 'flood_exposure_panel', 'district_quarter_skeleton'],
+           'outputs': ['05_Outputs/Tables/07_event_study.csv']},
+    '34': {'script': '34_local_projections.py',
+           'inputs': ['regression_panel_final', 'district_quarter_skeleton'],
+           'outputs': ['05_Outputs/Tables/08_local_projections.csv']},
+    'ri': {'script': 'randomization_inference.py',
+           'inputs': ['regression_panel_final', 'district_quarter_skeleton'],
+           'outputs': ['05_Outputs/Tables/04_H3_permutation.csv']},
+    'grid': {'script': 'spec_grid.py',
+             'inputs': ['master_panel_raw', 'district_quarter_skeleton'],
+             'outputs': ['05_Outputs/Tables/06_robustness_spec_grid.csv']},
+}
+
+
+# === Graph ===
+
+def build_graph(stages=STAGES):
+    """
+    Stage → set of upstream stages. Read-after-write: the last earlier writer of
+    each input. Write-after-read / write-after-write: every earlier stage that
+    touches a file this stage writes.
+    """
+    order = list(stages)
+    deps = {}
+    for i, sid in enumerate(order):
+        deps[sid] = set()
+        for item in stages[sid]['inputs']:
+            writer = producer(item, sid, stages)
+            if writer is not None:
+                deps[sid].add(writer)
+        for other in order[:i]:
+            spec = stages[other]
+            if set(stages[sid]['outputs']) & (set(spec['inputs']) | set(spec['outputs'])):
+                deps[sid].add(other)
+    return deps
+
+
+def producer(item, sid, stages=STAGES):
+    """Last stage declared before `sid` that writes `item` (None for source files)."""
+    writer = None
+    for other in stages:
+        if other == sid:
+            return writer
+        if item in stages[other]['outputs']:
+            writer = other
+    return writer
+
+
+def upstream(targets, deps):
+    """Targets plus everything they depend on, in declaration order."""
+    keep, stack = set(), list(targets)
+    while stack:
+        sid = stack.pop()
+        if sid not in keep:
+            keep.add(sid)
+            stack.extend(deps[sid])
+    return [sid for sid in deps if sid in keep]
+
+
+def critical_path(stages, deps, durations):
+    """Longest chain by recorded run time: (stage list, seconds)."""
+    best = {}
+    for sid in stages:  # declaration order is a topological order
+        prev = max((best[d] for d in deps[sid] if d in best), key=lambda b: b[1], default=([], 0.0))
+        best[sid] = (prev[0] + [sid], prev[1] + durations.get(sid, 0.0))
+    return max(best.values(), key=lambda b: b[1], default=([], 0.0))
+
+
+# === Hashing ===
+
+def item_path(item):
+    """File backing an input/output: a dataset's Parquet file (CSV copy if absent) or the path."""
+    if item in DATASETS:
+        path = dataset_path(item, 'parquet')
+        return path if os.path.exists(path) else dataset_path(item, 'csv')
+    return item
+
+
+def content_hash(path, memo):
+    """SHA-256 of a file (memoised on size + mtime), or of a directory listing."""
+    if os.path.isdir(path):
+        listing = sorted((os.path.relpath(os.path.join(d, f), path), os.path.getsize(os.path.join(d, f)))
+                         for d, _, files in os.walk(path) for f in files)
+        return hashlib.sha256(json.dumps(listing).encode()).hexdigest()
+    st = os.stat(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    if path in memo and memo[path][:2] == stamp:
+        return memo[path][2]
+    digest = file_hash(path)
+    memo[path] = stamp + [digest]
+    return digest
+
+
+def code_files(script):
+    """The script plus the 04_Code helper modules it imports (transitively)."""
+    files, stack = [], [os.path.join(CODE_DIR, script)]
+    while stack:
+        path = stack.pop()
+        if path in files:
+            continue
+        files.append(path)
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                words = line.split()
+                if len(words) >= 2 and words[0] in ('import', 'from'):
+                    module = os.path.join(CODE_DIR, words[1].split('.')[0].rstrip(',') + '.py')
+                    if os.path.exists(module):
+                        stack.append(module)
+    return sorted(files)
+
+
+def stage_key(sid, input_digests, memo, stages=STAGES):
+    digest = hashlib.sha256()
+    for path in code_files(stages[sid]['script']):
+        digest.update(f"code {os.path.basename(path)} {content_hash(path, memo)}\n".encode())
+    for item in stages[sid]['inputs']:
+        digest.update(f"input {item} {input_digests[item]}\n".encode())
+    return digest.hexdigest()
+
+
+# === State ===
+
+def load_state(path=STATE_PATH):
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    return {'stages': {}, 'files': {}}
+
+
+def save_state(state, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# === Running ===
+
+def run_script(sid, stages=STAGES):
+    """Run one stage's script from the repo root; returns (returncode, seconds, log path)."""
+    os.makedirs(LOG_DIR, exist_ok=True)
+    script = stages[sid]['script']
+    log_path = os.path.join(LOG_DIR, script.replace('.py', '.log'))
+    env = dict(os.environ, PYTHONIOENCODING='utf-8', MPLBACKEND='Agg')
+    start = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        proc = subprocess.run([sys.executable, os.path.join('04_Code', script)],
+                              stdout=log, stderr=subprocess.STDOUT, env=env)
+    return proc.returncode, time.perf_counter() - start, log_path
+
+
+def plan_stage(sid, status, state, memo, force, stages=STAGES):
+    """
+    Decide what to do with a stage whose upstream has finished:
+    ('blocked' | 'unavailable' | 'missing' | 'skip' | 'run', key or absent inputs, input digests).
+    """
+    spec = stages[sid]
+    writers = {producer(item, sid, stages) for item in spec['inputs']}
+    if any(status.get(w) in ('failed', 'blocked') for w in writers):
+        return 'blocked', None, None
+
+    digests, absent, changing = {}, [], False
+    for item in spec['inputs']:
+        writer = producer(item, sid, stages)
+        recorded = state['stages'].get(writer, {}).get('outputs', {}).get(item)
+        if status.get(writer) == 'would run':
+            changing = True  # dry run: this input is about to be rewritten
+        elif writer is not None and status.get(writer) in ('ran', 'skip') and recorded:
+            digests[item] = recorded
+        elif os.path.exists(item_path(item)):
+            digests[item] = content_hash(item_path(item), memo)
+        else:
+            absent.append(item)
+
+    outputs_exist = all(os.path.exists(item_path(o)) for o in spec['outputs'])
+    if absent:
+        # Not runnable here: fine as long as the outputs later stages read are present
+        consumed = [o for o in spec['outputs'] if any(o in other['inputs'] for other in stages.values())]
+        usable = all(os.path.exists(item_path(o)) for o in consumed)
+        return ('unavailable' if usable else 'missing'), absent, None
+    if changing:
+        return 'run', None, None
+    key = stage_key(sid, digests, memo, stages)
+    if not force and outputs_exist and state['stages'].get(sid, {}).get('key') == key:
+        return 'skip', key, digests
+    return 'run', key, digests
+
+
+def run_pipeline(targets=None, jobs=None, force=(), dry_run=False, stages=STAGES):
+    deps = build_graph(stages)
+    unknown = [t for t in targets or [] if t not in stages]
+    if unknown:
+        raise KeyError(f"Unknown stage(s) {unknown} (known: {list(stages)})")
+    plan = upstream(targets, deps) if targets else list(stages)
+    force = set(plan) if force is True else set(force)
+
+    state = load_state()
+    memo = state.setdefault('files', {})
+    status, durations = {}, {}
+    pending, running = list(plan), {}
+    start = time.perf_counter()
+
+    print("="*70)
+    print(f"PIPELINE RUN: {len(plan)} stages" + (" (dry run)" if dry_run else ""))
+    print("="*70)
+
+    with ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as pool:
+        while pending or running:
+            for sid in [s for s in pending if deps[s] <= set(status)]:
+                pending.remove(sid)
+                action, key, digests = plan_stage(sid, status, state, memo, sid in force, stages)
+                if action == 'run' and dry_run:
+                    status[sid] = 'would run'
+                    print(f"  → {sid} {stages[sid]['script']}: would run")
+                elif action == 'run':
+                    print(f"  → {sid} {stages[sid]['script']}: running")
+                    running[pool.submit(run_script, sid, stages)] = (sid, key)
+                else:
+                    status[sid] = action
+                    label = {'skip': 'up to date', 'blocked': 'blocked (upstream failed)',
+                             'unavailable': f"inputs not on this machine {key}, using existing outputs",
+                             'missing': f"missing inputs {key}"}[action]
+                    print(f"  {'✓' if action in ('skip', 'unavailable') else '⚠'} {sid} "
+                          f"{stages[sid]['script']}: {label}")
+            if not running:
+                if pending and not any(deps[s] <= set(status) for s in pending):
+                    raise RuntimeError(f"Dependency cycle among stages {pending}")
+                continue
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                sid, key = running.pop(future)
+                returncode, seconds, log_path = future.result()
+                durations[sid] = seconds
+                if returncode == 0:
+                    status[sid] = 'ran'
+                    state['stages'][sid] = {
+                        'key': key,
+                        'seconds': round(seconds, 2),
+                        'outputs': {o: content_hash(item_path(o), memo)
+                                    for o in stages[sid]['outputs'] if os.path.exists(item_path(o))},
+                    }
+                    print(f"  ✓ {sid} {stages[sid]['script']}: done in {seconds:.1f}s")
+                else:
+                    status[sid] = 'failed'
+                    print(f"  ⚠ {sid} {stages[sid]['script']}: FAILED (exit {returncode}), see {log_path}")
+                save_state(state)
+
+    elapsed = time.perf_counter() - start
+    counts = {s: list(status.values()).count(s) for s in ('ran', 'would run', 'skip', 'unavailable', 'failed', 'blocked', 'missing')}
+    recorded = {sid: state['stages'].get(sid, {}).get('seconds', 0.0) for sid in plan}
+    path, path_seconds = critical_path(plan, deps, {**recorded, **durations})
+
+    print("\n" + "="*70)
+    print("PIPELINE SUMMARY")
+    print("="*70)
+    print("  " + ", ".join(f"{n} {s}" for s, n in counts.items() if n))
+    if not dry_run:
+        print(f"  Wall time: {elapsed:.1f}s (sum of stages run: {sum(durations.values()):.1f}s)")
+    print(f"  Critical path: {' → '.join(path)} ({path_seconds:.1f}s at last recorded run times)")
+    return status
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the pipeline stages that are out of date.")
+    parser.add_argument('stages', nargs='*', help="target stages (default: all), e.g. 24 28")
+    parser.add_argument('-j', '--jobs', type=int, default=None, help="max concurrent scripts")
+    parser.add_argument('--force', nargs='*', default=None,
+                        help="rerun these stages even if unchanged (no ids: every planned stage)")
+    parser.add_argument('--dry-run', action='store_true', help="print the plan without running")
+    args = parser.parse_args()
+
+    force = () if args.force is None else (args.force or True)
+    status = run_pipeline(args.stages, jobs=args.jobs, force=force, dry_run=args.dry_run)
+    sys.exit(1 if any(s in ('failed', 'blocked', 'missing') for s in status.values()) else 0)
@@ -0,0 +1,252 @@
+"""
+spatial_weights.py - Sparse spatial weights for district spillover exposure
+
+Builds district × district weight matrices from the dissolved GADM L2
+geometry and applies them to district × quarter exposure matrices.
+
+Row/column order of every matrix follows the index frame returned by
+load_district_geometries() (sorted by state_gadm, district_gadm), which uses
+the same (district_gadm, state_gadm) keys as the quarterly skeleton.
+
+Variants:
+  - queen:    districts sharing any boundary point
+  - rook:     districts sharing a boundary segment (not just a corner)
+  - knn:      k nearest district centroids (great-circle distance)
+  - distance: all district centroids within a distance band (km)
+
+Distance-decay exposure (continuous) uses a KD-tree radius query over
+centroids/event points, so memory scales with the number of pairs inside the
+kernel support rather than with n_units × n_sources.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from scipy import sparse
+from scipy.spatial import cKDTree
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Equal-area-ish projected CRS for India (WGS 84 / India NSF LCC), used for centroids
+INDIA_PROJECTED_CRS = 'EPSG:7755'
+
+WEIGHT_KINDS = ['queen', 'rook', 'knn', 'distance']
+KERNELS = ['gaussian', 'bisquare', 'cutoff']
+
+# Gaussian kernel is truncated at this many bandwidths (weight < 0.012 beyond)
+GAUSSIAN_TRUNCATE = 3.0
+
+
+def load_district_geometries(gadm_path='01_Data_Raw/District_Boundaries/gadm41_IND_2.shp'):
+    """
+    Load GADM L2 and dissolve multipolygon rows to one geometry per district-state.
+    Returns GeoDataFrame with district_gadm, state_gadm, geometry (positional index = W row).
+    """
+    gadm = gpd.read_file(gadm_path)
+    districts = gadm[['NAME_1', 'NAME_2', 'geometry']].dissolve(by=['NAME_1', 'NAME_2'], as_index=False)
+    districts = districts.rename(columns={'NAME_2': 'district_gadm', 'NAME_1': 'state_gadm'})
+    districts = districts.sort_values(['state_gadm', 'district_gadm']).reset_index(drop=True)
+    return districts[['district_gadm', 'state_gadm', 'geometry']]
+
+
+def district_centroids(districts):
+    """Return (lon, lat) arrays of district centroids computed in a projected CRS."""
+    centroids = districts.geometry.to_crs(INDIA_PROJECTED_CRS).centroid.to_crs('EPSG:4326')
+    return centroids.x.to_numpy(), centroids.y.to_numpy()
+
+
+def _pairs_to_matrix(rows, cols, n, values=None):
+    """
+    Binary (or valued) CSR matrix from directed index pairs, zero diagonal.
+    Symmetric only if every pair is passed in both directions (contiguity,
+    distance band); kNN passes one direction and stays asymmetric.
+    """
+    keep = rows != cols
+    rows, cols = rows[keep], cols[keep]
+    if values is None:
+        values = np.ones(len(rows), dtype=np.float64)
+    else:
+        values = values[keep]
+    W = sparse.coo_matrix((values, (rows, cols)), shape=(n, n)).tocsr()
+    W.sum_duplicates()
+    return W
+
+
+def contiguity_weights(districts, kind='queen'):
+    """
+    Queen or rook contiguity from polygon boundaries.
+    Candidate pairs come from the STRtree spatial index, so no all-pairs test is run.
+    """
+    geoms = districts.geometry.values
+    left, right = districts.sindex.query(geoms, predicate='intersects')
+    keep = left < right
+    left, right = left[keep], right[keep]
+
+    if kind == 'rook':
+        # Shared boundary must be at least a line segment, not a single point
+        shared = shapely.intersection(np.asarray(geoms)[left], np.asarray(geoms)[right])
+        keep = shapely.get_dimensions(shared) >= 1
+        left, right = left[keep], right[keep]
+    elif kind != 'queen':
+        raise ValueError(f"Unknown contiguity kind: {kind}")
+
+    n = len(districts)
+    return _pairs_to_matrix(np.concatenate([left, right]), np.concatenate([right, left]), n)
+
+
+def lonlat_to_unit_xyz(lon, lat):
+    """Map lon/lat (degrees) to 3D points on the unit sphere."""
+    lon_r = np.radians(np.asarray(lon, dtype=np.float64))
+    lat_r = np.radians(np.asarray(lat, dtype=np.float64))
+    cos_lat = np.cos(lat_r)
+    return np.column_stack([cos_lat * np.cos(lon_r), cos_lat * np.sin(lon_r), np.sin(lat_r)])
+
+
+def km_to_chord(distance_km):
+    """Great-circle distance (km) to straight-line chord length on the unit sphere."""
+    return 2.0 * np.sin(np.asarray(distance_km, dtype=np.float64) / (2.0 * EARTH_RADIUS_KM))
+
+
+def chord_to_km(chord):
+    """Chord length on the unit sphere back to great-circle (haversine) distance in km."""
+    return 2.0 * EARTH_RADIUS_KM * np.arcsin(np.clip(np.asarray(chord) / 2.0, 0.0, 1.0))
+
+
+def knn_weights(lon, lat, k=5):
+    """k-nearest-neighbour weights on district centroids (asymmetric, binary)."""
+    xyz = lonlat_to_unit_xyz(lon, lat)
+    n = len(xyz)
+    k = min(k, n - 1)
+    _, idx = cKDTree(xyz).query(xyz, k=k + 1)
+    rows = np.repeat(np.arange(n), k + 1)
+    return _pairs_to_matrix(rows, idx.ravel(), n)
+
+
+def distance_band_weights(lon, lat, band_km=100.0):
+    """Binary weights for all centroid pairs within band_km great-circle distance."""
+    xyz = lonlat_to_unit_xyz(lon, lat)
+    pairs = cKDTree(xyz).query_pairs(km_to_chord(band_km), output_type='ndarray')
+    n = len(xyz)
+    return _pairs_to_matrix(np.concatenate([pairs[:, 0], pairs[:, 1]]),
+                            np.concatenate([pairs[:, 1], pairs[:, 0]]), n)
+
+
+def build_weights(districts, kind='queen', k=5, band_km=100.0):
+    """Dispatch to the requested weights variant."""
+    if kind in ('queen', 'rook'):
+        return contiguity_weights(districts, kind=kind)
+    lon, lat = district_centroids(districts)
+    if kind == 'knn':
+        return knn_weights(lon, lat, k=k)
+    if kind == 'distance':
+        return distance_band_weights(lon, lat, band_km=band_km)
+    raise ValueError(f"Unknown weights kind: {kind} (expected one of {WEIGHT_KINDS})")
+
+
+def row_standardize(W):
+    """Scale rows to sum to 1; islands (no neighbours) stay all-zero."""
+    row_sums = np.asarray(W.sum(axis=1)).ravel()
+    inv = np.divide(1.0, row_sums, out=np.zeros_like(row_sums), where=row_sums > 0)
+    return sparse.diags(inv) @ W
+
+
+def spatial_lag(W, exposure):
+    """Neighbour exposure for every period at once: (n × n sparse) @ (n × T dense)."""
+    return np.asarray(W @ exposure)
+
+
+def exposure_matrix(panel, index, value_col, time_col='quarter_num'):
+    """
+    Pivot a long district-time panel into an (n_districts × n_periods) array aligned to index.
+    Returns (matrix, row_pos, col_pos) so results can be written back to the long panel.
+    """
+    row_pos = panel[['district_gadm', 'state_gadm']].merge(
+        index[['district_gadm', 'state_gadm']].reset_index(),
+        on=['district_gadm', 'state_gadm'],
+        how='left'
+    )['index'].to_numpy()
+    periods, col_pos = np.unique(panel[time_col].to_numpy(), return_inverse=True)
+
+    has_row = ~pd.isna(row_pos)
+    row_pos = np.where(has_row, row_pos, -1).astype(np.int64)
+    matrix = np.zeros((len(index), len(periods)), dtype=np.float64)
+    values = panel[value_col].fillna(0).to_numpy(dtype=np.float64)
+    np.add.at(matrix, (row_pos[has_row], col_pos[has_row]), values[has_row])
+    return matrix, row_pos, col_pos
+
+
+def kernel_weights(distance_km, kernel='gaussian', bandwidth_km=50.0):
+    """Kernel weight for great-circle distances (km); zero outside the support."""
+    u = np.asarray(distance_km, dtype=np.float64) / bandwidth_km
+    if kernel == 'gaussian':
+        return np.where(u <= GAUSSIAN_TRUNCATE, np.exp(-0.5 * u ** 2), 0.0)
+    if kernel == 'bisquare':
+        return np.where(u < 1.0, (1.0 - u ** 2) ** 2, 0.0)
+    if kernel == 'cutoff':
+        return (u <= 1.0).astype(np.float64)
+    raise ValueError(f"Unknown kernel: {kernel} (expected one of {KERNELS})")
+
+
+def kernel_support_km(kernel, bandwidth_km):
+    """Radius beyond which the kernel is exactly zero."""
+    return bandwidth_km * (GAUSSIAN_TRUNCATE if kernel == 'gaussian' else 1.0)
+
+
+def distance_decay_matrix(target_lon, target_lat, source_lon, source_lat,
+                          kernel='gaussian', bandwidth_km=50.0, exclude_self=False):
+    """
+    Sparse (n_targets × n_sources) kernel matrix from a KD-tree radius query.
+
+    Points are embedded on the unit sphere so Euclidean chord distance is a
+    monotone transform of haversine distance; only pairs within the kernel
+    support are ever materialised. exclude_self drops zero-distance pairs
+    (use when targets and sources are the same districts).
+    """
+    target_xyz = lonlat_to_unit_xyz(target_lon, target_lat)
+    source_xyz = lonlat_to_unit_xyz(source_lon, source_lat)
+    radius = km_to_chord(kernel_support_km(kernel, bandwidth_km))
+
+    pairs = cKDTree(target_xyz).sparse_distance_matrix(
+        cKDTree(source_xyz), radius, output_type='ndarray'
+    )
+    rows, cols = pairs['i'], pairs['j']
+    distance_km = chord_to_km(pairs['v'])
+    values = kernel_weights(distance_km, kernel, bandwidth_km)
+
+    keep = values > 0
+    if exclude_self:
+        keep &= distance_km > 0
+    K = sparse.coo_matrix(
+        (values[keep], (rows[keep], cols[keep])),
+        shape=(len(target_xyz), len(source_xyz))
+    ).tocsr()
+    K.sum_duplicates()
+    return K
+
+
+def event_period_matrix(event_period_pos, n_periods, weights=None):
+    """Sparse (n_events × n_periods) indicator of the period each event falls in."""
+    event_period_pos = np.asarray(event_period_pos)
+    n_events = len(event_period_pos)
+    if weights is None:
+        weights = np.ones(n_events, dtype=np.float64)
+    return sparse.csr_matrix(
+        (weights, (np.arange(n_events), event_period_pos)),
+        shape=(n_events, n_periods)
+    )
+
+
+def save_weights(W, index, out_dir, kind):
+    """Persist W as .npz plus the shared district index CSV."""
+    os.makedirs(out_dir, exist_ok=True)
+    sparse.save_npz(os.path.join(out_dir, f'W_{kind}.npz'), W.tocsr())
+    index[['district_gadm', 'state_gadm']].to_csv(os.path.join(out_dir, 'district_index.csv'), index=False)
+
+
+def load_weights(out_dir, kind):
+    """Load a precomputed W and its district index."""
+    W = sparse.load_npz(os.path.join(out_dir, f'W_{kind}.npz')).tocsr()
+    index = pd.read_csv(os.path.join(out_dir, 'district_index.csv'))
+    return W, index
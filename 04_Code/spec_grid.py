@@ -0,0 +1,272 @@
+"""
+spec_grid.py - Declarative robustness grids: many FE regressions, one tidy table
+
+A grid is a dict of dimensions; every combination is one specification of
+
+    outcome_it = Σ_{l=0..lags} β_l flood_rule_{i,t-l} + district FE + quarter FE + e_it
+
+    rule      'A', 'B'                  flood_exposure_rule{A,B}_qt
+    lags      0, 1, 2, ...              distributed lags t..t-L (calendar quarters)
+    sample    Script 17's options:      'drop_gap'           2016Q3-2017Q1 removed
+                                        'drop_zero_coverage' 35 districts without deposits removed
+                                        'both'               both (master_panel_analysis)
+    outcome   'log_change'              Δ log(deposits + 1) (Script 24)
+              'pct_change'              deposits_t / deposits_t-1 - 1 (Script 30)
+    vcov      panel_vcov kinds          iid, HC1, cluster, twoway, DK
+
+Outcomes and lags are built per sample on a PanelArray, so they never bridge
+rows the sample drops. Specifications that share (sample, outcome, lags) share
+one estimation sample, common to both rules, and its columns (outcome and every
+lag of both rules) are demeaned once. Each such block is put in shared memory
+and handed to a process pool; a worker attaches to it, fits every rule on the
+block and re-derives every vcov kind from the stored scores (no refit per SE
+type). For lags > 0 the sum of the lag coefficients is reported as 'cumulative'.
+
+Usage:
+    python 04_Code/spec_grid.py                # default GRID → 05_Outputs/Tables/06_robustness_spec_grid.csv
+    python 04_Code/spec_grid.py --workers 1    # no process pool
+
+    from spec_grid import build_samples, run_grid
+    results = run_grid(build_samples(raw), {'rule': ['A'], 'lags': [0, 2], 'sample': ['both'],
+                                            'outcome': ['log_change'], 'vcov': ['cluster', 'DK']})
+"""
+
+import os
+import sys
+import time
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+from scipy.stats import t as t_dist
+
+from panel_keys import PANEL_KEYS, load_registry, attach_keys
+from panel_array import PanelArray
+from panel_vcov import VCOV_KINDS
+from fe_absorb import FixedEffects, fit_demeaned
+from data_store import read_dataset
+
+OUTPUT_PATH = '05_Outputs/Tables/06_robustness_spec_grid.csv'
+
+BLACKOUT_QUARTERS = ['2016Q3', '2016Q4', '2017Q1']
+SAMPLES = ['drop_gap', 'drop_zero_coverage', 'both']
+OUTCOMES = {'log_change': 'deposit_log_change_qt', 'pct_change': 'deposit_pct_change_qt'}
+
+GRID = {
+    'rule': ['A', 'B'],
+    'lags': [0, 1, 2, 4],
+    'sample': SAMPLES,
+    'outcome': list(OUTCOMES),
+    'vcov': VCOV_KINDS,
+}
+
+
+def flood_col(rule, lag):
+    return f'flood_exposure_rule{rule}_qt' if lag == 0 else f'flood_rule{rule}_lag{lag}_qt'
+
+
+def build_samples(raw, registry=None):
+    """Script 17's three sample options from master_panel_raw, keyed by name."""
+    raw = attach_keys(raw, registry if registry is not None else load_registry())
+    coverage = raw.groupby('district_id')['deposits'].count()
+    covered = raw['district_id'].isin(coverage.index[coverage > 0])
+    no_gap = ~raw['quarter'].astype(str).isin(BLACKOUT_QUARTERS)
+    masks = {'drop_gap': no_gap, 'drop_zero_coverage': covered, 'both': no_gap & covered}
+    return {name: raw[mask].reset_index(drop=True) for name, mask in masks.items()}
+
+
+def add_variables(df, max_lag, rules=('A', 'B')):
+    """Outcome definitions and flood lags on the sample's own district × quarter grid."""
+    df = df.sort_values(PANEL_KEYS).reset_index(drop=True)
+    panel = PanelArray.from_frame(df, ['deposits', *(flood_col(r, 0) for r in rules)])
+    df[OUTCOMES['log_change']] = panel.gather(panel.diff(np.log1p(panel['deposits'])))
+    pct = panel.pct_change('deposits')
+    df[OUTCOMES['pct_change']] = panel.gather(np.where(np.isfinite(pct), pct, np.nan))  # zero base → missing
+    for rule in rules:
+        for lag in range(1, max_lag + 1):
+            df[flood_col(rule, lag)] = panel.gather(panel.lag(flood_col(rule, 0), lag))
+    return df
+
+
+def expand_grid(grid):
+    """One dict per combination of the non-vcov dimensions."""
+    dims = [d for d in grid if d != 'vcov']
+    return [dict(zip(dims, values)) for values in itertools.product(*(grid[d] for d in dims))]
+
+
+# ----------------------------------------------------------------------------
+# Shared-memory blocks
+# ----------------------------------------------------------------------------
+
+def _to_shared(array):
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)[...] = array
+    return shm, {'name': shm.name, 'shape': array.shape, 'dtype': array.dtype.str}
+
+
+def _attach(ref):
+    shm = shared_memory.SharedMemory(name=ref['name'])
+    return shm, np.ndarray(ref['shape'], dtype=np.dtype(ref['dtype']), buffer=shm.buf)
+
+
+def fit_block(data, keys, columns, outcome_col, specs, vcov):
+    """
+    Fit every spec of one estimation sample. `data` is N × 2k: the demeaned
+    columns, then the same columns raw (for the collinearity check); `keys`
+    holds district_id and quarter_id.
+    """
+    position = {col: j for j, col in enumerate(columns)}
+    groups = {PANEL_KEYS[0]: keys[:, 0], PANEL_KEYS[1]: keys[:, 1]}
+    fe = FixedEffects([pd.factorize(keys[:, 0])[0], pd.factorize(keys[:, 1])[0]], names=PANEL_KEYS)
+    yd = data[:, position[outcome_col]]
+    rows = []
+    for spec in specs:
+        x = [flood_col(spec['rule'], lag) for lag in range(spec['lags'] + 1)]
+        cols = [position[c] for c in x]
+        result = fit_demeaned(yd, data[:, cols], x, fe, X_raw=data[:, [len(columns) + c for c in cols]],
+                              groups=groups)
+        for kind in vcov:
+            res = result.with_vcov(kind)
+            ci = res.conf_int()
+            terms = [(name, res.params[name], res.bse[name], res.pvalues[name],
+                      ci.loc[name, 'lower'], ci.loc[name, 'upper']) for name in res.names]
+            if len(res.names) > 1:
+                terms.append(('cumulative', *_linear_combination(res)))
+            for name, coef, se, p, lower, upper in terms:
+                rows.append({**spec, 'vcov': res.vcov, 'variable': name, 'coefficient': coef,
+                             'std_error': se, 't_statistic': coef / se, 'p_value': p,
+                             'ci_lower': lower, 'ci_upper': upper, 'df_t': res.df_t,
+                             'nobs': res.nobs, 'rsquared_within': res.rsquared_within,
+                             'omitted': ', '.join(res.omitted)})
+    return rows
+
+
+def _fit_shared(task):
+    """Pool worker: attach to a block's shared arrays and fit it."""
+    shm_data, data = _attach(task.pop('data'))
+    shm_keys, keys = _attach(task.pop('keys'))
+    try:
+        return fit_block(data, keys, **task)
+    finally:
+        shm_data.close()
+        shm_keys.close()
+
+
+def _linear_combination(res, alpha=0.05):
+    """Sum of all coefficients with its SE, p-value and CI under res's covariance."""
+    coef = float(res.params.sum())
+    se = float(np.sqrt(res.cov_params.to_numpy().sum()))
+    p = float(2 * t_dist.sf(abs(coef / se), res.df_t))
+    crit = t_dist.ppf(1 - alpha / 2, res.df_t)
+    return coef, se, p, coef - crit * se, coef + crit * se
+
+
+# ----------------------------------------------------------------------------
+# Runner
+# ----------------------------------------------------------------------------
+
+def prepare_blocks(samples, grid):
+    """
+    Demean each (sample, outcome, lags) estimation sample once. Returns the
+    block descriptions (arrays still in memory) in grid order.
+    """
+    specs = expand_grid(grid)
+    rules = sorted({s['rule'] for s in specs})
+    max_lag = max(s['lags'] for s in specs)
+    prepared = {name: add_variables(samples[name], max_lag, rules)
+                for name in dict.fromkeys(s['sample'] for s in specs)}
+
+    blocks = {}
+    for spec in specs:
+        key = (spec['sample'], spec['outcome'], spec['lags'])
+        if key not in blocks:
+            blocks[key] = {'specs': []}
+        blocks[key]['specs'].append(spec)
+
+    for (sample, outcome, lags), block in blocks.items():
+        df = prepared[sample]
+        columns = [OUTCOMES[outcome], *(flood_col(r, l) for r in rules for l in range(lags + 1))]
+        complete = df[[*columns, *PANEL_KEYS]].notna().all(axis=1).to_numpy()
+        fe = FixedEffects.from_frame(df, PANEL_KEYS, mask=complete)
+        raw = df.loc[fe.keep, columns].to_numpy(dtype=np.float64)
+        block.update(columns=columns, outcome_col=OUTCOMES[outcome],
+                     data=np.hstack([fe.demean(raw), raw]),
+                     keys=df.loc[fe.keep, PANEL_KEYS].to_numpy(dtype=np.int64))
+    return list(blocks.values())
+
+
+def run_grid(samples, grid=GRID, workers=None):
+    """
+    Fit every specification of `grid` on `samples` (build_samples output) and
+    return one tidy frame: one row per spec × vcov × coefficient.
+    """
+    grid = {**GRID, **grid}
+    blocks = prepare_blocks(samples, grid)
+    workers = min(os.cpu_count() or 1, len(blocks)) if workers is None else workers
+
+    if workers <= 1:
+        rows = [row for block in blocks
+                for row in fit_block(block['data'], block['keys'], block['columns'],
+                                     block['outcome_col'], block['specs'], grid['vcov'])]
+    else:
+        handles, tasks = [], []
+        try:
+            for block in blocks:
+                shm_data, data_ref = _to_shared(block['data'])
+                shm_keys, keys_ref = _to_shared(block['keys'])
+                handles += [shm_data, shm_keys]
+                tasks.append({'data': data_ref, 'keys': keys_ref, 'columns': block['columns'],
+                              'outcome_col': block['outcome_col'], 'specs': block['specs'],
+                              'vcov': grid['vcov']})
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                rows = [row for block_rows in pool.map(_fit_shared, tasks) for row in block_rows]
+        finally:
+            for shm in handles:
+                shm.close()
+                shm.unlink()
+
+    results = pd.DataFrame(rows)
+    spec_cols = [d for d in grid if d != 'vcov']
+    results.insert(0, 'spec_id', results.groupby(spec_cols, sort=False).ngroup() + 1)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the default robustness spec grid.")
+    parser.add_argument('--workers', type=int, default=None, help="processes (default: one per CPU)")
+    parser.add_argument('--output', default=OUTPUT_PATH)
+    args = parser.parse_args(argv)
+
+    print("=" * 70)
+    print("ROBUSTNESS SPEC GRID")
+    print("=" * 70)
+    n_specs = len(expand_grid(GRID))
+    print(f"  Grid: {' × '.join(f'{d} ({len(v)})' for d, v in GRID.items())}")
+    print(f"  {n_specs} specifications × {len(GRID['vcov'])} SE types")
+
+    start = time.perf_counter()
+    samples = build_samples(read_dataset('master_panel_raw'))
+    for name, frame in samples.items():
+        print(f"  ✓ Sample {name}: {len(frame):,} rows, {frame['district_id'].nunique()} districts")
+    results = run_grid(samples, GRID, workers=args.workers)
+    elapsed = time.perf_counter() - start
+
+    results.to_csv(args.output, index=False)
+    print(f"  ✓ {results['spec_id'].nunique()} specifications, {len(results):,} rows in {elapsed:.1f}s")
+
+    contemporaneous = results[(results['variable'].str.startswith('flood_exposure_'))
+                              & (results['vcov'].str.startswith('cluster'))]
+    print()
+    print("  Contemporaneous flood coefficient, district-clustered SE:")
+    print(contemporaneous.pivot_table(index=['sample', 'outcome', 'lags'], columns='rule',
+                                      values='coefficient').to_string(float_format=lambda v: f"{v:.4f}"))
+    print()
+    print(f"  Table: {args.output}")
+    print("=" * 70)
+
+
+if __name__ == '__main__':
+    sys.exit(main())